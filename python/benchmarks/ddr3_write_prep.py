@@ -0,0 +1,90 @@
+"""Benchmark the host-side preparation of a full DDR3 waveform write.
+
+Times the work done by DDR3.write_channels before the data is handed to
+WriteToBlockPipeIn, for a full DDR3.SAMPLE_SIZE write of all 8 channels:
+
+- legacy: the float64 np.zeros, astype(np.uint16), strided interleave and
+  bytearray copy that write_channels used to do
+- list: DDR3.stripe_channels with data_arrays replaced by a list of arrays,
+  striped into a reused uint16 buffer
+- buffer: DDR3.stripe_channels with the default ChannelBuffer, which is
+  already interleaved
+
+Usage:
+    python ddr3_write_prep.py [--repeats N] [--json results.json]
+
+Runs on the simulated backend, no FPGA is needed.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from pyripherals.core import FPGA, Endpoint  # noqa: E402
+from pyripherals.simulator import SimulatedBackend  # noqa: E402
+from pyripherals.peripherals.DDR3 import DDR3  # noqa: E402
+
+EP_DEFINES_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'examples', 'ep_defines.v')
+
+
+def legacy_prep(data_arrays):
+    """Return the bytes write_channels sent before the ChannelBuffer."""
+
+    data = np.zeros(int(len(data_arrays[0])*DDR3.NUM_CHANNELS))
+    data = data.astype(np.uint16)
+    for i in range(DDR3.NUM_CHANNELS):
+        if i % 2 == 0:
+            data[(7-i - 1)::8] = data_arrays[i]
+        else:
+            data[(7-i + 1)::8] = data_arrays[i]
+    return bytearray(data)
+
+
+def best_time(function, repeats):
+    """Return the best time of repeats calls to function, in seconds."""
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=3, help='runs of each method, the best is kept')
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    Endpoint.update_endpoints_from_defines(EP_DEFINES_PATH)
+    f = FPGA(bitfile=None, endpoints={}, backend=SimulatedBackend())
+    f.init_device()
+    ddr = DDR3(f, endpoints=Endpoint.get_chip_endpoints('DDR3'))
+    for chan in range(DDR3.NUM_CHANNELS):
+        ddr.data_arrays[chan] = np.arange(DDR3.SAMPLE_SIZE, dtype=np.uint16) + chan
+    channel_list = [np.array(chan) for chan in ddr.data_arrays]
+    assert legacy_prep(channel_list) == ddr.stripe_channels()
+
+    results = {'legacy': best_time(lambda: legacy_prep(channel_list), args.repeats),
+               'buffer': best_time(ddr.stripe_channels, args.repeats)}
+    ddr.data_arrays = channel_list
+    results['list'] = best_time(ddr.stripe_channels, args.repeats)
+
+    print(f'Full write of {DDR3.SAMPLE_SIZE * DDR3.NUM_CHANNELS * 2 / 1e6:.0f} MB')
+    for name, seconds in results.items():
+        print(f'{name:8s} {seconds * 1000:10.1f} ms')
+
+    if args.json is not None:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark the import time of pyripherals.core and each peripheral module.
+
+Each module is imported in a fresh interpreter started with
+``python -X importtime`` so nothing is already cached in sys.modules. The
+cumulative import time of the module is taken from the importtime report and
+the best of several runs is kept.
+
+Usage:
+    python import_time.py [--repeats N] [--json results.json] [module ...]
+
+Modules that cannot be imported in this environment (for example peripherals
+whose registers need a registers_path in config.yaml) are reported as failed.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+PERIPHERALS_DIR = os.path.join(SRC_DIR, 'pyripherals', 'peripherals')
+
+
+def default_modules():
+    """Return pyripherals.core followed by every peripheral module."""
+
+    peripherals = sorted(f[:-len('.py')] for f in os.listdir(PERIPHERALS_DIR)
+                         if f.endswith('.py') and f != '__init__.py')
+    return ['pyripherals.core'] + [f'pyripherals.peripherals.{p}' for p in peripherals]
+
+
+def import_time_us(module):
+    """Return the cumulative import time of module in microseconds, or None on failure."""
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = SRC_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-W', 'ignore', '-c', f'import {module}'],
+                            env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+
+    # Lines look like: "import time:       123 |       4567 |   pyripherals.core"
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        pieces = line[len('import time:'):].split('|')
+        if len(pieces) == 3 and pieces[2].strip() == module:
+            return int(pieces[1])
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', help='modules to time, defaults to core and all peripherals')
+    parser.add_argument('--repeats', type=int, default=5, help='runs per module, the best is kept')
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.modules or default_modules():
+        times = [import_time_us(module) for _ in range(args.repeats)]
+        times = [t for t in times if t is not None]
+        results[module] = min(times) if times else None
+        if results[module] is None:
+            print(f'{module:45s} import failed')
+        else:
+            print(f'{module:45s} {results[module] / 1000:8.1f} ms')
+
+    if args.json is not None:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
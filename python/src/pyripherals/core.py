@@ -7,17 +7,21 @@ Abe Stroschein, ajstroschein@stthomas.edu
 Lucas Koerner, koer2434@stthomas.edu
 """
 
-import pandas as pd
 import os
 import sys
-import copy
-import yaml
-from .utils import gen_mask, str_bitfile_version
+import hashlib
+import weakref
+from contextlib import contextmanager
+import numpy as np
+from .utils import str_bitfile_version, get_cache_file, load_cache, save_cache
+from .instrumentation import Instrumentation, InstrumentedFrontPanel, CostModel
+from .simulator import SimulatedBackend
 from warnings import warn
 
 home_dir = os.path.join(os.path.expanduser('~'), '.pyripherals')
 config_path = os.path.join(home_dir, 'config.yaml')
 if os.path.exists(config_path):
+    import yaml
     with open(config_path, 'r') as file:
         configs = yaml.safe_load(file)
 
@@ -39,6 +43,9 @@ else:
     from .utils import DEFAULT_CONFIGS
     configs = DEFAULT_CONFIGS
 
+# Compiled Register and Endpoint caches live here unless config.yaml sets cache_path
+cache_dir = configs.get('cache_path') or os.path.join(home_dir, 'cache')
+
 
 class Register:
     """Class for internal registers on a device.
@@ -57,6 +64,12 @@ class Register:
         Width of the register in bits.
     """
 
+    # Column headings every register sheet must have
+    SHEET_COLUMNS = ('Name', 'Hex Address', 'Default Value', 'Bit Width', 'Bit Index (High)', 'Bit Index (Low)')
+    # Absolute workbook path to ((mtime, size, format), compiled sheets) for workbooks read by this process
+    _compiled_workbooks = dict()
+    CACHE_FORMAT = 2  # Changed when the compiled form changes, so older caches are rebuilt
+
     def __init__(self, address, default, bit_index_high, bit_index_low, bit_width):
         self.address = address
         self.default = default
@@ -74,26 +87,147 @@ class Register:
             return False
 
     @staticmethod
-    def get_chip_registers(sheet, workbook_path=configs['registers_path']):
-        """Return a dictionary of Registers from a page in an Excel spreadsheet."""
+    def get_chip_registers(sheet, workbook_path=configs['registers_path'], use_cache=True):
+        """Return a dictionary of Registers from a page in an Excel spreadsheet.
+
+        All sheets of the workbook are compiled into a cache the first time
+        any sheet is requested. The cache is kept in memory for this process
+        and on disk in cache_dir so later imports do not parse the workbook
+        again. It is rebuilt when the workbook's modification time or size
+        changes.
+
+        Parameters
+        ----------
+        sheet : str or int
+            Name of the sheet, or its index in the workbook counting all
+            sheets, including those that are not register sheets.
+        workbook_path : str
+            Path to the Excel workbook. Defaults to registers_path from config.yaml.
+        use_cache : bool
+            False to skip the on-disk cache and parse the workbook directly.
+
+        Returns
+        -------
+        dict : name to Register pairs for the sheet.
+        """
+
+        sheets = Register.compile_workbook(workbook_path, use_cache=use_cache)
+        if type(sheet) is int:
+            try:
+                sheet = list(sheets.keys())[sheet]
+            except IndexError:
+                raise ValueError(f'Worksheet index {sheet} out of range for {workbook_path}')
+        try:
+            rows = sheets[sheet]
+        except KeyError:
+            raise ValueError(f'Worksheet named {sheet} not found in {workbook_path}')
+        if rows is None:
+            raise ValueError(f'Worksheet {sheet} in {workbook_path} is not a register sheet')
 
         reg_dict = {}
-        sheet_data = pd.read_excel(workbook_path, sheet, na_values=['NaN', 'nan'], keep_default_na=False)
-        for row in range(len(sheet_data)):
-            row_data = sheet_data.iloc[row]
-            reg_dict[row_data['Name']] = Register(
-                address=int(row_data['Hex Address'], 16),
-                default=int(row_data['Default Value'], 16),
-                bit_width=int(row_data['Bit Width']),
-                bit_index_high=(None if row_data['Bit Index (High)'] == 'None' else int(
-                    row_data['Bit Index (High)'])),  # Bit Index of None means the register takes up the whole endpoint
-                bit_index_low=(None if row_data['Bit Index (Low)'] == 'None' else int(row_data['Bit Index (Low)'])))
+        for name, address, default, bit_index_high, bit_index_low, bit_width in rows:
+            reg_dict[name] = Register(address=address, default=default, bit_index_high=bit_index_high,
+                                      bit_index_low=bit_index_low, bit_width=bit_width)
         return reg_dict
 
+    @staticmethod
+    def compile_workbook(workbook_path=configs['registers_path'], use_cache=True):
+        """Return the compiled contents of every sheet in a register workbook.
+
+        Each sheet is stored as a list of (name, address, default,
+        bit_index_high, bit_index_low, bit_width) tuples, which is the form
+        kept in the register cache.
+
+        Parameters
+        ----------
+        workbook_path : str
+            Path to the Excel workbook.
+        use_cache : bool
+            False to skip the in-memory and on-disk caches.
+
+        Returns
+        -------
+        dict : sheet name to list of register tuples, in workbook order.
+            Sheets that are not register sheets map to None.
+        """
+
+        if not use_cache:
+            return Register._read_workbook(workbook_path)
+
+        stat = os.stat(workbook_path)
+        key = (stat.st_mtime_ns, stat.st_size, Register.CACHE_FORMAT)
+        abs_path = os.path.abspath(workbook_path)
+        cached = Register._compiled_workbooks.get(abs_path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        cache_file = get_cache_file(cache_dir, 'registers', abs_path)
+        sheets = load_cache(cache_file, key)
+        if sheets is None:
+            sheets = Register._read_workbook(workbook_path)
+            save_cache(cache_file, key, sheets)
+        Register._compiled_workbooks[abs_path] = (key, sheets)
+        return sheets
+
+    @staticmethod
+    def _read_workbook(workbook_path):
+        """Parse every sheet of a register workbook into lists of register tuples.
+
+        The workbook is opened once with openpyxl in read-only mode and the
+        rows of each sheet are streamed, rather than building a DataFrame
+        per sheet. Sheets that are skipped are kept as None so the sheets
+        stay in workbook order.
+        """
+
+        from openpyxl import load_workbook
+
+        sheets = {}
+        workbook = load_workbook(workbook_path, read_only=True, data_only=True)
+        try:
+            for worksheet in workbook.worksheets:
+                rows = worksheet.iter_rows(values_only=True)
+                header = next(rows, None)
+                if header is None:
+                    warn(f'Skipping empty sheet "{worksheet.title}" in {workbook_path}')
+                    sheets[worksheet.title] = None
+                    continue
+                try:
+                    columns = [header.index(name) for name in Register.SHEET_COLUMNS]
+                    sheets[worksheet.title] = [Register._parse_row([row[c] for c in columns])
+                                               for row in rows if any(cell is not None for cell in row)]
+                except (IndexError, ValueError, TypeError) as e:
+                    # Other sheets are still usable, only this one is left out
+                    warn(f'Skipping sheet "{worksheet.title}" in {workbook_path}: {e!r}')
+                    sheets[worksheet.title] = None
+        finally:
+            workbook.close()
+        return sheets
+
+    @staticmethod
+    def _parse_row(row_data):
+        """Return the register tuple for one row of a register sheet.
+
+        row_data holds the cells of the row in the order of SHEET_COLUMNS.
+        """
+
+        name, address, default, bit_width, bit_index_high, bit_index_low = row_data
+        return (name,
+                int(address, 16),
+                int(default, 16),
+                # Bit Index of None means the register takes up the whole endpoint
+                None if bit_index_high == 'None' else int(bit_index_high),
+                None if bit_index_low == 'None' else int(bit_index_low),
+                int(bit_width))
+
 
 class Endpoint:
     """Class for Opal Kelly endpoints on the FPGA.
 
+    Endpoints are immutable. Creating an Endpoint equal to one that already
+    exists returns the existing object, so dictionaries of Endpoints can be
+    shallow copied and shared between chip instances. Use replace() or
+    advance() to get a modified Endpoint.
+
     Attributes
     ----------
     endpoints_from_defines : dict
@@ -117,6 +251,11 @@ class Endpoint:
         Whether to increment the address when incrementing the Endpoint.
     addr_step : int
         How much to add to the address when using advance_endpoints if gen_address is True.
+    mask : int
+        Mask of the bits [bit_index_low, bit_index_high) of the Endpoint, or
+        of the whole address if bit_index_low is None.
+    shift : int
+        How far to shift a value left to place it in the Endpoint's bits.
     """
 
     MAX_WIDTH = configs['endpoint_max_width']  # Maximum bit width of an Endpoint. Used to wrap Endpoints to the next address when incrementing
@@ -124,35 +263,233 @@ class Endpoint:
     I2CDAQ_level_shifted = dict()
     I2CDAQ_QW = dict()
 
-    def __init__(self, address, bit_index_low, bit_width, gen_bit, gen_address, addr_step=1):
-        self.address = address
-        self.bit_index_low = bit_index_low
-        # Endpoints that are only containing addresses will be generated from ep_defines.v with bit_index_low = None
-        if bit_index_low == None:
-            self.bit_index_high = None
-        else:
-            self.bit_index_high = bit_index_low + bit_width
-        self.bit_width = bit_width
-        self.gen_bit = gen_bit
-        self.gen_address = gen_address
-        self.addr_step = addr_step
+    FIELDS = ('address', 'bit_index_low', 'bit_width', 'gen_bit', 'gen_address', 'addr_step')
+    __slots__ = FIELDS + ('bit_index_high', 'mask', 'shift', '__weakref__')
+    # Endpoints are immutable, so equal Endpoints are shared rather than
+    # copied. The registry holds each one only while something else uses it.
+    _registry = weakref.WeakValueDictionary()
+
+    def __new__(cls, address, bit_index_low, bit_width, gen_bit, gen_address, addr_step=1):
+        key = (address, bit_index_low, bit_width, gen_bit, gen_address, addr_step)
+        endpoint = cls._registry.get(key)
+        if endpoint is None:
+            endpoint = super().__new__(cls)
+            for name, value in zip(cls.FIELDS, key):
+                object.__setattr__(endpoint, name, value)
+            # Endpoints that are only containing addresses will be generated from ep_defines.v with bit_index_low = None
+            if bit_index_low is None:
+                object.__setattr__(endpoint, 'bit_index_high', None)
+                object.__setattr__(endpoint, 'mask', (1 << cls.MAX_WIDTH) - 1)
+                object.__setattr__(endpoint, 'shift', 0)
+            else:
+                object.__setattr__(endpoint, 'bit_index_high', bit_index_low + bit_width)
+                object.__setattr__(endpoint, 'mask', ((1 << bit_width) - 1) << bit_index_low)
+                object.__setattr__(endpoint, 'shift', bit_index_low)
+            cls._registry[key] = endpoint
+        return endpoint
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'Endpoint is immutable, use replace() to get an Endpoint with a new {name}')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'Endpoint is immutable, cannot delete {name}')
 
     def __str__(self):
         str_rep = '0x{:0x}[{}:{}]'.format(
             self.address, self.bit_index_low, self.bit_index_high)
         return str_rep
 
+    def _key(self):
+        return tuple(getattr(self, name) for name in Endpoint.FIELDS)
+
     def __eq__(self, other):
         if type(self) is type(other):
-            return self.__dict__ == other.__dict__
+            return self._key() == other._key()
         else:
             return False
 
+    def __hash__(self):
+        return hash(self._key())
+
+    def __reduce__(self):
+        # Unpickle through __new__ so the registry is used
+        return (type(self), self._key())
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def replace(self, **changes):
+        """Return an Endpoint with the given attributes changed.
+
+        Parameters
+        ----------
+        **changes
+            New values for any of address, bit_index_low, bit_width, gen_bit,
+            gen_address, and addr_step. bit_index_high follows from
+            bit_index_low and bit_width.
+
+        Returns
+        -------
+        Endpoint : the Endpoint with the changes applied.
+        """
+
+        fields = dict(zip(Endpoint.FIELDS, self._key()))
+        for name in changes:
+            if name not in fields:
+                raise TypeError(f'replace() got an unexpected keyword argument {name!r}')
+        fields.update(changes)
+        return type(self)(**fields)
+
+    def advance(self, advance_num=1):
+        """Return this Endpoint advanced by advance_num.
+
+        See advance_endpoints for how the bits and address are incremented.
+        """
+
+        if advance_num == 0:
+            return self
+        addresses, bit_indices = self._instance_positions([advance_num])
+        bit_index_low = self.bit_index_low if bit_indices is None else int(bit_indices[0])
+        return self.replace(address=int(addresses[0]), bit_index_low=bit_index_low)
+
+    def _instance_positions(self, instances):
+        """Return the addresses and bit_index_low values of this Endpoint advanced by each of instances.
+
+        Computed in closed form, the same as advancing by one instance at a
+        time. Within an address the bits step by bit_width while the Endpoint
+        still fits below MAX_WIDTH. After that each address holds
+        MAX_WIDTH // bit_width instances starting at bit 0.
+
+        Parameters
+        ----------
+        instances : array_like of int
+            How far to advance the Endpoint, each at least 0.
+
+        Returns
+        -------
+        tuple : numpy array of addresses and numpy array of bit_index_low, or
+            None for bit_index_low if gen_bit is False.
+        """
+
+        instances = np.asarray(instances, dtype=np.int64)
+        if np.any(instances < 0):
+            raise ValueError('Endpoints can only be advanced by 0 or more instances')
+
+        steps = instances if self.gen_address else np.zeros_like(instances)
+        if not self.gen_bit:
+            return self.address + steps * self.addr_step, None
+
+        wraps, bit_indices = Endpoint._bit_positions(self.bit_index_low, self.bit_width, instances)
+        return self.address + (wraps + steps) * self.addr_step, bit_indices
+
+    @staticmethod
+    def _bit_positions(bit_index_low, bit_width, instances):
+        """Return the address wraps and bit_index_low after advancing the bits by each of instances."""
+
+        max_width = Endpoint.MAX_WIDTH
+        first = instances > 0
+
+        if bit_width > max_width:
+            # Every step wraps twice, once past MAX_WIDTH and again because it still does not fit
+            return 2 * instances, np.where(first, 0, bit_index_low)
+
+        if bit_index_low + bit_width > max_width:
+            # The starting bits do not fit, so the first step wraps differently.
+            # It always ends on bits that fit, where the closed form applies.
+            low = bit_index_low + bit_width
+            first_wraps = 0
+            if low > max_width:
+                first_wraps += 1
+                low %= max_width
+            if low + bit_width > max_width:
+                first_wraps += 1
+                low = 0
+            wraps, bit_indices = Endpoint._bit_positions(low, bit_width, np.maximum(instances - 1, 0))
+            return np.where(first, wraps + first_wraps, 0), np.where(first, bit_indices, bit_index_low)
+
+        if bit_width == 0:
+            return np.zeros_like(instances), np.full(instances.shape, bit_index_low, dtype=np.int64)
+
+        first_address = (max_width - bit_index_low) // bit_width  # Instances left at the starting address
+        per_address = max_width // bit_width  # Instances at each later address
+        later = instances - first_address
+        on_first = later < 0
+        wraps = np.where(on_first, 0, 1 + later // per_address)
+        bit_indices = np.where(on_first, bit_index_low + instances * bit_width, (later % per_address) * bit_width)
+        return wraps, bit_indices
+
+    @staticmethod
+    def for_instance(group, instance):
+        """Return the Endpoints of a group for the given chip instance.
+
+        Equivalent to advancing a copy of the group instance times with
+        advance_endpoints, but computed directly.
+
+        Parameters
+        ----------
+        group : str or dict
+            The name of a group in endpoints_from_defines or a dict of
+            (str, Endpoint) pairs for instance 0.
+        instance : int
+            Which instance to get the Endpoints for, 0 or more.
+
+        Returns
+        -------
+        dict : A new dictionary of (str, Endpoint) pairs.
+        """
+
+        if type(group) is str:
+            group = Endpoint.get_chip_endpoints(group)
+        return {name: ep.advance(instance) for name, ep in group.items()}
+
+    @staticmethod
+    def for_instances(group, instances):
+        """Return the Endpoints of a group for each of several chip instances.
+
+        The positions of each Endpoint are computed for all instances at once.
+
+        Parameters
+        ----------
+        group : str or dict
+            The name of a group in endpoints_from_defines or a dict of
+            (str, Endpoint) pairs for instance 0.
+        instances : int or array_like of int
+            The instances to get the Endpoints for. An int n gives instances
+            0 to n - 1.
+
+        Returns
+        -------
+        list : A dictionary of (str, Endpoint) pairs for each instance.
+        """
+
+        if type(group) is str:
+            group = Endpoint.get_chip_endpoints(group)
+        if type(instances) is int:
+            instances = range(instances)
+        instances = np.asarray(instances, dtype=np.int64)
+
+        chips = [dict() for _ in range(instances.size)]
+        for name, ep in group.items():
+            addresses, bit_indices = ep._instance_positions(instances)
+            for i, chip in enumerate(chips):
+                bit_index_low = ep.bit_index_low if bit_indices is None else int(bit_indices[i])
+                chip[name] = ep.replace(address=int(addresses[i]), bit_index_low=bit_index_low)
+        return chips
+
     @staticmethod
-    def update_endpoints_from_defines(ep_defines_path=configs['ep_defines_path']):
+    def update_endpoints_from_defines(ep_defines_path=configs['ep_defines_path'], use_cache=True):
         """Store and return a dictionary of Endpoints for each chip in ep_defines.v.
 
-        Returns -1 if there is a naming collision in ep_defines.v
+        The parsed endpoints are kept in a cache in cache_dir keyed on a hash
+        of the defines file, so later processes load them with a single read
+        instead of tokenizing the file again.
+
+        Returns -1 if two endpoints of one chip group share an address with
+        overlapping bits. Groups may share addresses on purpose, use
+        check_duplicates to list those.
         """
 
         # Leave as None if there is no ep_defines.v
@@ -162,12 +499,59 @@ class Endpoint:
         elif not os.path.exists(ep_defines_path):
             raise FileNotFoundError(f'ep_defines_path = {ep_defines_path} not found')
 
-        # Get all lines
-        with open(ep_defines_path, 'r') as file:
-            lines = file.readlines()
+        with open(ep_defines_path, 'rb') as file:
+            text = file.read()
+
+        groups = None
+        if use_cache:
+            key = hashlib.sha256(text).hexdigest()
+            cache_file = get_cache_file(cache_dir, 'endpoints', ep_defines_path)
+            groups = load_cache(cache_file, key)
+        if groups is None:
+            groups = Endpoint._parse_defines(text.decode().splitlines(), ep_defines_path)
+            if use_cache:
+                save_cache(cache_file, key, groups)
+
+        # Put defined endpoints in endpoints_from_defines dictionary
+        for group_name, group in groups.items():
+            if Endpoint.endpoints_from_defines.get(group_name) is None:
+                # Class doesn't exist yet in the dictionary
+                Endpoint.endpoints_from_defines[group_name] = {}
+            for ep_name, (address, bit, bit_width, gen_bit, gen_address, addr_step) in group.items():
+                if type(address) == str:
+                    # Reference to an endpoint from an earlier defines file
+                    address = Endpoint._resolve_address(Endpoint.endpoints_from_defines, group_name, ep_name, address)
+                Endpoint.endpoints_from_defines[group_name][ep_name] = Endpoint(
+                    address=address, bit_index_low=bit, bit_width=bit_width,
+                    gen_bit=gen_bit, gen_address=gen_address, addr_step=addr_step)
 
+        # At this point the dictionary should be built
+        # Check for collisions (2+ names in a group sharing same address or overlapping bits within address)
+        collisions = []
+        for group_name in groups:
+            collisions += Endpoint.find_overlaps({group_name: Endpoint.endpoints_from_defines[group_name]})
+        if len(collisions) > 0:
+            print('Collisions found in ep_defines.v:')
+            for name, other_name, ep in collisions:
+                print(f'Collision found at address={ep.address} bit={ep.bit_index_low}: {other_name} with {name}')
+            return -1
+
+        return Endpoint.endpoints_from_defines
+
+    @staticmethod
+    def _parse_defines(lines, ep_defines_path):
+        """Parse the lines of ep_defines.v into endpoint data for each group.
+
+        Returns
+        -------
+        dict : group name to dicts of endpoint name to (address, bit_index_low,
+            bit_width, gen_bit, gen_address, addr_step) tuples. Addresses that
+            reference an endpoint not in these lines are left as the str name.
+        """
+
+        groups = {}
         # Get all the endpoints from the lines
-        for line in lines:
+        for line_number, line in enumerate(lines, start=1):
             # Check if the line defines an endpoint
             pieces = line.split(' ')
             # Ex. line = "`define AD7961_PIPE_OUT_GEN_ADDR 8'hA1 // address=TEST_ADDRESS bit_width=32"
@@ -184,7 +568,7 @@ class Endpoint:
                     addr_step = addr_step_text[len('addr_step='):]
                     addr_step = int(addr_step)
                 except ValueError as e:
-                    raise ValueError(f'addr_step not assigned to int in line {lines.index(line) + 1} of "{ep_defines_path}". Got addr_step={addr_step} instead.')
+                    raise ValueError(f'addr_step not assigned to int in line {line_number} of "{ep_defines_path}". Got addr_step={addr_step} instead.')
             else:
                 # No addr_step assigned, default to 1
                 addr_step = 1
@@ -243,96 +627,41 @@ class Endpoint:
                 bit = int(pieces[2])
                 bit_width = int(pieces[5].split('=')[1])
 
-            endpoint = Endpoint(address=address, bit_index_low=bit,
-                                bit_width=bit_width, gen_bit=gen_bit, gen_address=gen_address, addr_step=addr_step)
+            groups.setdefault(class_name, {})[ep_name] = (address, bit, bit_width, gen_bit, gen_address, addr_step)
 
-            # Put defined endpoint in endpoints_from_defines dictionary
-            if Endpoint.endpoints_from_defines.get(class_name) is None:
-                # Class doesn't exist yet in the dictionary
-                Endpoint.endpoints_from_defines[class_name] = {
-                    ep_name: endpoint}
-            else:
-                # Class already exists in the dictionary
-                Endpoint.endpoints_from_defines[class_name][ep_name] = endpoint
-
-        # Go through endpoints_from_defines and find hex addresses for those with endpoint
+        # Go through the groups and find hex addresses for those with endpoint
         # name references instead
-        for group_name in Endpoint.endpoints_from_defines:
-            group = Endpoint.endpoints_from_defines[group_name]
-            for endpoint_name in group:
-                endpoint = group[endpoint_name]
-                if type(endpoint.address) == str:
-                    # Address is a name
-                    class_name, ep_name = endpoint.address.split(
-                        '_', maxsplit=1)
-                    referenced_group = Endpoint.endpoints_from_defines.get(
-                        class_name)
-                    if referenced_group is None:
-                        print(
-                            f'{group_name}[{endpoint_name}]: Referenced group "{class_name}" not found.')
-                        continue
-                    referenced_endpoint = referenced_group.get(ep_name)
-                    if referenced_endpoint is None:
-                        print(
-                            f'{group_name}[{endpoint_name}]: Referenced endpoint "{class_name}_{ep_name}" not found.')
-                        continue
-                    endpoint.address = referenced_endpoint.address
+        for group_name, group in groups.items():
+            for ep_name, (address, *rest) in group.items():
+                if type(address) == str:
+                    class_name = address.split('_', maxsplit=1)[0]
+                    if class_name in groups:
+                        address = Endpoint._resolve_address(groups, group_name, ep_name, address)
+                        group[ep_name] = (address, *rest)
+                    # Otherwise the referenced group may come from an earlier defines file
+        return groups
 
-        # At this point the dictionary should be built
-        # Check for naming collisions (2+ names sharing same address or bit within address)
-        # Collect all top level endpoints
-        top_level_eps = [
-            x for x in Endpoint.endpoints_from_defines.values() if type(x) == Endpoint]
-        # Collect all endpoints in dictionaries
-        lower_level_eps = []
-        for eps in [d.values() for d in Endpoint.endpoints_from_defines.values() if type(d) == dict]:
-            lower_level_eps += list(eps)
-        none_to_neg_1 = {None: -1}
-        # Make tuples of (address, bit) from each list, then concatenate the lists
-        # The none_to_neg_1.get() translates None values of bit_index_low to -1 for sorting later
-        list_eps = [(ep.address, none_to_neg_1.get(
-            ep.bit_index_low, ep.bit_index_low)) for ep in top_level_eps]
-        list_len = len(list_eps)
-        set_len = len(set(list_eps))  # A set removes duplicates
-
-        if list_len != set_len:
-            # There may be duplicates. May not, because different groups can have endpoints of the same name.
-            print('Checking for naming collisions in ep_defines.v ...')
-
-            # Search through to find duplicates
-            # Copy the list to keep order in the original
-            sorted_list_eps = list(list_eps)
-            sorted_list_eps.sort()  # Put duplicates next to one another in new list
-            top_level_names = [x for x in Endpoint.endpoints_from_defines.keys() if type(
-                Endpoint.endpoints_from_defines[x]) == Endpoint]
-            lower_level_names = []
-            for sub_dicts in [x for x in Endpoint.endpoints_from_defines.values() if type(x) == dict]:
-                lower_level_names += list(sub_dicts.keys())
-            list_names = top_level_names + lower_level_names
-
-            collision = False  # Keep track of whether there was a collision for return value
-            for ep_index in range(len(sorted_list_eps) - 1):
-                ep = sorted_list_eps[ep_index]
-                next_ep = sorted_list_eps[ep_index + 1]
-                name = list_names[list_eps.index(sorted_list_eps[ep_index])]
-                next_name = list_names[list_eps.index(
-                    sorted_list_eps[ep_index])]
-                if (ep == next_ep) and (name != next_name):
-                    # Need different names because otherwise they are from different groups and do not actually conflict
-
-                    # The name part of this uses a list of names created in the same order as the original list_eps (list_names)
-                    # then finds the index of the current endpoint in list_eps and uses that to find the corresponding
-                    # name in list_names
-                    print(
-                        f'Collision found at address={ep[0]} bit={ep[1]}: {name} with {next_name}')
-                    collision = True
-            if collision:
-                return -1
-            else:
-                print('No collisions found.')
+    @staticmethod
+    def _resolve_address(groups, group_name, ep_name, address_name):
+        """Return the address of the endpoint named by address_name.
 
-        # If the list and set match length, no duplicates
-        return Endpoint.endpoints_from_defines
+        groups is either the dictionary of endpoint tuples from _parse_defines
+        or endpoints_from_defines. The name is returned unchanged if the
+        endpoint is not found.
+        """
+
+        class_name, referenced_name = address_name.split('_', maxsplit=1)
+        referenced_group = groups.get(class_name)
+        if referenced_group is None:
+            print(f'{group_name}[{ep_name}]: Referenced group "{class_name}" not found.')
+            return address_name
+        referenced_endpoint = referenced_group.get(referenced_name)
+        if referenced_endpoint is None:
+            print(f'{group_name}[{ep_name}]: Referenced endpoint "{class_name}_{referenced_name}" not found.')
+            return address_name
+        if type(referenced_endpoint) is tuple:
+            return referenced_endpoint[0]
+        return referenced_endpoint.address
 
     @staticmethod
     def get_chip_endpoints(chip_name):
@@ -341,13 +670,13 @@ class Endpoint:
         if Endpoint.endpoints_from_defines == dict():
             Endpoint.update_endpoints_from_defines()
 
-        # copy.deepcopy() is important here because it makes a copy of the
-        # dictionary so that when we increment it for multiple instantiations
-        # of the chip, each previously instantiated chip will not have its
-        # endpoints affected by the increment, only future instantiations.
-        # Using deepcopy() ensures that any dictionaries inside the dictionary
-        # we copy also get copied, not left as references.
-        return copy.deepcopy(Endpoint.endpoints_from_defines.get(chip_name))
+        # Endpoints are immutable, so a shallow copy is enough to keep
+        # increments for multiple instantiations of the chip from affecting
+        # previously instantiated chips.
+        chip_endpoints = Endpoint.endpoints_from_defines.get(chip_name)
+        if chip_endpoints is None:
+            return None
+        return dict(chip_endpoints)
 
     @staticmethod
     def excel_to_defines(excel_path, defines_path, sheet=0):
@@ -368,6 +697,8 @@ class Endpoint:
         str : the text written to the Verilog file.
         """
 
+        import pandas as pd
+
         sheet_data = pd.read_excel(excel_path, sheet)
         text = '\n'.join(sheet_data['Generated Line'])
         with open(defines_path, 'w') as file:
@@ -378,6 +709,10 @@ class Endpoint:
     def advance_endpoints(endpoints_dict, advance_num=1):
         """
         Advances Endpoints in a dict in place by advance_num.
+
+        Endpoints are immutable, so each value in the dict is replaced with
+        the advanced Endpoint. Other dicts holding the old Endpoints are not
+        affected.
         
         Checks each Endpoint's gen_bit and gen_address attributes to see
         whether to increment the bit or the address or both. The Endpoint's
@@ -385,7 +720,8 @@ class Endpoint:
         bits or address by. If the Endpoint's bits would exceed
         Endpoint.MAX_WIDTH (determined from config.yaml), then the bits wrap
         around to start at bit zero on the next address determined by adding
-        the Endpoint's addr_step attribute.
+        the Endpoint's addr_step attribute. Advancing by advance_num gives the
+        same Endpoints as advancing by 1 advance_num times.
 
         Example usage:
             endpoints=Endpoint.advance_endpoints(Endpoint.get_chip_endpoints('I2CDAQ'),1)
@@ -403,26 +739,96 @@ class Endpoint:
         """
 
         for key in endpoints_dict:
-            endpoint = endpoints_dict[key]
-            if endpoint.gen_bit:
-                endpoint.bit_index_low += (endpoint.bit_width * advance_num)
-                if endpoint.bit_index_low > Endpoint.MAX_WIDTH:
-                    # Endpoint does not fit, wrap to next address
-                    endpoint.address += endpoint.addr_step
-                    endpoint.bit_index_low %= Endpoint.MAX_WIDTH
-                endpoint.bit_index_high = endpoint.bit_index_low + endpoint.bit_width
-                if endpoint.bit_index_high > Endpoint.MAX_WIDTH:
-                    # Endpoint split across two addresses -> move to next address, start at bit 0
-                    endpoint.address += endpoint.addr_step
-                    endpoint.bit_index_low = 0
-                    endpoint.bit_index_high = endpoint.bit_index_low + endpoint.bit_width
-            if endpoint.gen_address:
-                endpoint.address += advance_num * endpoint.addr_step
+            endpoints_dict[key] = endpoints_dict[key].advance(advance_num)
         return endpoints_dict
 
+    @staticmethod
+    def flatten_endpoints(endpoints_dict, prefix=''):
+        '''Make all values of subdictionaries values of a new single dictionary.
+
+        Keys are dictionary keys separated by '/' as we go down subdictionaries.
+
+        Parameters
+        ----------
+        endpoints_dict : dict
+            The dictionary to flatten.
+        prefix : str
+            The prefix for the new dictionary keys. Used recursively.
+
+        Returns
+        -------
+        dict : A new dictionary of (str, Endpoint) pairs.
+        '''
+
+        flat_eps = {}
+        for name, value in endpoints_dict.items():
+            key = prefix + str(name)
+            if type(value) is dict:
+                flat_eps.update(Endpoint.flatten_endpoints(value, prefix=key + '/'))
+            else:
+                flat_eps[key] = value
+        return flat_eps
+
+    @staticmethod
+    def find_overlaps(endpoints_dict):
+        '''Find Endpoints that share an address and overlap in their bits.
+
+        Each bit an Endpoint covers is entered into a dictionary keyed on
+        (address, bit), so the check is a single pass over the Endpoints
+        rather than a comparison of every pair. An Endpoint covers the bits
+        [bit_index_low, bit_index_low + bit_width), or just bit_index_low if
+        bit_width is 0. Endpoints with bit_index_low of None hold the whole
+        address and only overlap with other whole-address Endpoints.
+        Length defines are skipped. Those are X_LEN entries that give the
+        number of instances of an Endpoint X at the same address, so they
+        hold a count rather than bits of their own. An X_LEN with no
+        Endpoint X beside it is checked like any other Endpoint.
+
+        Parameters
+        ----------
+        endpoints_dict : dict
+            The dictionary of (str, Endpoint) pairs to check. (str, dict) pairs
+            are also allowed for nested dictionaries.
+
+        Returns
+        -------
+        list : (name, other_name, Endpoint) tuples, one for each overlapping
+            pair, where other_name comes before name in endpoints_dict and
+            Endpoint is the one stored under name. Names of nested Endpoints
+            are their keys separated by '/'.
+        '''
+
+        occupied = {}  # (address, bit) to the names of Endpoints covering it
+        overlaps = []
+        flat_eps = Endpoint.flatten_endpoints(endpoints_dict)
+        for name, ep in flat_eps.items():
+            if Endpoint._is_length_define(name, ep, flat_eps):
+                continue
+            if ep.bit_index_low is None:
+                keys = [(ep.address, None)]
+            else:
+                keys = [(ep.address, bit) for bit in range(ep.bit_index_low, ep.bit_index_low + max(ep.bit_width, 1))]
+
+            others = dict()  # Ordered set of the earlier Endpoints overlapping this one
+            for key in keys:
+                names = occupied.setdefault(key, [])
+                others.update(dict.fromkeys(names))
+                names.append(name)
+            overlaps += [(name, other_name, ep) for other_name in others]
+        return overlaps
+
+    @staticmethod
+    def _is_length_define(name, ep, flat_eps):
+        '''Return whether the flattened Endpoint name is the length define of another Endpoint.'''
+
+        if not name.endswith('_LEN'):
+            return False
+        counted = flat_eps.get(name[:-len('_LEN')])
+        return counted is not None and counted.address == ep.address
+
     @classmethod
     def check_duplicates(cls, endpoints_dict=endpoints_from_defines, print_output=True):
-        '''Check for duplicate Endpoints.
+        '''Check for duplicate Endpoints, those sharing an address with overlapping bits.
 
         Parameters
         ----------
@@ -432,54 +838,23 @@ class Endpoint:
             Defaults to Endpoint.endpoints_from_defines.
         print_output : bool
             Whether to print the discovered duplicate Endpoints.
-        
+
         Returns
         -------
-        dict : A new dictionary of (str(Endpoint), str) pairs.
+        dict : A new dictionary of (str(Endpoint), list) pairs. Each list holds
+            the name of the first Endpoint followed by the names of later
+            Endpoints that overlap it.
         '''
 
-        # Flatten the dictionary so all Endpoints appear as values.
-
-        def flatten_dict(d, prefix=''):
-            '''Make all values of subdictionaries values of a new single dictionary.
-            
-            Keys are dictionary keys separated by '/' as we go down subdictionaries.
-            
-            Parameters
-            ----------
-            d : dict
-                The dictionary to flatten.
-            prefix : str
-                The prefix for the new dictionary keys. Used recursively.
-            '''
-
-            dn = {}
-            for i in d:
-                    k = prefix + str(i)
-                    if type(d[i]) is dict:
-                            dn.update(flatten_dict(d[i], prefix=k + '/'))
-                    else:
-                            dn[k] = d[i]
-            return dn
-
-        flat_eps = flatten_dict(endpoints_dict)
-
-        # Now create a dictionary of (str(Endpoint), str) pairs for any duplicate Endpoints.
+        flat_eps = cls.flatten_endpoints(endpoints_dict)
+
+        # Now create a dictionary of (str(Endpoint), list) pairs for any duplicate Endpoints.
         dup_eps = {}
-        prev_k = set()
-        for k in flat_eps:
-                v = flat_eps[k]
-                prev_k.add(k)
-                for k2 in flat_eps:
-                        if k2 in prev_k:
-                                continue
-                        else:
-                                v2 = flat_eps[k2]
-                                if v == v2:
-                                        try:
-                                                dup_eps[str(v)].append(k2)
-                                        except KeyError:
-                                                dup_eps[str(v)] = [k, k2]
+        for name, other_name, ep in cls.find_overlaps(flat_eps):
+            names = dup_eps.setdefault(str(flat_eps[other_name]), [])
+            for k in (other_name, name):
+                if k not in names:
+                    names.append(k)
 
         # Print the output if desired
         if print_output:
@@ -487,7 +862,7 @@ class Endpoint:
             for k in dup_eps:
                 print(k)
                 for i in dup_eps[k]:
-                        print('\t', i)
+                    print('\t', i)
 
         return dup_eps
 
@@ -508,10 +883,25 @@ class FPGA:
         Opal Kelly API connection to the FPGA.
     device_info : ok.okTDeviceInfo
         General information about the FPGA.
+    backend : module or object
+        Provides the okCFrontPanel, okTDeviceInfo, and okTRegisterEntries
+        classes used to reach the device. The Opal Kelly ok module when left
+        as None, or for example a pyripherals.simulator.SimulatedBackend to
+        run without hardware.
+    instrumentation : pyripherals.instrumentation.Instrumentation
+        Statistics for the calls made through xem, or None when
+        instrumentation is not enabled.
+    configure_count : int
+        Number of times a bitfile has been loaded by init_device. Peripherals
+        compare it to tell when state held on the FPGA, such as DDR3 data,
+        has been lost.
+    dry_running : bool
+        True inside a dry_run block. Peripherals check it so that device
+        state reached only in a dry run is not remembered for the FPGA.
     """
 
 
-    def __init__(self, bitfile='default', endpoints=None, debug=False):
+    def __init__(self, bitfile='default', endpoints=None, debug=False, backend=None):
         if bitfile == 'default':
             # Use bitfile from config.yaml fpga_bitfile_path
             self.bitfile = configs['fpga_bitfile_path']
@@ -525,6 +915,14 @@ class FPGA:
 
         self.debug = debug
         self.bitfile_version = None
+        self.backend = backend
+        self._batch_depth = 0  # Number of open batch() blocks
+        self._pending_wire_ins = dict()  # Address to (value, mask) set but not yet sent by UpdateWireIns
+        self._snapshot = None  # Which of the WireOuts and TriggerOuts an open snapshot() block has updated
+        self._wire_ins = dict()  # Shadow of the WireIns, address to (value, mask) of the bits known to be set
+        self.instrumentation = None
+        self.configure_count = 0
+        self.dry_running = False
 
 
     def init_device(self):
@@ -534,14 +932,19 @@ class FPGA:
         Only run this once or the FPGA connection will fail.
         """
 
+        if self.backend is None:
+            self.backend = ok  # The Opal Kelly FrontPanel API
+
         # Open the first device we find.
-        self.xem = ok.okCFrontPanel()
+        self.xem = self.backend.okCFrontPanel()
+        if self.instrumentation is not None:
+            self.xem = InstrumentedFrontPanel(self.xem, self.instrumentation)
         if (self.xem.NoError != self.xem.OpenBySerial("")):
             print("A device could not be opened.  Is one connected?")
             return(False)
 
         # Get some general information about the device.
-        self.device_info = ok.okTDeviceInfo()
+        self.device_info = self.backend.okTDeviceInfo()
         if (self.xem.NoError != self.xem.GetDeviceInfo(self.device_info)):
             print("Unable to retrieve device information.")
             return(False)
@@ -573,6 +976,9 @@ class FPGA:
                 return(False)
             else:
                 print('Loaded bit-file: {}'.format(self.bitfile))
+            # The new configuration does not keep the WireIns we know about
+            self.resync()
+            self.configure_count += 1
         else:
             print('Skipped bit-file update')
 
@@ -584,11 +990,296 @@ class FPGA:
         print("FrontPanel support is available.")
         return self
 
+    def enable_instrumentation(self, instrumentation=None, attribute_callers=True):
+        """Record statistics for every call made through xem.
+
+        Wraps xem in a pyripherals.instrumentation.InstrumentedFrontPanel. Can
+        be called before or after init_device.
+
+        Parameters
+        ----------
+        instrumentation : pyripherals.instrumentation.Instrumentation
+            Where to record the calls, or any object with the same record
+            method such as a pyripherals.trace.TraceRecorder. Defaults to a
+            new Instrumentation.
+        attribute_callers : bool
+            Whether a new Instrumentation finds the peripheral making each call.
+
+        Returns
+        -------
+        pyripherals.instrumentation.Instrumentation
+            Use its report or to_json method for the statistics.
+        """
+
+        self.disable_instrumentation()
+        if instrumentation is None:
+            instrumentation = Instrumentation(attribute_callers=attribute_callers)
+        self.instrumentation = instrumentation
+        if hasattr(self, 'xem'):
+            self.xem = InstrumentedFrontPanel(self.xem, instrumentation)
+        return instrumentation
+
+    def record_trace(self, path, payloads=True):
+        """Record every call made through xem to a trace file.
+
+        Call before init_device to record the whole session. Stop with
+        disable_instrumentation, which returns the recorder to close.
+
+        Parameters
+        ----------
+        path : str
+            Path to the trace file to write.
+        payloads : bool
+            Whether to store the data moved by pipe calls.
+
+        Returns
+        -------
+        pyripherals.trace.TraceRecorder
+        """
+
+        from .trace import TraceRecorder
+        return self.enable_instrumentation(TraceRecorder(path, payloads=payloads))
+
+    def disable_instrumentation(self):
+        """Stop recording calls and return the Instrumentation or TraceRecorder, or None if none was enabled."""
+
+        instrumentation = self.instrumentation
+        self.instrumentation = None
+        if isinstance(getattr(self, 'xem', None), InstrumentedFrontPanel):
+            self.xem = self.xem.frontpanel
+        return instrumentation
+
+    @contextmanager
+    def dry_run(self, cost_model=None, frontpanel=None, peripherals=()):
+        """Run driver code against a simulated device and estimate what it would cost.
+
+        Inside the block xem is a simulated device, so nothing is sent to the
+        FPGA and an FPGA that has not run init_device can be used. Each call
+        is recorded with the duration estimated by the cost model. The FPGA's
+        connection and shadow of the WireIns are restored afterwards; the
+        block starts from a copy of the shadow so that writes the FPGA would
+        skip are skipped here too.
+
+        State that peripherals keep on the host about the device, such as
+        SPIFifoDriven.current_data_mux, is only rolled back for the
+        peripherals given, whose attributes are restored after the block.
+        Otherwise the next real call may skip a write the dry run made.
+        DDR3 does not remember data written in a dry run, see dry_running.
+
+        Example usage:
+            with f.dry_run() as estimate:
+                dac.write_voltage(1.2)
+            estimate.report()['callers']['DAC80508.write_voltage']
+
+        Parameters
+        ----------
+        cost_model : pyripherals.instrumentation.CostModel
+            Estimates the duration of each call. Defaults to CostModel().
+        frontpanel : pyripherals.simulator.SimulatedFrontPanel
+            The simulated device. Give a subclass that models the HDL for
+            drivers that wait on a WireOut or TriggerOut.
+        peripherals : iterable
+            Peripherals used in the block whose attributes are restored
+            afterwards.
+
+        Yields
+        ------
+        pyripherals.instrumentation.Instrumentation
+            The calls made in the block, with estimated durations.
+        """
+
+        self.flush()  # Writes from before the dry run go to the FPGA
+        estimate = Instrumentation(cost_model=CostModel() if cost_model is None else cost_model)
+        backend = SimulatedBackend(frontpanel=frontpanel)
+        saved = (self.__dict__.get('xem'), self.backend, self.instrumentation,
+                 self._wire_ins, self._snapshot, self._batch_depth, self.dry_running)
+        saved_peripherals = [(peripheral, dict(vars(peripheral))) for peripheral in peripherals]
+        self.xem = InstrumentedFrontPanel(backend.frontpanel, estimate)
+        self.backend = backend
+        self.instrumentation = estimate
+        self._wire_ins = dict(self._wire_ins)
+        self._snapshot = None
+        self._batch_depth = 0
+        self.dry_running = True
+        try:
+            yield estimate
+        finally:
+            self._pending_wire_ins.clear()
+            (xem, self.backend, self.instrumentation, self._wire_ins, self._snapshot, self._batch_depth,
+             self.dry_running) = saved
+            for peripheral, attributes in saved_peripherals:
+                vars(peripheral).clear()
+                vars(peripheral).update(attributes)
+            if xem is None:
+                del self.xem
+            else:
+                self.xem = xem
+
+    @staticmethod
+    def _wire_mask(ep_bit):
+        """Return the mask used by set_endpoint, clear_endpoint, toggle_low, and toggle_high.
+
+        The mask covers bit_index_low through bit_index_high inclusive.
+        """
+
+        return ep_bit.mask | (1 << ep_bit.bit_index_high)
+
+    def handle(self, ep_bit):
+        """Return an EndpointHandle for fast repeated access to an Endpoint.
+
+        Parameters
+        ----------
+        ep_bit : Endpoint
+            The Endpoint to access.
+
+        Returns
+        -------
+        EndpointHandle : handle with set, clear, pulse, and read methods.
+        """
+
+        return EndpointHandle(self, ep_bit)
+
+    @contextmanager
+    def batch(self):
+        """Context manager that sends the WireIn writes in the block with one UpdateWireIns.
+
+        Writes with set_wire, set_wire_bit, clear_wire_bit, set_ep_simultaneous,
+        set_endpoint, clear_endpoint, and EndpointHandles are collected across
+        addresses. They are sent when the block ends. Ordering with the rest of
+        the block is kept: pending writes are sent before a trigger, a read, or
+        a pipe transfer through this FPGA, and before a write that would change
+        bits still waiting to be sent, so a set followed by a clear of the same
+        bit is still a pulse. Call flush() before using xem directly inside the
+        block. Blocks may be nested, the writes are sent when the outermost
+        block ends.
+
+        Example usage:
+            with fpga.batch():
+                fpga.set_wire_bit(address, 0)
+                fpga.clear_wire_bit(address, 1)
+        """
+
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush()
+
+    def flush(self):
+        """Send WireIn writes waiting in a batch() block with UpdateWireIns."""
+
+        if self._pending_wire_ins:
+            self._pending_wire_ins.clear()
+            self.xem.UpdateWireIns()
+
+    @contextmanager
+    def snapshot(self):
+        """Context manager that serves all WireOut and TriggerOut reads in the block from one update.
+
+        The first WireOut read in the block calls UpdateWireOuts and the first
+        TriggerOut read calls UpdateTriggerOuts. Later reads in the block use
+        those values rather than updating again. This covers read_wire,
+        read_wire_bit, read_ep, read_trig, update_wire_outs,
+        update_trigger_outs, and EndpointHandle.read. Blocks may be nested,
+        inner blocks share the outer block's snapshot. Do not poll for a
+        change inside a snapshot, the values will not change.
+
+        Example usage:
+            with fpga.snapshot():
+                status = [chip.get_status() for chip in ad7961_chips]
+        """
+
+        if self._snapshot is not None:
+            yield self
+            return
+        self._snapshot = {'wire_outs': False, 'trigger_outs': False}
+        try:
+            yield self
+        finally:
+            self._snapshot = None
+
+    def update_wire_outs(self):
+        """Update the WireOut values from the FPGA, once per snapshot() block."""
+
+        snapshot = self._snapshot
+        if snapshot is None or not snapshot['wire_outs']:
+            self.flush()
+            self.xem.UpdateWireOuts()
+            if snapshot is not None:
+                snapshot['wire_outs'] = True
+
+    def update_trigger_outs(self):
+        """Update the TriggerOut values from the FPGA, once per snapshot() block."""
+
+        snapshot = self._snapshot
+        if snapshot is None or not snapshot['trigger_outs']:
+            self.flush()
+            self.xem.UpdateTriggerOuts()
+            if snapshot is not None:
+                snapshot['trigger_outs'] = True
+
+    def resync(self, addresses=None):
+        """Forget the shadow copy of the WireIns so the next writes are sent.
+
+        Call this after anything changes the WireIns without going through this
+        FPGA object, for example reloading the bitfile or writing with xem
+        directly. init_device calls it after configuring the FPGA.
+
+        Parameters
+        ----------
+        addresses : list of int
+            The WireIn addresses to forget. Defaults to all of them.
+        """
+
+        if addresses is None:
+            self._wire_ins.clear()
+        else:
+            for address in addresses:
+                self._wire_ins.pop(address, None)
+
+    def _write_wire_in(self, address, value, mask, force=False):
+        """Return the error code after setting an OK WireIn value.
+
+        Sent right away with UpdateWireIns, or held until the end of a batch()
+        block. A shadow copy of the WireIns is kept, and a write that would
+        not change any bits of it is skipped unless force is True.
+        """
+
+        value &= mask
+        shadow = self._wire_ins.get(address)
+        if shadow is None:
+            self._wire_ins[address] = (value, mask)
+        else:
+            shadow_value, shadow_mask = shadow
+            if not force and (mask & ~shadow_mask) == 0 and (shadow_value ^ value) & mask == 0:
+                return 0  # NoError, the WireIn already holds value
+            self._wire_ins[address] = ((shadow_value & ~mask) | value, shadow_mask | mask)
+
+        if self._batch_depth == 0:
+            error_code = self.xem.SetWireInValue(address, value, mask)
+            self.xem.UpdateWireIns()
+            return error_code
+
+        pending = self._pending_wire_ins.get(address)
+        if pending is not None and (pending[0] ^ value) & pending[1] & mask:
+            # This write changes bits that have not been sent yet, send those first
+            self.flush()
+            pending = None
+        error_code = self.xem.SetWireInValue(address, value, mask)
+        if pending is None:
+            self._pending_wire_ins[address] = (value & mask, mask)
+        else:
+            self._pending_wire_ins[address] = ((pending[0] & ~mask) | (value & mask), pending[1] | mask)
+        return error_code
+
     def read_pipe_out(self, addr, data_len=1024):
         """Return the filled buffer and error code after reading an OK PipeOut.
             data_len is length in bytes (must be multiple of 16)
             returns: bytearray; error code
         """
+        self.flush()
         buf = bytearray(data_len)
         e = self.xem.ReadFromPipeOut(addr, buf)
         # print('read_pipe_out:', addr, buf)
@@ -597,63 +1288,54 @@ class FPGA:
             print('Error code {}'.format(e))
         return buf, e
 
-    def set_wire(self, address, value, mask=0xFFFFFFFF):
-        """Return the error code after setting an OK WireIn value."""
+    def set_wire(self, address, value, mask=0xFFFFFFFF, force=False):
+        """Return the error code after setting an OK WireIn value.
+
+        The write is skipped if the masked bits already hold value, unless
+        force is True. See resync.
+        """
         if self.debug:
             print(
                 f'set_wire(address={hex(address)}, value={hex(value)}, mask={hex(mask)})')
-        error_code = self.xem.SetWireInValue(address, value, mask)
-        self.xem.UpdateWireIns()
-        return error_code
+        return self._write_wire_in(address, value, mask, force)
 
     def read_wire(self, address):
         """Return the read data after reading an OK WireOut."""
 
-        self.xem.UpdateWireOuts()
+        self.update_wire_outs()
         return self.xem.GetWireOutValue(address)
 
-    def set_endpoint(self, ep_bit):
+    def set_endpoint(self, ep_bit, force=False):
         """Set all bits in an Endpoint high."""
 
-        mask = gen_mask(
-            list(range(ep_bit.bit_index_low, ep_bit.bit_index_high + 1)))
+        mask = FPGA._wire_mask(ep_bit)
         if self.debug:
             print(
                 f'set_endpoint(address={hex(ep_bit.address)}, value={hex(mask)}, mask={hex(mask)})')
-        self.xem.SetWireInValue(ep_bit.address, mask, mask)  # set
-        self.xem.UpdateWireIns()
+        self._write_wire_in(ep_bit.address, mask, mask, force)  # set
 
-    def clear_endpoint(self, ep_bit):
+    def clear_endpoint(self, ep_bit, force=False):
         """Set all bits in an Endpoint low."""
 
-        mask = gen_mask(
-            list(range(ep_bit.bit_index_low, ep_bit.bit_index_high + 1)))
+        mask = FPGA._wire_mask(ep_bit)
         if self.debug:
             print(
                 f'clear_endpoint(address={hex(ep_bit.address)}, value={hex(0)}, mask={hex(mask)})')
-        self.xem.SetWireInValue(ep_bit.address, 0x0000, mask)  # clear
-        self.xem.UpdateWireIns()
+        self._write_wire_in(ep_bit.address, 0x0000, mask, force)  # clear
 
     def toggle_low(self, ep_bit):
         """Toggle all bits in an Endpoint low then back to high."""
 
-        mask = gen_mask(
-            list(range(ep_bit.bit_index_low, ep_bit.bit_index_high + 1)))
-        self.xem.SetWireInValue(
-            ep_bit.address, 0x0000, mask)  # toggle low
-        self.xem.UpdateWireIns()
-        self.xem.SetWireInValue(ep_bit.address, mask, mask)   # back high
-        self.xem.UpdateWireIns()
+        mask = FPGA._wire_mask(ep_bit)
+        self._write_wire_in(ep_bit.address, 0x0000, mask, force=True)  # toggle low
+        self._write_wire_in(ep_bit.address, mask, mask, force=True)   # back high
 
     def toggle_high(self, ep_bit):
         """Toggle all bits in an Endpoint high then back to low."""
 
-        mask = gen_mask(
-            list(range(ep_bit.bit_index_low, ep_bit.bit_index_high + 1)))
-        self.xem.SetWireInValue(ep_bit.address, mask, mask)  # toggle high
-        self.xem.UpdateWireIns()
-        self.xem.SetWireInValue(ep_bit.address, 0x0000, mask)   # back low
-        self.xem.UpdateWireIns()
+        mask = FPGA._wire_mask(ep_bit)
+        self._write_wire_in(ep_bit.address, mask, mask, force=True)  # toggle high
+        self._write_wire_in(ep_bit.address, 0x0000, mask, force=True)   # back low
 
     def send_trig(self, ep_bit):
         """Return the error code after activating an OK TriggerIn Endpoint.
@@ -663,6 +1345,7 @@ class FPGA:
         """
 
         # print(f'send_trig(address={hex(ep_bit.address)},bit={ep_bit.bit_index_low})')
+        self.flush()
         return self.xem.ActivateTriggerIn(ep_bit.address, ep_bit.bit_index_low)
 
     def read_trig(self, ep_bit):
@@ -680,32 +1363,32 @@ class FPGA:
             Whether the TriggerOut has been triggered.
         """
 
-        self.xem.UpdateTriggerOuts()
+        self.update_trigger_outs()
         return self.xem.IsTriggered(ep_bit.address, (1 << ep_bit.bit_index_low))
 
     def read_ep(self, ep_bit):
         """Return the error code after reading an OK WireOut Endpoint."""
-        self.xem.UpdateWireOuts()
+        self.update_wire_outs()
         read_out = self.xem.GetWireOutValue(ep_bit.address)
         return read_out
 
-    def set_wire_bit(self, address, bit):
+    def set_wire_bit(self, address, bit, force=False):
         """Set a single bit to 1 in a OpalKelly wire in."""
 
         if self.debug:
             print(
                 f'set_wire_bit(address={hex(address)},value={hex(1 << bit)},mask={hex(1 << bit)})')
-        return self.set_wire(address, value=1 << bit, mask=1 << bit)
+        return self.set_wire(address, value=1 << bit, mask=1 << bit, force=force)
 
-    def clear_wire_bit(self, address, bit):
+    def clear_wire_bit(self, address, bit, force=False):
         """Clear a single bit to 0 in a OpalKelly wire in."""
         if self.debug:
             print(
                 f'clear_wire_bit(address={hex(address)},value={hex(1 << bit)},mask={hex(1 << bit)})')
 
-        return self.set_wire(address, value=0, mask=1 << bit)
+        return self.set_wire(address, value=0, mask=1 << bit, force=force)
 
-    def set_ep_simultaneous(self, address, bit_list, val_list):
+    def set_ep_simultaneous(self, address, bit_list, val_list, force=False):
         """ set multiple values to the wire of a single endpoint"""
         value = 0
         mask = 0
@@ -716,7 +1399,7 @@ class FPGA:
             print(
                 f'Simultaneous wire write (address={hex(address)},value={hex(value)},mask={hex(mask)})')
 
-        return self.set_wire(address, value=value, mask=mask)
+        return self.set_wire(address, value=value, mask=mask, force=force)
 
 
     def read_wire_bit(self, address, bit):
@@ -725,6 +1408,107 @@ class FPGA:
         return (value & (1 << bit)) >> bit
 
 
+class EndpointHandle:
+    """An Endpoint bound to an FPGA for repeated access with little overhead.
+
+    The address, mask, and shift are looked up once when the handle is
+    created, so each method goes almost directly to the FPGA's xem. Writes
+    take part in FPGA.batch blocks like the FPGA methods do. Get a handle
+    with FPGA.handle. Unlike the FPGA methods, handles do not print when the
+    FPGA's debug is True.
+
+    Attributes
+    ----------
+    fpga : FPGA
+        The FPGA the Endpoint is on.
+    endpoint : Endpoint
+        The Endpoint this handle accesses.
+    """
+
+    __slots__ = ('fpga', 'endpoint', 'address', 'mask', 'shift')
+
+    # Opal Kelly endpoint address ranges
+    TRIGGER_IN_ADDRESSES = range(0x40, 0x60)
+    TRIGGER_OUT_ADDRESSES = range(0x60, 0x80)
+
+    def __init__(self, fpga, endpoint):
+        self.fpga = fpga
+        self.endpoint = endpoint
+        self.address = endpoint.address
+        self.mask = endpoint.mask
+        self.shift = endpoint.shift
+
+    def set(self, value=None, force=False):
+        """Write value into the Endpoint's bits of a WireIn, or set all of them high if value is None."""
+
+        if value is None:
+            self.fpga._write_wire_in(self.address, self.mask, self.mask, force)
+        else:
+            self.fpga._write_wire_in(self.address, (value << self.shift) & self.mask, self.mask, force)
+
+    def clear(self, force=False):
+        """Set all of the Endpoint's bits of a WireIn low."""
+
+        self.fpga._write_wire_in(self.address, 0, self.mask, force)
+
+    def pulse(self):
+        """Activate a TriggerIn, or toggle the bits of a WireIn high then back low.
+
+        Returns
+        -------
+        int : the error code of the TriggerIn activation, or None for a WireIn.
+        """
+
+        fpga = self.fpga
+        if self.address in EndpointHandle.TRIGGER_IN_ADDRESSES:
+            fpga.flush()
+            return fpga.xem.ActivateTriggerIn(self.address, self.shift)
+        fpga._write_wire_in(self.address, self.mask, self.mask, force=True)
+        fpga._write_wire_in(self.address, 0, self.mask, force=True)
+
+    def read(self):
+        """Read the Endpoint.
+
+        Returns
+        -------
+        int or bool : the value in the Endpoint's bits of a WireOut, or
+            whether a TriggerOut has been triggered.
+        """
+
+        fpga = self.fpga
+        if self.address in EndpointHandle.TRIGGER_OUT_ADDRESSES:
+            fpga.update_trigger_outs()
+            return fpga.xem.IsTriggered(self.address, self.mask)
+        fpga.update_wire_outs()
+        return (fpga.xem.GetWireOutValue(self.address) & self.mask) >> self.shift
+
+
+def warm(ep_defines_path=configs['ep_defines_path'], registers_path=configs['registers_path']):
+    """Load the Endpoint and Register caches ahead of first use.
+
+    Long-running services can call this at startup so that the first FPGA or
+    peripheral they create does not pay for reading ep_defines.v or the
+    register workbook. Paths that are None are skipped.
+
+    Parameters
+    ----------
+    ep_defines_path : str
+        Path to ep_defines.v. Defaults to ep_defines_path from config.yaml.
+    registers_path : str
+        Path to the register workbook. Defaults to registers_path from config.yaml.
+
+    Returns
+    -------
+    dict : Endpoint.endpoints_from_defines after loading.
+    """
+
+    if ep_defines_path is not None:
+        Endpoint.update_endpoints_from_defines(ep_defines_path)
+    if registers_path is not None:
+        Register.compile_workbook(registers_path)
+    return Endpoint.endpoints_from_defines
+
+
 # TODO: should there be a 'device' or similar class that all controllers are subclasses of?
 def disp_device(dev, reg=True):
     """Display endpoints and registers for a chip.
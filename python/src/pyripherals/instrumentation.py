@@ -0,0 +1,323 @@
+"""Module to measure the FrontPanel API calls made by the FPGA and peripherals.
+
+Instrumentation is opt in. FPGA.enable_instrumentation wraps fpga.xem in an
+InstrumentedFrontPanel that times every call and passes it on to the device.
+When instrumentation is not enabled fpga.xem is the device itself, so there is
+no overhead.
+
+Example usage:
+    f = FPGA()
+    f.init_device()
+    stats = f.enable_instrumentation()
+    adc.read()
+    print(stats.to_json())
+    f.disable_instrumentation()
+
+Each call is attributed to the peripheral class and method that made it, the
+first caller that is not part of FPGA or EndpointHandle, such as
+'DDR3.write_channels'. Calls made outside a class are attributed to the module
+and function, such as '__main__.<module>'.
+"""
+
+import contextlib
+import json
+import sys
+import time
+from collections import defaultdict, namedtuple
+
+
+# Calls that move a buffer given as their data argument
+PIPE_APIS = ('WriteToPipeIn', 'ReadFromPipeOut', 'WriteToBlockPipeIn', 'ReadFromBlockPipeOut')
+# Calls that only use the host's copy of the endpoints, without a USB transaction
+HOST_APIS = ('SetWireInValue', 'GetWireInValue', 'GetWireOutValue', 'IsTriggered', 'IsOpen')
+REGISTER_SIZE = 4  # Bytes in a WriteRegister or ReadRegister value
+DEVICE_INFO_FIELDS = ('productName', 'deviceMajorVersion', 'deviceMinorVersion',
+                      'serialNumber', 'deviceID', 'usbSpeed')
+
+# One FrontPanel call, with its arguments and result as given by encode_value
+CallRecord = namedtuple('CallRecord', ['api', 'args', 'kwargs', 'result', 'seconds', 'caller'])
+
+
+def encode_value(value, payloads=False):
+    """Return an argument or result of a FrontPanel call as plain values.
+
+    Buffers become bytes, or their length in bytes when payloads is False.
+    Register entries become a list of (address, data) and device information
+    a dict. Numbers, strings, and None are unchanged.
+    """
+
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    if isinstance(value, (bytearray, memoryview)) or hasattr(value, '__array_interface__'):
+        view = memoryview(value).cast('B')
+        return bytes(view) if payloads else view.nbytes
+    if hasattr(value, 'productName'):
+        return {field: getattr(value, field) for field in DEVICE_INFO_FIELDS}
+    try:
+        return [(reg.address, reg.data) for reg in value]
+    except (TypeError, AttributeError):
+        return repr(value)
+
+
+def call_bytes(api, args, kwargs):
+    """Return the number of bytes a FrontPanel call moves over USB.
+
+    Wire and trigger calls are counted as zero since the FrontPanel moves all
+    of the WireIns, WireOuts, or TriggerOuts in each Update call regardless of
+    how many were set.
+    """
+
+    if api in PIPE_APIS:
+        data = kwargs['data'] if 'data' in kwargs else args[-1]
+        return memoryview(data).nbytes
+    if api in ('WriteRegister', 'ReadRegister'):
+        return REGISTER_SIZE
+    if api in ('WriteRegisters', 'ReadRegisters'):
+        regs = kwargs['regs'] if 'regs' in kwargs else args[0]
+        return REGISTER_SIZE * len(regs)
+    return 0
+
+
+def histogram_bucket(seconds):
+    """Return the latency histogram bucket for a call duration.
+
+    Bucket 0 holds calls under 2 us and bucket k > 0 holds calls from 2**k up
+    to 2**(k + 1) us.
+    """
+
+    return max(int(seconds * 1e6).bit_length() - 1, 0)
+
+
+def bucket_label(bucket):
+    """Return a readable microsecond range, such as '4-8us', for a histogram bucket."""
+
+    if bucket == 0:
+        return '<2us'
+    return '{}-{}us'.format(1 << bucket, 1 << (bucket + 1))
+
+
+class CostModel:
+    """Estimates how long FrontPanel calls take, for a dry run without hardware.
+
+    A call takes its latency plus the bytes it moves divided by the bandwidth.
+    Calls in HOST_APIS take no time. The defaults are rough figures for a
+    USB 3.0 XEM7310; measure the real ones with FPGA.enable_instrumentation.
+
+    Attributes
+    ----------
+    latency : float
+        Seconds for each USB transaction.
+    api_latency : dict
+        API name to seconds, for calls that differ from latency.
+    bandwidth : float
+        Bytes per second moved by pipes and registers.
+    """
+
+    def __init__(self, latency=100e-6, api_latency=None, bandwidth=300e6):
+        self.latency = latency
+        self.api_latency = {'ConfigureFPGA': 0.5} if api_latency is None else api_latency
+        self.bandwidth = bandwidth
+
+    def seconds(self, api, nbytes):
+        """Return the estimated duration of a call moving nbytes."""
+
+        if api in HOST_APIS:
+            return 0.0
+        return self.api_latency.get(api, self.latency) + nbytes / self.bandwidth
+
+
+class CallStats:
+    """Totals for one FrontPanel API, or one API from one caller.
+
+    Attributes
+    ----------
+    count : int
+        Number of calls.
+    bytes : int
+        Bytes moved by the calls, see call_bytes.
+    seconds : float
+        Total time spent in the calls.
+    histogram : dict
+        Histogram bucket to number of calls, see histogram_bucket.
+    """
+
+    __slots__ = ('count', 'bytes', 'seconds', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.histogram = defaultdict(int)
+
+    def add(self, nbytes, seconds):
+        self.count += 1
+        self.bytes += nbytes
+        self.seconds += seconds
+        self.histogram[histogram_bucket(seconds)] += 1
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'bytes': self.bytes,
+            'seconds': self.seconds,
+            'histogram': {bucket_label(b): self.histogram[b] for b in sorted(self.histogram)},
+        }
+
+
+class Instrumentation:
+    """Collects statistics for the calls made through an InstrumentedFrontPanel.
+
+    Attributes
+    ----------
+    attribute_callers : bool
+        Whether to find the calling peripheral for each call. Finding it walks
+        the stack, so turn it off for the lowest overhead.
+    cost_model : CostModel
+        If given, record the durations estimated by the model rather than
+        those measured, as FPGA.dry_run does.
+    calls : list
+        A CallRecord for each call, in order, if keep_calls was given, such
+        as for pyripherals.lint. Otherwise None.
+    apis : dict
+        API name to CallStats.
+    callers : dict
+        Caller name to a dict of API name to CallStats.
+    """
+
+    # Methods of these classes only pass calls on for a caller
+    PASS_THROUGH_CLASSES = ('FPGA', 'EndpointHandle', 'InstrumentedFrontPanel')
+    # Code in these files only passes calls on, such as the exit of FPGA.batch
+    PASS_THROUGH_FILES = (contextlib.__file__,)
+
+    def __init__(self, attribute_callers=True, cost_model=None, keep_calls=False):
+        self.attribute_callers = attribute_callers
+        self.cost_model = cost_model
+        self.calls = [] if keep_calls else None
+        self.reset()
+
+    def reset(self):
+        """Clear all statistics."""
+
+        self.apis = defaultdict(CallStats)
+        self.callers = defaultdict(lambda: defaultdict(CallStats))
+        if self.calls is not None:
+            self.calls = []
+
+    @classmethod
+    def find_caller(cls, depth=2):
+        """Return the name of the first caller outside FPGA, EndpointHandle, and contextlib.
+
+        Parameters
+        ----------
+        depth : int
+            Number of frames to skip, starting from the caller of find_caller.
+        """
+
+        frame = sys._getframe(depth)
+        while frame is not None:
+            if frame.f_code.co_filename in cls.PASS_THROUGH_FILES:
+                frame = frame.f_back
+                continue
+            instance = frame.f_locals.get('self')
+            if instance is None:
+                return '{}.{}'.format(frame.f_globals.get('__name__', '?'), frame.f_code.co_name)
+            name = type(instance).__name__
+            if name not in cls.PASS_THROUGH_CLASSES:
+                return '{}.{}'.format(name, frame.f_code.co_name)
+            frame = frame.f_back
+        return '?'
+
+    def record(self, api, args, kwargs, result, seconds):
+        """Record one call. Called by InstrumentedFrontPanel after each call returns."""
+
+        nbytes = call_bytes(api, args, kwargs)
+        if self.cost_model is not None:
+            seconds = self.cost_model.seconds(api, nbytes)
+        self.apis[api].add(nbytes, seconds)
+        caller = None
+        if self.attribute_callers:
+            # Skip record and the InstrumentedFrontPanel wrapper
+            caller = self.find_caller(depth=3)
+            self.callers[caller][api].add(nbytes, seconds)
+        if self.calls is not None:
+            self.calls.append(CallRecord(api,
+                                         tuple(encode_value(arg) for arg in args),
+                                         {key: encode_value(arg) for key, arg in kwargs.items()},
+                                         encode_value(result),
+                                         seconds,
+                                         caller))
+
+    def report(self):
+        """Return the statistics as a dict of plain values.
+
+        Returns
+        -------
+        dict
+            'apis' maps API name to count, bytes, seconds and histogram, and
+            'callers' maps caller name to the same for each API it called.
+            Both are sorted by time spent, largest first. 'total' has the
+            count, bytes, and seconds of all calls, and the number of
+            transactions, the calls not in HOST_APIS.
+        """
+
+        def by_time(stats):
+            return dict(sorted(((api, s.to_dict()) for api, s in stats.items()),
+                               key=lambda item: item[1]['seconds'], reverse=True))
+
+        callers = {caller: by_time(apis) for caller, apis in self.callers.items()}
+        callers = dict(sorted(callers.items(),
+                              key=lambda item: sum(s['seconds'] for s in item[1].values()),
+                              reverse=True))
+        total = {
+            'count': sum(s.count for s in self.apis.values()),
+            'transactions': sum(s.count for api, s in self.apis.items() if api not in HOST_APIS),
+            'bytes': sum(s.bytes for s in self.apis.values()),
+            'seconds': sum(s.seconds for s in self.apis.values()),
+        }
+        return {'apis': by_time(self.apis), 'callers': callers, 'total': total}
+
+    def to_json(self, path=None, indent=2):
+        """Return the report as JSON, and write it to path if given."""
+
+        text = json.dumps(self.report(), indent=indent)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+
+class InstrumentedFrontPanel:
+    """Wraps an okCFrontPanel and records every method call.
+
+    Attributes that are not methods, such as the NoError error code, are
+    passed through unchanged.
+
+    Attributes
+    ----------
+    frontpanel : ok.okCFrontPanel
+        The wrapped device.
+    instrumentation : Instrumentation
+        Receives a record of each call.
+    """
+
+    def __init__(self, frontpanel, instrumentation):
+        self.frontpanel = frontpanel
+        self.instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        attr = getattr(self.frontpanel, name)
+        if not callable(attr):
+            return attr
+        record = self.instrumentation.record
+        perf_counter = time.perf_counter
+
+        def call(*args, **kwargs):
+            start = perf_counter()
+            result = attr(*args, **kwargs)
+            record(name, args, kwargs, result, perf_counter() - start)
+            return result
+
+        call.__name__ = name
+        # Later lookups find the wrapper without calling __getattr__
+        setattr(self, name, call)
+        return call
@@ -0,0 +1,240 @@
+"""Module to find FrontPanel calls that could be removed or merged.
+
+lint checks a sequence of CallRecords, from a trace file or from an
+Instrumentation created with keep_calls=True, and returns a Finding for each
+call that wasted USB round trips. rank_call_sites totals the findings by the
+peripheral method that made the calls.
+
+Example usage:
+    stats = f.enable_instrumentation(Instrumentation(keep_calls=True))
+    dac.write_voltage(1.2)
+    findings = lint(stats.calls)
+    rank_call_sites(findings)
+
+    lint(read_trace('session.trace'))
+
+The rules are:
+
+redundant-set-wire-in
+    SetWireInValue of bits that already hold the value. Costs no round trip
+    itself but may make an UpdateWireIns redundant.
+redundant-update-wire-ins
+    UpdateWireIns that sends no changed bits.
+mergeable-update-wire-ins
+    UpdateWireIns following another with no USB transaction between them and
+    no bit set by both, which could have been sent together, as in
+    FPGA.batch.
+repeated-wire-outs
+    UpdateWireOuts with no USB transaction, such as a trigger, since the last
+    one, that read the same values, as FPGA.snapshot avoids.
+repeated-wb-address
+    A Wishbone command selecting the address already selected, as from
+    SPIController.wb_set_address. Needs callers in the records.
+known-register-read
+    ReadRegister of a value the host already knows, wrote or read, followed
+    by a write of that register.
+
+The rules know only the calls, so a finding is a candidate: a WireOut polled
+for a change that has not come yet is reported as repeated-wire-outs.
+"""
+
+from collections import namedtuple, defaultdict
+
+from .instrumentation import HOST_APIS
+
+Finding = namedtuple('Finding', ['index', 'rule', 'api', 'caller', 'wasted', 'message'])
+
+WB_COMMAND_MASK = 0xC0000000
+WB_SET_ADDRESS = 0x80000000  # From SPIController
+WB_CALLER = '.wb_send_cmd'
+
+
+def _arg(record, position, name, default=None):
+    """Return an argument of a CallRecord given by position or keyword."""
+
+    if len(record.args) > position:
+        return record.args[position]
+    return record.kwargs.get(name, default)
+
+
+def lint(calls):
+    """Return a Finding for each call in a sequence that wasted round trips.
+
+    Parameters
+    ----------
+    calls : iterable of pyripherals.instrumentation.CallRecord
+        The calls in the order they were made.
+
+    Returns
+    -------
+    list of Finding
+        Sorted by index, the position of the call in the sequence. wasted is
+        the number of USB round trips the call could have saved.
+    """
+
+    findings = []
+
+    # WireIns: address to (value, mask of known bits)
+    host_wire_ins = dict()
+    device_wire_ins = dict()
+    pending_masks = defaultdict(int)  # Bits set since the last UpdateWireIns
+    sent_masks = dict()  # Bits sent by the last UpdateWireIns, and any merged into it
+    transaction_since_update = True
+
+    # WireOuts
+    previous_wire_outs = None  # Values read after the UpdateWireOuts before last
+    current_wire_outs = None  # Values read after the last UpdateWireOuts
+    candidate = None  # Finding for the last UpdateWireOuts if its values repeat
+    transaction_since_wire_outs = True
+
+    # Wishbone: trigger (address, bit) to WireIn address and selected address
+    wb_wires = dict()
+    wb_selected = dict()
+    wb_wire = None
+    wb_updated = False
+
+    # Registers
+    registers = dict()
+    register_reads = dict()  # Address to Finding of a read not yet followed by a write
+
+    def finish_wire_outs():
+        if candidate is None:
+            return
+        shared = set(previous_wire_outs) & set(current_wire_outs)
+        if all(previous_wire_outs[a] == current_wire_outs[a] for a in shared):
+            findings.append(candidate)
+
+    for index, record in enumerate(calls):
+        api = record.api
+        if api not in HOST_APIS and api != 'UpdateWireOuts':
+            transaction_since_wire_outs = True
+        wb_call = record.caller is not None and record.caller.endswith(WB_CALLER)
+
+        if api == 'SetWireInValue':
+            address = _arg(record, 0, 'ep')
+            value = _arg(record, 1, 'val')
+            mask = _arg(record, 2, 'mask', 0xFFFFFFFF) & 0xFFFFFFFF
+            old, known = host_wire_ins.get(address, (0, 0))
+            if mask & ~known == 0 and (value ^ old) & mask == 0:
+                findings.append(Finding(index, 'redundant-set-wire-in', api, record.caller, 0,
+                                        'WireIn 0x{:02X} bits 0x{:08X} already hold 0x{:08X}'.format(
+                                            address, mask, value & mask)))
+            host_wire_ins[address] = ((old & ~mask) | (value & mask), known | mask)
+            pending_masks[address] |= mask
+            if wb_call:
+                wb_wire = address
+
+        elif api == 'UpdateWireIns':
+            changed = False
+            for address, mask in pending_masks.items():
+                value, _ = host_wire_ins[address]
+                old, known = device_wire_ins.get(address, (0, 0))
+                if mask & ~known or (value ^ old) & mask:
+                    changed = True
+            if not changed:
+                findings.append(Finding(index, 'redundant-update-wire-ins', api, record.caller, 1,
+                                        'UpdateWireIns sends no changed WireIn bits'))
+            elif not transaction_since_update and not any(
+                    sent_masks.get(address, 0) & mask for address, mask in pending_masks.items()):
+                findings.append(Finding(index, 'mergeable-update-wire-ins', api, record.caller, 1,
+                                        'UpdateWireIns could be sent with the one before it'))
+                for address, mask in pending_masks.items():
+                    sent_masks[address] = sent_masks.get(address, 0) | mask
+            else:
+                sent_masks = dict(pending_masks)
+            device_wire_ins = dict(host_wire_ins)
+            pending_masks.clear()
+            transaction_since_update = False
+            wb_updated = wb_call
+            continue
+
+        elif api == 'UpdateWireOuts':
+            finish_wire_outs()
+            candidate = None
+            if not transaction_since_wire_outs:
+                candidate = Finding(index, 'repeated-wire-outs', api, record.caller, 1,
+                                    'UpdateWireOuts with no transaction since the last one')
+            previous_wire_outs, current_wire_outs = current_wire_outs, dict()
+            transaction_since_wire_outs = False
+
+        elif api == 'GetWireOutValue':
+            if current_wire_outs is not None:
+                current_wire_outs[_arg(record, 0, 'ep')] = record.result
+
+        elif api == 'ActivateTriggerIn' and wb_call:
+            trigger = (_arg(record, 0, 'ep'), _arg(record, 1, 'bit'))
+            if wb_wire is not None:
+                wb_wires[trigger] = wb_wire
+            wire = wb_wires.get(trigger)
+            value, known = device_wire_ins.get(wire, (0, 0))
+            if wire is not None and known & WB_COMMAND_MASK == WB_COMMAND_MASK \
+                    and value & WB_COMMAND_MASK == WB_SET_ADDRESS:
+                if wb_selected.get(trigger) == value:
+                    findings.append(Finding(index, 'repeated-wb-address', api, record.caller, 1 + wb_updated,
+                                            'Wishbone address command 0x{:08X} is already selected'.format(value)))
+                wb_selected[trigger] = value
+            wb_wire = None
+
+        elif api == 'ReadRegister':
+            address = _arg(record, 0, 'addr')
+            if registers.get(address) == record.result:
+                register_reads[address] = Finding(index, 'known-register-read', api, record.caller, 1,
+                                                  'Register 0x{:X} read while its value is known'.format(address))
+            else:
+                register_reads.pop(address, None)
+            registers[address] = record.result
+
+        elif api in ('WriteRegister', 'WriteRegisters', 'ReadRegisters'):
+            if api == 'WriteRegister':
+                entries = [(_arg(record, 0, 'addr'), _arg(record, 1, 'data'))]
+            else:
+                entries = _arg(record, 0, 'regs', [])
+            for address, data in entries:
+                if api == 'ReadRegisters':
+                    register_reads.pop(address, None)
+                elif address in register_reads:
+                    findings.append(register_reads.pop(address))
+                registers[address] = data & 0xFFFFFFFF
+
+        elif api == 'ConfigureFPGA':
+            # The new configuration resets the device
+            device_wire_ins.clear()
+            wb_selected.clear()
+            registers.clear()
+            register_reads.clear()
+
+        if api not in HOST_APIS:
+            transaction_since_update = True
+            wb_updated = False
+
+    finish_wire_outs()
+    findings.sort(key=lambda finding: finding.index)
+    return findings
+
+
+def rank_call_sites(findings):
+    """Return the callers of the calls in findings, ranked by round trips wasted.
+
+    Parameters
+    ----------
+    findings : list of Finding
+        From lint.
+
+    Returns
+    -------
+    list of dict
+        For each caller, 'caller', 'wasted' round trips, number of
+        'findings', and 'rules' mapping rule to number of findings. Sorted
+        by wasted, largest first.
+    """
+
+    sites = dict()
+    for finding in findings:
+        site = sites.setdefault(finding.caller, {'caller': finding.caller, 'wasted': 0,
+                                                 'findings': 0, 'rules': defaultdict(int)})
+        site['wasted'] += finding.wasted
+        site['findings'] += 1
+        site['rules'][finding.rule] += 1
+    for site in sites.values():
+        site['rules'] = dict(site['rules'])
+    return sorted(sites.values(), key=lambda site: (site['wasted'], site['findings']), reverse=True)
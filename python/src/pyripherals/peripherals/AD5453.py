@@ -80,8 +80,7 @@ class AD5453(SPIFifoDriven):
         loop_thru = np.arange(self.filter_offset, 1
                               + self.filter_offset + self.filter_len)
 
-        # ok should already be imported from Endpoint import
-        regs = ok.okTRegisterEntries((len(loop_thru)))
+        regs = self.fpga.backend.okTRegisterEntries((len(loop_thru)))
 
         for i in loop_thru:  # TODO is this correct? and how to parameterize?
             if (i-self.filter_offset) in self.filter_coeff:
@@ -102,14 +101,15 @@ class AD5453(SPIFifoDriven):
         debug wires available for filters 0, 1
         """
 
-        debug_coeff_0 = self.fpga.read_wire(
-            self.endpoints[f'COEFF_DEBUG_0'].address)
-        debug_coeff_1 = self.fpga.read_wire(
-            self.endpoints[f'COEFF_DEBUG_1'].address)
-        debug_coeff_2 = self.fpga.read_wire(
-            self.endpoints[f'COEFF_DEBUG_2'].address)
-        debug_coeff_3 = self.fpga.read_wire(
-            self.endpoints[f'COEFF_DEBUG_3'].address)
+        with self.fpga.snapshot():
+            debug_coeff_0 = self.fpga.read_wire(
+                self.endpoints[f'COEFF_DEBUG_0'].address)
+            debug_coeff_1 = self.fpga.read_wire(
+                self.endpoints[f'COEFF_DEBUG_1'].address)
+            debug_coeff_2 = self.fpga.read_wire(
+                self.endpoints[f'COEFF_DEBUG_2'].address)
+            debug_coeff_3 = self.fpga.read_wire(
+                self.endpoints[f'COEFF_DEBUG_3'].address)
 
         print(f'Read Coefficients:')
         print('    0:', debug_coeff_0)
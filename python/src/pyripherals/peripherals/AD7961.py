@@ -1,7 +1,6 @@
 from ..core import Endpoint
 from ..utils import gen_mask
 from .ADCDATA import ADCDATA
-import copy
 import time
 
 class AD7961(ADCDATA):
@@ -44,11 +43,9 @@ class AD7961(ADCDATA):
         if endpoints is None:
             endpoints = Endpoint.endpoints_from_defines.get('AD7961')
 
-        chips = []
-        for i in range(number_of_chips):
-            # Use deepcopy here to keep the endpoints for different instances separate
-            chips.append(AD7961(fpga=fpga, endpoints=copy.deepcopy(endpoints)))
-            Endpoint.advance_endpoints(endpoints)
+        chips = [AD7961(fpga=fpga, endpoints=chip_endpoints)
+                 for chip_endpoints in Endpoint.for_instances(endpoints, number_of_chips)]
+        Endpoint.advance_endpoints(endpoints, number_of_chips)
         return chips
 
     def get_status(self):
@@ -57,8 +54,10 @@ class AD7961(ADCDATA):
 
         Returns: dictionary of status
         """
-        status = self.get_fifo_status()
-        pll_lock = self.get_pll_status()
+        # One WireOut and one TriggerOut update serve all of the flags
+        with self.fpga.snapshot():
+            status = self.get_fifo_status()
+            pll_lock = self.get_pll_status()
         status['pll_lock'] = pll_lock
         for k in status:
             print('{} status of {} = {}'.format(self.name,
@@ -82,7 +81,7 @@ class AD7961(ADCDATA):
 
         flags = ['FULL', 'HALFFULL', 'EMPTY']
         fifo_status = {}
-        self.fpga.xem.UpdateTriggerOuts()
+        self.fpga.update_trigger_outs()
         for k in flags:
             fifo_status[k] = self.fpga.xem.IsTriggered(self.endpoints['FIFO_{}'.format(k)].address,
                                                        self.endpoints['FIFO_{}'.format(k)].bit_index_low)
@@ -127,8 +126,7 @@ class AD7961(ADCDATA):
     def reset_pll(self):
         """Reset the phase locked loop."""
 
-        return self.fpga.xem.ActivateTriggerIn(self.endpoints['PLL_RESET'].address,
-                                               self.endpoints['PLL_RESET'].bit_index_low)
+        return self.fpga.send_trig(self.endpoints['PLL_RESET'])
 
     def reset_trig(self):
         """Reset the FPGA controller for the ADC.
@@ -137,8 +135,7 @@ class AD7961(ADCDATA):
         ads8686 timing) 
         """
 
-        return self.fpga.xem.ActivateTriggerIn(self.endpoints['RESET'].address,
-                                               self.endpoints['RESET'].bit_index_low)
+        return self.fpga.send_trig(self.endpoints['RESET'])
 
     def reset_wire(self, value):
         """Set the value of the wire to reset the FPGA controller for the ADC.
@@ -1,9 +1,64 @@
 from ..core import Endpoint
-from ..utils import test_bit, gen_mask, custom_signed_to_int
+from ..utils import test_bit, custom_signed_to_int
 import numpy as np
+import hashlib
+import math
+import queue
+import threading
 import time
 import os
-import h5py
+
+
+class ChannelBuffer():
+    """Channel arrays that are views into one interleaved uint16 buffer.
+
+    The buffer is not allocated until a channel is first used. Indexing
+    returns a channel's view, and assigning to an index copies the values
+    into the view, so the buffer is always ready to write to the DDR.
+
+    Attributes
+    ----------
+    num_channels : int
+        Number of channels interleaved in the buffer.
+    sample_size : int
+        Number of samples in each channel.
+    word_order : tuple
+        Position of each channel within a group of num_channels words.
+    """
+
+    def __init__(self, num_channels, sample_size, word_order=None):
+        self.num_channels = num_channels
+        self.sample_size = sample_size
+        self.word_order = tuple(range(num_channels)) if word_order is None else word_order
+        self._buffer = None
+
+    @property
+    def allocated(self):
+        """Whether the buffer has been allocated."""
+
+        return self._buffer is not None
+
+    @property
+    def buffer(self):
+        """The interleaved uint16 buffer, allocated as zeros on first use."""
+
+        if self._buffer is None:
+            self._buffer = np.zeros(self.num_channels * self.sample_size, dtype=np.uint16)
+        return self._buffer
+
+    def __len__(self):
+        return self.num_channels
+
+    def __getitem__(self, chan):
+        if not -self.num_channels <= chan < self.num_channels:
+            raise IndexError('channel {} out of range'.format(chan))
+        return self.buffer[self.word_order[chan]::self.num_channels]
+
+    def __setitem__(self, chan, value):
+        self[chan][:] = value
+
+    def __iter__(self):
+        return (self[chan] for chan in range(self.num_channels))
 
 
 class DDR3():
@@ -63,6 +118,15 @@ class DDR3():
     # need to write all the way up to this stoping point otherwise the SPI output will glitch
     SAMPLE_SIZE = int((PORT1_INDEX + 8)/4)
 
+    # The 16 bit word of each group of NUM_CHANNELS written to the DDR that holds each DAC channel.
+    # The 32 bit pipe swaps the order of each pair of words.
+    DAC_CHANNEL_WORDS = (6, 7, 4, 5, 2, 3, 0, 1)
+
+    # The 16 bit word of each DDR frame that holds each ADC channel, by data_version.
+    # Words are little-endian and the 32 bit pipe swaps their order in pairs.
+    CHANNEL_WORDS = {'ADC_NO_TIMESTAMPS': (2, 3, 0, 1),
+                     'TIMESTAMPS': (6, 7, 5, 4, 2, 3, 0, 1)}
+
     def __init__(self, fpga, endpoints=None, data_version='TIMESTAMPS'):
         if endpoints is None:
             endpoints = Endpoint.get_chip_endpoints('DDR3')
@@ -70,10 +134,10 @@ class DDR3():
         self.endpoints = endpoints
         self.data_version = data_version  # sets deswizzling mode
 
-        self.data_arrays = []
-        for i in range(DDR3.NUM_CHANNELS):
-            self.data_arrays.append(np.zeros(
-                DDR3.SAMPLE_SIZE).astype(np.uint16))
+        # DAC waveforms, only allocated when first used
+        self.data_arrays = ChannelBuffer(DDR3.NUM_CHANNELS, DDR3.SAMPLE_SIZE, DDR3.DAC_CHANNEL_WORDS)
+        self._stripe_buffer = None  # Reused by stripe_channels when data_arrays is a list
+        self._upload = None  # (fpga.configure_count, upload_hash) of the data written to the DDR
 
         self.clear_adc_debug()
 
@@ -156,9 +220,47 @@ class DDR3():
 
         return new_frequency
 
+    @staticmethod
+    def sine_into(out, amplitude, frequency, offset=0x2000):
+        """Fill a uint16 array with a sine wave, returning False if it does not fit in uint16.
+
+        When the wave fits a whole number of periods in out, as after
+        closest_frequency, only the shortest block that repeats is computed
+        and range checked, and it is tiled into out. Otherwise the whole
+        wave is computed.
+
+        Parameters
+        ----------
+        out : numpy.ndarray
+            uint16 destination, such as a channel of DDR3.data_arrays.
+        amplitude : int
+            Digital (binary) value of the sine wave.
+        frequency : float
+            Frequency in Hz.
+        offset : int
+            Digital (binary) value offset.
+        """
+
+        length = len(out)
+        if length == 0:
+            return True
+        block = length
+        periods = length * frequency * DDR3.UPDATE_PERIOD
+        whole_periods = int(round(periods))
+        if whole_periods > 0 and abs(periods - whole_periods) <= 1e-9 * periods:
+            block = length // math.gcd(length, whole_periods)
+
+        t = np.arange(block) * DDR3.UPDATE_PERIOD
+        wave = (amplitude)*np.sin(t*frequency*2*np.pi) + offset
+        if wave.min() < 0 or wave.max() > (2**16-1):
+            print('Error: Uint16 overflow in make sine wave')
+            return False
+        np.copyto(out.reshape(length // block, block), wave, casting='unsafe')
+        return True
+
     @staticmethod
     def make_sine_wave(amplitude, frequency,
-                       offset=0x2000, actual_frequency=True):
+                       offset=0x2000, actual_frequency=True, out=None):
         """Return a sine-wave array for writing to DDR.
 
         The conversion from float or int voltage to int digital (binary) code
@@ -174,6 +276,10 @@ class DDR3():
             Digital (binary) value offset.
         actual_frequency : bool
             Decide whether closest frequency that fits an integer number of periods is used.
+            One period is then computed and tiled, see sine_into.
+        out : numpy.ndarray
+            uint16 array of DDR3.SAMPLE_SIZE to write the wave into, such as
+            a channel of DDR3.data_arrays. A new array by default.
 
         Returns
         -------
@@ -190,19 +296,14 @@ class DDR3():
         if actual_frequency:
             frequency = DDR3.closest_frequency(frequency)
 
-        t = np.arange(0, DDR3.UPDATE_PERIOD*DDR3.SAMPLE_SIZE,
-                      DDR3.UPDATE_PERIOD)
-        # print('length of time axis after creation ', len(t))
-        ddr_seq = (amplitude)*np.sin(t*frequency*2*np.pi) + offset
-        if any(ddr_seq < 0) or any(ddr_seq > (2**16-1)):
-            print('Error: Uint16 overflow in make sine wave')
+        ddr_seq = np.empty(DDR3.SAMPLE_SIZE, dtype=np.uint16) if out is None else out
+        if not DDR3.sine_into(ddr_seq, amplitude, frequency, offset):
             return -1
-        ddr_seq = ddr_seq.astype(np.uint16)
         return ddr_seq, frequency
 
     @staticmethod
     def make_chirp(amplitude, frequencies, periods,
-                       offset=0x2000, actual_frequency=True):
+                       offset=0x2000, actual_frequency=True, out=None):
         """Return a chirp multiple sine-wave frequencies array for writing to DDR.
 
         The conversion from float or int voltage to int digital (binary) code
@@ -220,16 +321,20 @@ class DDR3():
             Digital (binary) value offset.
         actual_frequency : bool
             Decide whether closest frequency that fits an integer number of periods is used.
+            Each segment is then computed as one period that is tiled, see sine_into.
+        out : numpy.ndarray
+            uint16 array of DDR3.SAMPLE_SIZE to write the chirp into. A new
+            array by default.
 
         Returns
         -------
         ddr_seq : numpy.ndarray 
-            to be assigned to DDR data array  
+            uint16, to be assigned to DDR data array  
 
         frequencies : np.array (floats)
             actual frequencies after closest_frequency
         """
-        ddr_seq = np.zeros(DDR3.SAMPLE_SIZE)
+        ddr_seq = np.zeros(DDR3.SAMPLE_SIZE, dtype=np.uint16) if out is None else out
 
         if (amplitude) > offset:
             print('Error: amplitude in sine-wave is too large')
@@ -252,20 +357,13 @@ class DDR3():
 
             if actual_frequency:
                 frequency = DDR3.closest_frequency(frequency, chirp_length)
-            
 
-            t = np.arange(0, DDR3.UPDATE_PERIOD*chirp_length,
-                        DDR3.UPDATE_PERIOD)
-            # print('length of time axis after creation ', len(t))
-            ddr_seq_tmp = (amplitude)*np.sin(t*frequency*2*np.pi) + offset
-            if any(ddr_seq_tmp < 0) or any(ddr_seq_tmp > (2**16-1)):
-                print('Error: Uint16 overflow in make sine wave')
+            if not DDR3.sine_into(ddr_seq[idx_left:(idx_left + chirp_length)], amplitude, frequency, offset):
                 return -1
-            ddr_seq[idx_left:(idx_left + len(t))] = ddr_seq_tmp.astype(np.uint16)
             frequency_out.append(frequency)
-            indices.append((idx_left, idx_left + len(t)))
+            indices.append((idx_left, idx_left + chirp_length))
 
-            idx_left = idx_left + len(t)
+            idx_left = idx_left + chirp_length
         return ddr_seq, frequency_out, indices
 
 
@@ -345,38 +443,89 @@ class DDR3():
         ddr_seq = ddr_seq.astype(np.uint16)
         return ddr_seq
 
-    def write_channels(self, set_ddr_read=True):
-        """Write the channels as striped data to the DDR."""
+    def stripe_channels(self):
+        """Return the channels striped in DDR order as a memoryview of bytes.
+
+        The interleaved buffer of data_arrays is returned without a copy. If
+        data_arrays was replaced by a list of arrays they are striped into a
+        uint16 buffer that is kept for the next call.
+        """
 
-        data = np.zeros(
-            int(len(self.data_arrays[0])*DDR3.NUM_CHANNELS))
-        data = data.astype(np.uint16)
+        if isinstance(self.data_arrays, ChannelBuffer):
+            # The channels are already interleaved in the buffer
+            data = self.data_arrays.buffer
+        else:
+            length = len(self.data_arrays[0]) * DDR3.NUM_CHANNELS
+            if self._stripe_buffer is None or len(self._stripe_buffer) != length:
+                self._stripe_buffer = np.empty(length, dtype=np.uint16)
+            data = self._stripe_buffer
+            for i in range(DDR3.NUM_CHANNELS):
+                data[DDR3.DAC_CHANNEL_WORDS[i]::8] = self.data_arrays[i]  # extra order swap on the 32 bit wide pipe
+        return memoryview(data).cast('B')
+
+    def write_channels(self, set_ddr_read=True, force=False):
+        """Write the channels as striped data to the DDR.
+
+        Skipped if the DDR already holds the same data, see write_buf.
+        """
 
-        for i in range(DDR3.NUM_CHANNELS):
-            if i % 2 == 0:  # extra order swap on the 32 bit wide pipe
-                data[(7-i - 1)::8] = self.data_arrays[i]
-            else:
-                data[(7-i + 1)::8] = self.data_arrays[i]
+        buf = self.stripe_channels()
+        print('Length of data DDR data [2 byte words] = {}'.format(len(buf) // 2))
+        return self.write_buf(buf, set_ddr_read=set_ddr_read, force=force)
+
+    @staticmethod
+    def upload_hash(buf):
+        """Return a digest of the bytes in buf, used to skip writing the same data twice."""
+
+        return hashlib.sha1(memoryview(buf).cast('B')).digest()
+
+    def invalidate_upload(self):
+        """Forget which data the DDR holds so the next write_buf sends its data.
+
+        Call this after anything other than write_buf changes the DAC data
+        in the DDR. Loading a bitfile with init_device is detected without it.
+        """
 
-        print('Length of data DDR data [2 byte words] = {}'.format(len(data)))
-        return self.write_buf(bytearray(data), set_ddr_read=set_ddr_read)
+        self._upload = None
 
-    def write_buf(self, buf, set_ddr_read=True):
+    def write_buf(self, buf, set_ddr_read=True, force=False):
         """Write a bytearray to the DDR3.
 
+        A hash of the last data written is kept. If buf holds the same data
+        and no bitfile has been loaded since, the write is skipped and only
+        the read enables are set. reset_mig_interface, as in repeat_setup,
+        only moves the DDR address pointers and keeps the data. Data written
+        with force or inside FPGA.dry_run is not remembered, so the next
+        write sends its data.
+
         Parameters
         ----------
-        buf : bytearray
-            bytearray to write to the DDR
+        buf : bytearray or memoryview
+            bytes to write to the DDR
+        set_ddr_read : bool
+            Whether to enable DAC and ADC reads after the write.
+        force : bool
+            Write even if the DDR already holds the same data.
 
         Returns
         -------
         block_pipe_return : int
             length of the buffer written to the DDR (or error code if unsuccessful)
         speed_MBs : float
-            speed of the write in MB/s
+            speed of the write in MB/s, None if the write was skipped
         """
 
+        upload = None
+        if not force:
+            upload = (self.fpga.configure_count, DDR3.upload_hash(buf))
+        if upload is not None and upload == self._upload:
+            print('Skipped DDR write, the DDR already holds this data')
+            if set_ddr_read:
+                self.set_dac_read()
+                self.set_adc_read()
+            return len(buf), None
+        self._upload = None  # Unknown until the write completes
+
         print('Length of buffer being written to DDR [bytes]: ', len(buf))
         self.clear_dac_read()
         self.reset_fifo(name='DAC_IN')
@@ -388,6 +537,8 @@ class DDR3():
                                                              blockSize=DDR3.BLOCK_SIZE,
                                                              data=buf)
         print(f'The length of the DDR write was {block_pipe_return}')
+        if block_pipe_return == len(buf) and not self.fpga.dry_running:
+            self._upload = upload
 
         time2 = time.time()
         time3 = (time2-time1)
@@ -429,11 +580,9 @@ class DDR3():
                     print('{} = {}'.format(ep_name, val))
 
         ep_name = 'ADC_DATA_COUNT'
-        cnt_bit_low = self.endpoints[ep_name].bit_index_low
-        cnt_bit_width = self.endpoints[ep_name].bit_width
-        cnt_msk = gen_mask(np.arange(cnt_bit_low, cnt_bit_width))
-        fifo_status[ep_name] = (wire_status & cnt_msk) >> cnt_bit_low
-        print('{} = {}'.format(ep_name, val))
+        ep = self.endpoints[ep_name]
+        fifo_status[ep_name] = (wire_status & ep.mask) >> ep.shift
+        print('{} = {}'.format(ep_name, fifo_status[ep_name]))
 
         # self.print_fifo_status(fifo_status)
         return fifo_status
@@ -450,6 +599,12 @@ class DDR3():
         for k in fifo_status:
             print('{} = {}'.format(k, fifo_status[k]))
 
+    def adc_data_count(self):
+        """Return the ADC_DATA_COUNT level of the FIFO from the DDR to the ADC PipeOut."""
+
+        ep = self.endpoints['ADC_DATA_COUNT']
+        return (self.fpga.read_wire(ep.address) & ep.mask) >> ep.shift
+
     def set_dac_read(self):
         """Set DDR / FIFOs read enable. Enables DDR data going to the 
         DACs and ADC data into DDR
@@ -567,7 +722,7 @@ class DDR3():
                                self.endpoints['ADC_ADDR_SET'].bit_index_low)
         self.fpga.send_trig(self.endpoints['ADC_ADDR_RESET'])
 
-    def read_adc_block(self, sample_size=None, source='ADC', DEBUG_PRINT=False):
+    def read_adc_block(self, sample_size=None, source='ADC', DEBUG_PRINT=False, data_buf=None):
         """Read ADC (and other) DDR data. 
         Block size must be a power of two from 16 to 16384
         will automatically perform multiple transfers to complete the full LENGTH.
@@ -584,6 +739,8 @@ class DDR3():
             FIFO output buffer to read. Either 'ADC' or 'FG'. 'FG' just reads
             back what is written for DACs (as function generator) so not so
             useful.
+        data_buf : bytearray
+            Buffer to read into, of sample_size bytes. A new one by default.
 
         Returns
         -------
@@ -593,7 +750,9 @@ class DDR3():
             The count (or error code) read from the OpalKelly interface
         """
 
-        if sample_size is None:
+        if data_buf is not None:
+            pass
+        elif sample_size is None:
             data = np.zeros((DDR3.SAMPLE_SIZE,), dtype=int)
             data_buf = bytearray(data)
         else:
@@ -626,16 +785,31 @@ class DDR3():
                 f'The length [num of bytes] of the BlockPipeOut read is: {read_cnt}')
         return data_buf, read_cnt
 
+    @staticmethod
+    def frame_dtype(num_words):
+        """Return the structured dtype of one DDR frame of num_words little-endian uint16 words.
+
+        The fields are named 'w0' through 'w{num_words - 1}' in byte order.
+        """
+
+        return np.dtype([('w{}'.format(i), '<u2') for i in range(num_words)])
+
     def deswizzle(self, d, convert_twos=True):
         """Reorder DDR data to match the ADC channels. Shift MSBytes up by 8 
         and combine with LSBytes. Swap channels to match ADC channel numbering.
 
+        Bytes, such as from read_adc, are viewed as DDR frames without copying
+        and each channel is a uint16 view into d. Arrays with wider elements,
+        one byte per element as read_adc returned before, are combined with
+        shifts as before.
+
         Parameters
         ----------
-        d : array
+        d : bytearray or array
             array of bytes. 
         convert_twos : Boolean
-            if true converts data to signed
+            if true converts data to signed. Only the ADC_NO_TIMESTAMPS
+            data_version is converted, by viewing the channels as int16.
 
         Returns
         -------
@@ -643,6 +817,25 @@ class DDR3():
             dictionary of data arrays (keys are channel numbers)
 
         """
+
+        if np.asarray(d).dtype.itemsize != 1:
+            return self._deswizzle_shift(d, convert_twos)
+
+        words = DDR3.CHANNEL_WORDS[self.data_version]
+        frame_dtype = DDR3.frame_dtype(len(words))
+        frames = np.frombuffer(d, dtype=frame_dtype, count=len(d) // frame_dtype.itemsize)
+        chan_data = {}
+        for chan, word in enumerate(words):
+            chan_data[chan] = frames['w{}'.format(word)]
+            if convert_twos and self.data_version == 'ADC_NO_TIMESTAMPS':
+                chan_data[chan] = chan_data[chan].view(np.int16)
+        return chan_data
+
+    def _deswizzle_shift(self, d, convert_twos=True):
+        """Deswizzle an array with one byte per element by shifting and adding.
+
+        See deswizzle.
+        """
         bits = 16
         chan_data_swz = {}  # this data is swizzled
 
@@ -653,10 +846,8 @@ class DDR3():
                     (d[(1 + i * 2):: 8] << 8)
 
             chan_data = {}
-            chan_data[0] = chan_data_swz[2]
-            chan_data[1] = chan_data_swz[3]
-            chan_data[2] = chan_data_swz[0]
-            chan_data[3] = chan_data_swz[1]
+            for chan, word in enumerate(DDR3.CHANNEL_WORDS[self.data_version]):
+                chan_data[chan] = chan_data_swz[word]
             if convert_twos:
                 for i in range(4):
                     chan_data[i] = custom_signed_to_int(chan_data[i], bits)
@@ -668,18 +859,76 @@ class DDR3():
                     (d[(1 + i * 2):: 16] << 8)
 
             chan_data = {}
-            chan_data[0] = chan_data_swz[6]
-            chan_data[1] = chan_data_swz[7]
-            chan_data[2] = chan_data_swz[5]
-            chan_data[3] = chan_data_swz[4]
-
-            chan_data[4] = chan_data_swz[2]
-            chan_data[5] = chan_data_swz[3]
-            chan_data[6] = chan_data_swz[0]
-            chan_data[7] = chan_data_swz[1]
+            for chan, word in enumerate(DDR3.CHANNEL_WORDS[self.data_version]):
+                chan_data[chan] = chan_data_swz[word]
 
         return chan_data
 
+    @staticmethod
+    def decode_timestamps(chan_data, bitfile_version=2):
+        """Return the 48 bit timestamps held in three 16 bit words of every 5 DDR frames.
+
+        The timestamps are built in one preallocated uint64 array without
+        temporary arrays. The last, possibly incomplete, timestamp is dropped.
+
+        Parameters
+        ----------
+        chan_data : dict of np.arrays
+            data from deswizzle
+        bitfile_version : int
+            The bitfile version the data was created with. Before version 2
+            the least significant word is in channel 6 rather than 7.
+
+        Returns
+        -------
+        timestamp : np.ndarray
+            uint64 timestamps
+        """
+
+        if bitfile_version < 2: # 00.00.02 -> 2
+            lsb = chan_data[6][0::5]
+        else:
+            lsb = chan_data[7][1::5]
+        mid_b = chan_data[6][1::5]
+        msb = chan_data[7][2::5]
+        t_len = np.size(msb) - 1
+        timestamp = np.empty(max(t_len, 0), dtype=np.uint64)
+        # Horner form, msb << 32 | mid_b << 16 | lsb
+        timestamp[:] = msb[:t_len]
+        for word in (mid_b, lsb):
+            np.left_shift(timestamp, 16, out=timestamp)
+            np.add(timestamp, word[:t_len], out=timestamp, casting='unsafe')
+        return timestamp
+
+    @staticmethod
+    def signed16(data, out=None):
+        """Return 16 bit two's complement data as signed values.
+
+        Same values as custom_signed_to_int(data, 16). uint16 data is
+        returned as an int16 view without copying, unless out is given.
+        Other integer or float data that holds 16 bit values is widened to
+        a new int array.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            16 bit values.
+        out : np.ndarray
+            If given, the signed values are written into it and it is returned.
+        """
+
+        if data.dtype == np.uint16:
+            signed = data.view(np.int16)
+            if out is None:
+                return signed
+            out[:] = signed
+            return out
+        if out is None:
+            out = np.empty(len(data), dtype=int)
+        out[:] = data
+        out[out >= 0x8000] -= 0x10000
+        return out
+
     def data_to_names(self, chan_data, bitfile_version=None):
         """
         Put deswizzled data into dictionaries with names that match with the data sources. 
@@ -740,18 +989,10 @@ class DDR3():
 
             adc_data = {}
             for i in range(4):
-                # adc_data[i] = custom_signed_to_int(chan_data[i], 16)
                 adc_data[i] = chan_data[i]
 
-            if bitfile_version < 2: # 00.00.02 -> 2
-                lsb = chan_data[6][0::5].astype(np.uint64)
-            else:
-                lsb = chan_data[7][1::5].astype(np.uint64)
-            mid_b = ((chan_data[6][1::5].astype(np.uint64)) << 16)
-            msb = ((chan_data[7][2::5].astype(np.uint64)) << 32)
-            t_len = np.size(msb)
-            timestamp = (lsb[0:(t_len-1)] +
-                         mid_b[0:(t_len-1)] + msb[0:(t_len-1)])
+            # Each output is allocated once and filled in place from views of chan_data
+            timestamp = DDR3.decode_timestamps(chan_data, bitfile_version)
 
             read_check = {}
             read_check[0] = chan_data[7][3::10]
@@ -760,8 +1001,8 @@ class DDR3():
             read_check[3] = chan_data[7][9::10]
 
             ads_seq_cnt = {}
-            ads_seq_cnt[0] = (chan_data[7][4::10] & 0x001f)
-            ads_seq_cnt[1] = (chan_data[7][9::10] & 0x001f)
+            for i, seq in enumerate((chan_data[7][4::10], chan_data[7][9::10])):
+                ads_seq_cnt[i] = np.bitwise_and(seq, 0x001f, out=np.empty(len(seq), dtype=seq.dtype))
 
             dac_data = {}
             dac_data[0] = chan_data[4][0::2]
@@ -773,31 +1014,34 @@ class DDR3():
             dac_data[5] = chan_data[6][3::5] # observer at 1 MSPS - shifted by 200 ns 
             dac_data[6] = chan_data[6][4::5] # observer sampled at 1 MSPS - shifted by 200 ns twice 
             ads = {}
-            ads['A'] = custom_signed_to_int(chan_data[7][0::5], 16)
+            ads['A'] = DDR3.signed16(chan_data[7][0::5])
             if bitfile_version < 2: # 00.00.02 -> 2
-                ads['B'] = custom_signed_to_int(chan_data[7][1::5], 16)
+                ads['B'] = DDR3.signed16(chan_data[7][1::5])
             else:
-                ads['B'] = custom_signed_to_int(chan_data[6][0::5], 16) # cycle cnt 9 and 4
+                ads['B'] = DDR3.signed16(chan_data[6][0::5]) # cycle cnt 9 and 4
             error = False
             # check that the constant values are constant
             constant_values = {0: 0xaa55, 1: (0x28b<<5), 2: 0x77bb, 3: (0x28c<<5)}
             constant_value_mask = {0: 0xffff, 1: 0xffe0, 2: 0xffff, 3: 0xffe0}
             for i in range(4):
-                if not np.all( (read_check[i] & constant_value_mask[i]) == constant_values[i]):
+                num_errors = np.count_nonzero((read_check[i] & constant_value_mask[i]) != constant_values[i])
+                if num_errors:
                     print(f'Error in constant value: {constant_values[i]} ')
                     print(
-                        f'Number of errors: {np.sum(read_check[i] != constant_values[i])}')
+                        f'Number of errors: {num_errors}')
                     error = True
 
-            # check the timestamps for a skip
-            unq_time_intervals = np.unique(np.diff(timestamp))
-            if np.size(unq_time_intervals) > 1:
-                print('Warning: Multiple time intervals')
+            # check the timestamps for a skip, in O(n) rather than sorting the intervals
+            steps = np.diff(timestamp.astype(np.int64))
+            gaps = np.flatnonzero(steps != steps[0]) if len(steps) else steps
+            if len(gaps):
+                print('Warning: Multiple time intervals, first skip after timestamp {}'.format(gaps[0] + 1))
                 error = True
 
             return adc_data, timestamp, dac_data, ads, ads_seq_cnt, error
 
-    def save_data(self, data_dir, file_name, num_repeats=4, blk_multiples=40, append=False):
+    def save_data(self, data_dir, file_name, num_repeats=4, blk_multiples=40, append=False, validator=None,
+                  pipelined=False):
         """
         read and save DDR data to an hdf file 
 
@@ -811,13 +1055,29 @@ class DDR3():
             total data read is 2048 bytes * num_repeats * blk_multiples
         blk_multiples : int 
             number of blocks read by adc_read. adc_read is a single OpalKelly API call 
+        validator : DDR3Validator
+            If given, checks each chunk as it is read. When it finds a problem
+            and its stop_on_error is set, reading stops after saving that chunk.
+            Only for TIMESTAMPS data, ADC_NO_TIMESTAMPS data has no timestamps
+            or read checks.
+        pipelined : bool
+            If True, read with read_adc_pipelined so the next chunks are read
+            while the last is deswizzled and written to the file.
 
         Returns
         -------
         new_data : np.ndarray
             The new data saved in the h5 file.
+
+        Raises
+        ------
+        ValueError
+            If a validator is given for data_version other than TIMESTAMPS.
         """
 
+        if validator is not None and self.data_version != 'TIMESTAMPS':
+            raise ValueError(f'DDR3Validator needs TIMESTAMPS data, not {self.data_version}')
+
         # If the file doesn't already exist, write a new one
         full_data_name = os.path.join(data_dir, file_name)
         if append:
@@ -846,6 +1106,8 @@ class DDR3():
         self.set_adc_read()  # enable data into the ADC reading FIFO
         #time.sleep(adc_readings*DDR3.ADC_PERIOD)
 
+        import h5py
+
         # Save ADC DDR data to a file
         with h5py.File(full_data_name, file_mode) as file:
             if append:
@@ -861,8 +1123,11 @@ class DDR3():
                 data_set.attrs['bitfile_version'] = self.fpga.bitfile_version
                 new_data_index = 0
 
-            while repeat < num_repeats:
-                d, bytes_read_error = self.read_adc(blk_multiples)
+            if pipelined:
+                reads = self.read_adc_pipelined(blk_multiples, num_reads=num_repeats)
+            else:
+                reads = (self.read_adc(blk_multiples) for _ in range(num_repeats))
+            for d, bytes_read_error in reads:
                 if self.data_version == 'ADC_NO_TIMESTAMPS':
                     chan_data = self.deswizzle(d)
 
@@ -883,8 +1148,12 @@ class DDR3():
                     data_set[:] = chan_stack
                 else:
                     data_set[:, -chunk_size:] = chan_stack
+                if validator is not None and validator.check(chan_data) and validator.stop_on_error:
+                    print(f'Stopped DDR reading after {repeat} of {num_repeats} reads: {validator.statistics()}')
+                    break
                 if repeat < num_repeats:
                     data_set.resize(data_set.shape[1] + chunk_size, axis=1)
+            reads.close()  # Stops a pipelined read early
             new_data = data_set[:, new_data_index:]
 
         print(f'Done with DDR reading: saved as {full_data_name}')
@@ -901,8 +1170,8 @@ class DDR3():
 
         Returns
         -------
-        d : bytearray
-            data as uint32    
+        d : np.ndarray
+            data as a uint8 view of the bytes read, for deswizzle
         bytes_read_error : int 
             bytes read or error code          
         """
@@ -910,10 +1179,208 @@ class DDR3():
         t, bytes_read_error = self.read_adc_block(  # just reads from the block pipe out
             sample_size=DDR3.BLOCK_SIZE * blk_multiples
         )
-        d = np.frombuffer(t, dtype=np.uint8).astype(np.uint32)
+        d = np.frombuffer(t, dtype=np.uint8)
         # print(f'Bytes read: {bytes_read_error}')
         return d, bytes_read_error
 
+    def read_adc_pipelined(self, blk_multiples=2048, num_reads=None, num_buffers=3, after_read=None):
+        """Yield ADC reads made by a background thread while the caller processes the last.
+
+        A thread reads with ReadFromBlockPipeOut into a pool of num_buffers
+        preallocated buffers and queues them. Each buffer goes back to the
+        pool when the caller asks for the next read, so when the caller falls
+        behind the thread waits for a free buffer. The FPGA must not be used
+        by other code until the generator is finished or closed.
+
+        The reads overlap the caller's processing while the FrontPanel API
+        and the processing, such as NumPy and h5py, release the GIL.
+
+        Parameters
+        ----------
+        blk_multiples : int
+            size of each read is blk_multiples * block_size
+        num_reads : int
+            Number of reads, or None to read until the generator is closed.
+        num_buffers : int
+            Number of buffers in the pool, at least 2 to overlap reads.
+        after_read : callable
+            If given, called with no arguments by the reading thread after
+            each read, before the next. The FPGA class has no locking, so this
+            is the only place FPGA calls may be made while reading, such as
+            to poll the FIFO level. The caller must not use the FPGA from its
+            own thread until the generator is finished or closed.
+
+        Yields
+        ------
+        d : np.ndarray
+            data as a uint8 view of the bytes read, valid until the next read is requested
+        bytes_read_error : int
+            bytes read or error code
+        """
+
+        sample_size = DDR3.BLOCK_SIZE * blk_multiples
+        free = queue.Queue()
+        full = queue.Queue()  # Holds at most num_buffers reads and the end marker
+        for _ in range(num_buffers):
+            free.put(bytearray(sample_size))
+        stop = threading.Event()
+
+        def produce():
+            try:
+                count = 0
+                while num_reads is None or count < num_reads:
+                    buf = free.get()
+                    if stop.is_set():
+                        break
+                    _, bytes_read_error = self.read_adc_block(sample_size=sample_size, data_buf=buf)
+                    if after_read is not None:
+                        after_read()
+                    full.put((buf, bytes_read_error))
+                    count += 1
+            except Exception as e:
+                full.put(e)
+            full.put(None)
+
+        producer = threading.Thread(target=produce, name='DDR3.read_adc_pipelined', daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = full.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                buf, bytes_read_error = item
+                yield np.frombuffer(buf, dtype=np.uint8), bytes_read_error
+                free.put(buf)
+        finally:
+            stop.set()
+            free.put(None)  # Wakes the thread if it waits for a buffer
+            producer.join()
+
+    def stream(self, blk_multiples=2048, validator=None, duration=None, stop=None, num_reads=None,
+               num_buffers=3):
+        """Read ADC data continuously, yielding each deswizzled chunk and the running status.
+
+        Reads with read_adc_pipelined until the generator is closed, stop is
+        set, duration has passed, or num_reads chunks were read, so a long
+        acquisition has none of the gaps between separate save_data calls.
+        The reading thread polls the ADC_DATA_COUNT FIFO level after each
+        read, through the after_read of read_adc_pipelined, so all FPGA
+        calls come from that one thread. The FPGA must not be used by other
+        code, including the loop body, until the generator is finished or
+        closed. When the host falls behind the FIFO overflows and samples
+        are dropped, which shows as a skip in the TIMESTAMPS data timestamps.
+
+        Example usage:
+            for chan_data, status in ddr.stream(duration=3600):
+                monitor(chan_data[0])
+            print(status['mb_per_s'], status['dropped_samples'])
+
+        Parameters
+        ----------
+        blk_multiples : int
+            size of each read is blk_multiples * block_size
+        validator : DDR3Validator
+            Checks the timestamps of TIMESTAMPS data. A new one that does not
+            stop on errors by default, none for ADC_NO_TIMESTAMPS data.
+            Streaming stops at a problem if its stop_on_error is set.
+        duration : float
+            Seconds to stream for, or None for no limit.
+        stop : threading.Event
+            Streaming stops once this is set, such as by another thread.
+        num_reads : int
+            Number of reads, or None for no limit.
+        num_buffers : int
+            Number of read buffers, see read_adc_pipelined.
+
+        Yields
+        ------
+        chan_data : dict of np.arrays
+            data from deswizzle, valid until the next chunk is requested
+        status : dict
+            Totals since streaming started: 'reads', 'bytes', 'read_errors',
+            'seconds', sustained 'mb_per_s', the 'adc_data_count' FIFO level
+            after the latest read and 'max_adc_data_count', the validator's
+            'timestamp_gaps' and 'read_check_errors', and 'dropped_samples'
+            estimated from the timestamp gaps.
+
+        Raises
+        ------
+        ValueError
+            If a validator is given for data_version other than TIMESTAMPS.
+        """
+
+        if validator is not None and self.data_version != 'TIMESTAMPS':
+            raise ValueError(f'DDR3Validator needs TIMESTAMPS data, not {self.data_version}')
+        if validator is None and self.data_version == 'TIMESTAMPS':
+            validator = DDR3Validator(bitfile_version=self.fpga.bitfile_version, stop_on_error=False)
+        frames_per_timestamp = DDR3Validator.GROUP_FRAMES // 2
+        status = {'reads': 0, 'bytes': 0, 'read_errors': 0, 'seconds': 0.0, 'mb_per_s': 0.0,
+                  'adc_data_count': None, 'max_adc_data_count': None,
+                  'timestamp_gaps': 0, 'read_check_errors': 0, 'dropped_samples': 0}
+
+        def poll_fifo():
+            count = self.adc_data_count()
+            status['adc_data_count'] = count
+            status['max_adc_data_count'] = max(count, status['max_adc_data_count'] or 0)
+
+        after_read = poll_fifo if 'ADC_DATA_COUNT' in self.endpoints else None
+        self.set_adc_read()  # enable data into the ADC reading FIFO
+        start = time.perf_counter()
+        reads = self.read_adc_pipelined(blk_multiples, num_reads=num_reads, num_buffers=num_buffers,
+                                        after_read=after_read)
+        try:
+            for d, bytes_read_error in reads:
+                chan_data = self.deswizzle(d)
+                status['reads'] += 1
+                if bytes_read_error < 0:
+                    status['read_errors'] += 1
+                else:
+                    status['bytes'] += bytes_read_error
+                status['seconds'] = time.perf_counter() - start
+                status['mb_per_s'] = status['bytes'] / status['seconds'] / 1e6 if status['seconds'] else 0.0
+                problems = 0
+                if validator is not None:
+                    gaps = len(validator.timestamp_gaps)
+                    problems = validator.check(chan_data)
+                    for _, step in validator.timestamp_gaps[gaps:]:
+                        if step > validator.timestamp_step > 0:
+                            skipped = round(step / validator.timestamp_step) - 1
+                            status['dropped_samples'] += skipped * frames_per_timestamp
+                    status['timestamp_gaps'] = len(validator.timestamp_gaps)
+                    status['read_check_errors'] = len(validator.read_check_errors)
+                yield chan_data, dict(status)
+                if problems and validator.stop_on_error:
+                    break
+                if stop is not None and stop.is_set():
+                    break
+                if duration is not None and time.perf_counter() - start >= duration:
+                    break
+        finally:
+            reads.close()
+
+    def stream_to(self, sink, **kwargs):
+        """Stream ADC data to sink until stopped, see stream.
+
+        Parameters
+        ----------
+        sink : callable
+            Called with the chan_data and status of each chunk.
+        **kwargs
+            Passed to stream, such as duration or stop.
+
+        Returns
+        -------
+        status : dict
+            The status after the last chunk, None if nothing was read.
+        """
+
+        status = None
+        for chan_data, status in self.stream(**kwargs):
+            sink(chan_data, status)
+        return status
+
     def set_index(self, factor, factor2=None):
         """
         No longer used. Index (the DDR address that wraps-around to 0).
@@ -925,31 +1392,164 @@ class DDR3():
     def write_setup(self, data_driven_clock=True):
         """Set up DDR for writing."""
 
-        if data_driven_clock:
-            self.set_adcs_connected()
-        else:
-            self.clear_adcs_connected()
-        self.clear_dac_read()
-        self.clear_adc_write()
-        self.clear_adc_read()    # Stop putting data in outgoing FIFO for Pipe read
-        self.reset_fifo(name='ALL')
-        self.reset_mig_interface()
+        # Send the wire changes together, the FIFO resets are still pulsed
+        with self.fpga.batch():
+            if data_driven_clock:
+                self.set_adcs_connected()
+            else:
+                self.clear_adcs_connected()
+            self.clear_dac_read()
+            self.clear_adc_write()
+            self.clear_adc_read()    # Stop putting data in outgoing FIFO for Pipe read
+            self.reset_fifo(name='ALL')
+            self.reset_mig_interface()
 
     def repeat_setup(self):
         """Setup for reading new data without writing to the DDR again."""
 
         # stop access to the FIFOs so that after reset of the FIFO(s) no new data is added/extracted
-        self.clear_adc_read()
-        self.clear_adc_write()
-        self.clear_dac_read()
-        self.reset_fifo(name='ALL')
-        # self.fpga.send_trig(self.endpoints['UI_RESET'])
-        self.reset_mig_interface()
-        # note that the MIG interface addresses are driven by the FIFOs so will idle
-        # until the FIFOs are reenable with write_finish()
-        self.write_finish()
+        # Send the wire changes together, the FIFO resets are still pulsed
+        with self.fpga.batch():
+            self.clear_adc_read()
+            self.clear_adc_write()
+            self.clear_dac_read()
+            self.reset_fifo(name='ALL')
+            # self.fpga.send_trig(self.endpoints['UI_RESET'])
+            self.reset_mig_interface()
+            # note that the MIG interface addresses are driven by the FIFOs so will idle
+            # until the FIFOs are reenable with write_finish()
+            self.write_finish()
         time.sleep(0.01)
 
     def write_finish(self):
         # reenable both DACs
         self.set_adc_dac_simultaneous()  # enable DAC playback and ADC writing to DDR
+
+
+class DDR3Validator():
+    """Check DDR3 TIMESTAMPS data chunk by chunk for timestamp skips and read check errors.
+
+    Give check the deswizzled data of each chunk in the order read. Chunks
+    may be any number of frames, the few frames that do not complete a
+    group of 10 are kept for the next chunk. Each check is O(n) in the
+    chunk and the positions of all problems are kept.
+
+    Example usage:
+        validator = DDR3Validator(bitfile_version=f.bitfile_version)
+        for repeat in range(num_repeats):
+            if validator.check(ddr.deswizzle(ddr.read_adc(40)[0])):
+                break  # Data was dropped
+        validator.statistics()
+
+    Attributes
+    ----------
+    bitfile_version : int
+        The bitfile version the data was created with, see
+        DDR3.decode_timestamps.
+    timestamp_step : int
+        The expected step between timestamps. Learned from the first two
+        timestamps when None.
+    stop_on_error : bool
+        Whether DDR3.save_data stops reading when check finds a problem.
+    frames : int
+        Number of DDR frames (ADC samples) checked.
+    timestamp_gaps : list
+        (sample index, step) of each timestamp that did not follow the one
+        before it by timestamp_step. The sample index is the frame of the
+        timestamp after the skip, counted from the first frame checked.
+    read_check_errors : list
+        (sample index, value) of each read check word that did not hold its
+        constant value.
+    """
+
+    GROUP_FRAMES = 10  # Frames in one cycle of the read checks, two timestamps
+    READ_CHECKS = ((3, 0xffff, 0xaa55), (4, 0xffe0, 0x28b << 5),
+                   (8, 0xffff, 0x77bb), (9, 0xffe0, 0x28c << 5))  # (frame, mask, value) in channel 7
+
+    def __init__(self, bitfile_version=2, timestamp_step=None, stop_on_error=True):
+        self.bitfile_version = bitfile_version
+        self.timestamp_step = timestamp_step
+        self.stop_on_error = stop_on_error
+        self.frames = 0
+        self.timestamps = 0
+        self.timestamp_gaps = []
+        self.read_check_errors = []
+        self._last_timestamp = None
+        self._carry = None  # Channels 6 and 7 of frames not yet checked
+
+    def check(self, chan_data):
+        """Check the next chunk of data.
+
+        Parameters
+        ----------
+        chan_data : dict of np.arrays
+            data from DDR3.deswizzle
+
+        Returns
+        -------
+        problems : int
+            Number of timestamp gaps and read check errors found in this chunk.
+        """
+
+        before = len(self.timestamp_gaps) + len(self.read_check_errors)
+        c6, c7 = chan_data[6], chan_data[7]
+        length = len(c7)
+        start = self.frames - (0 if self._carry is None else len(self._carry[1]))
+        head = 0
+        if self._carry is not None:
+            # Complete the group started in the last chunk
+            head = min(DDR3Validator.GROUP_FRAMES - len(self._carry[1]), length)
+            c6_group = np.concatenate((self._carry[0], c6[:head]))
+            c7_group = np.concatenate((self._carry[1], c7[:head]))
+            self._carry = None
+            if len(c7_group) == DDR3Validator.GROUP_FRAMES:
+                self._check_groups(c6_group, c7_group, start)
+                start += DDR3Validator.GROUP_FRAMES
+            else:
+                self._carry = (c6_group, c7_group)
+        end = head + (length - head) // DDR3Validator.GROUP_FRAMES * DDR3Validator.GROUP_FRAMES
+        if end > head:
+            self._check_groups(c6[head:end], c7[head:end], start)
+        if end < length and head < length:
+            self._carry = (np.array(c6[end:]), np.array(c7[end:]))
+        self.frames += length
+        return len(self.timestamp_gaps) + len(self.read_check_errors) - before
+
+    def _check_groups(self, c6, c7, start):
+        """Check whole groups of frames starting at frame start."""
+
+        timestamp = DDR3.decode_timestamps({6: c6, 7: c7}, self.bitfile_version)
+        # decode_timestamps drops the last timestamp, it is whole here
+        last = (int(c7[-3]) << 32) + (int(c6[-4]) << 16) + \
+            int(c6[-5] if self.bitfile_version < 2 else c7[-4])
+        if self._last_timestamp is not None:
+            first = np.array([self._last_timestamp], dtype=np.uint64)
+            timestamp = np.concatenate((first, timestamp, [last]))
+            offset = -1
+        else:
+            timestamp = np.append(timestamp, np.uint64(last))
+            offset = 0
+        if self.timestamp_step is None and len(timestamp) > 1:
+            self.timestamp_step = int(timestamp[1] - timestamp[0])
+        steps = np.diff(timestamp.astype(np.int64))
+        for i in np.flatnonzero(steps != self.timestamp_step):
+            # The timestamp after the skip is at frame 5 * its index
+            self.timestamp_gaps.append((start + 5 * (int(i) + 1 + offset), int(steps[i])))
+        self._last_timestamp = last
+        self.timestamps += len(timestamp) + offset
+
+        errors = []
+        for frame, mask, value in DDR3Validator.READ_CHECKS:
+            words = c7[frame::DDR3Validator.GROUP_FRAMES]
+            for i in np.flatnonzero((words & mask) != value):
+                errors.append((start + frame + DDR3Validator.GROUP_FRAMES * int(i), int(words[i])))
+        self.read_check_errors.extend(sorted(errors))
+
+    def statistics(self):
+        """Return a dict of the running counts."""
+
+        return {'frames': self.frames,
+                'timestamps': self.timestamps,
+                'timestamp_step': self.timestamp_step,
+                'timestamp_gaps': len(self.timestamp_gaps),
+                'read_check_errors': len(self.read_check_errors)}
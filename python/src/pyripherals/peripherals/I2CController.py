@@ -91,21 +91,11 @@ class I2CController:
             self.i2c['m_pBuf'].append(data[i])
 
         # Reset the memory pointer and transfer the buffer.
-        self.fpga.xem.ActivateTriggerIn(
-            self.endpoints['MEMSTART'].address, self.endpoints['MEMSTART'].bit_index_low)
-        for i in range(data_length + self.i2c['m_nDataStart']):
-            # print('(transmit) WireIn Value = {}'.format(self.i2c['m_pBuf'][i]))
-            mask = 0xff << self.endpoints['IN'].bit_index_low
-            value = self.i2c['m_pBuf'][i] << self.endpoints['IN'].bit_index_low
-            self.fpga.xem.SetWireInValue(
-                self.endpoints['IN'].address, value, mask)
-            self.fpga.xem.UpdateWireIns()
-            self.fpga.xem.ActivateTriggerIn(
-                self.endpoints['MEMWRITE'].address, self.endpoints['MEMWRITE'].bit_index_low)
+        self.fpga.send_trig(self.endpoints['MEMSTART'])
+        self._write_buffer(data_length + self.i2c['m_nDataStart'])
 
         # Start I2C transaction
-        self.fpga.xem.ActivateTriggerIn(
-            self.endpoints['START'].address, self.endpoints['START'].bit_index_low)
+        self.fpga.send_trig(self.endpoints['START'])
 
         # Wait for transaction to finish
         for i in range(int(I2CController.I2C_MAX_TIMEOUT_MS)):
@@ -141,29 +131,18 @@ class I2CController:
             except KeyError as e:
                 raise KeyError('i2c_receive requires the I2C endpoints FIFO_RESET and PIPE_OUT. One or both are missing.')
 
-            self.fpga.xem.ActivateTriggerIn(self.endpoints['FIFO_RESET'].address, self.endpoints['FIFO_RESET'].bit_index_low)
+            self.fpga.send_trig(self.endpoints['FIFO_RESET'])
 
         self.i2c['m_pBuf'][0] |= 0x80
         self.i2c['m_pBuf'][3] = data_length
 
         # Reset the memory pointer and transfer the buffer.
-        self.fpga.xem.ActivateTriggerIn(
-            self.endpoints['MEMSTART'].address, self.endpoints['MEMSTART'].bit_index_low)
-
-        for i in range(self.i2c['m_nDataStart']):
-            # print('WireIn Value = {}'.format(self.i2c['m_pBuf'][i]))
-            mask = 0xff << self.endpoints['IN'].bit_index_low
-            value = self.i2c['m_pBuf'][i] << self.endpoints['IN'].bit_index_low
-            self.fpga.xem.SetWireInValue(
-                self.endpoints['IN'].address, value, mask)
-            self.fpga.xem.UpdateWireIns()
-            self.fpga.xem.ActivateTriggerIn(
-                self.endpoints['MEMWRITE'].address, self.endpoints['MEMWRITE'].bit_index_low)
+        self.fpga.send_trig(self.endpoints['MEMSTART'])
+
+        self._write_buffer(self.i2c['m_nDataStart'])
 
         # Start I2C transaction
-        self.fpga.xem.ActivateTriggerIn(
-            self.endpoints['START'].address,
-            self.endpoints['START'].bit_index_low)
+        self.fpga.send_trig(self.endpoints['START'])
 
         # Wait for transaction to finish
         for _ in range(int(I2CController.I2C_MAX_TIMEOUT_MS / 10)):
@@ -173,25 +152,53 @@ class I2CController:
                                          (1 << self.endpoints['DONE'].bit_index_low)):
                 if data_transfer.lower() == 'wire':
                     # Read data: Reset the memory pointer
-                    self.fpga.xem.ActivateTriggerIn(
-                        self.endpoints['MEMSTART'].address, self.endpoints['MEMSTART'].bit_index_low)
-                    data = [None]*data_length
-                    for i in range(data_length):  # for each byte we have three API calls
-                        self.fpga.xem.UpdateWireOuts()
-                        data_tmp = self.fpga.xem.GetWireOutValue(
-                            self.endpoints['OUT'].address)
-                        mask = 0xff << self.endpoints['OUT'].bit_index_low
-                        data[i] = (
-                            data_tmp & mask) >> self.endpoints['OUT'].bit_index_low
-                        self.fpga.xem.ActivateTriggerIn(
-                            self.endpoints['MEMREAD'].address, self.endpoints['MEMREAD'].bit_index_low)
-                    return data
+                    self.fpga.send_trig(self.endpoints['MEMSTART'])
+                    return self._read_buffer(data_length)
                 if data_transfer.lower() == 'pipe':
                     return self.fpga.read_pipe_out(self.endpoints['PIPE_OUT'].address, data_length)
             time.sleep(0.01)
 
         print('Timeout Exception in Rx')
 
+    def _write_buffer(self, length):
+        """Write the first length bytes of the I2C buffer to the controller's memory.
+
+        The endpoints are looked up once rather than for every byte.
+        """
+
+        xem = self.fpga.xem
+        ep_in = self.endpoints['IN']
+        ep_memwrite = self.endpoints['MEMWRITE']
+        in_address, in_shift = ep_in.address, ep_in.bit_index_low
+        mask = 0xff << in_shift
+        memwrite_address, memwrite_bit = ep_memwrite.address, ep_memwrite.bit_index_low
+        buf = self.i2c['m_pBuf']
+        for i in range(length):
+            xem.SetWireInValue(in_address, buf[i] << in_shift, mask)
+            xem.UpdateWireIns()
+            xem.ActivateTriggerIn(memwrite_address, memwrite_bit)
+        # Written with xem directly, so the FPGA's shadow of this WireIn is out of date
+        self.fpga.resync([in_address])
+
+    def _read_buffer(self, length):
+        """Return length bytes read from the controller's memory.
+
+        The endpoints are looked up once rather than for every byte.
+        """
+
+        xem = self.fpga.xem
+        ep_out = self.endpoints['OUT']
+        ep_memread = self.endpoints['MEMREAD']
+        out_address, out_shift = ep_out.address, ep_out.bit_index_low
+        mask = 0xff << out_shift
+        memread_address, memread_bit = ep_memread.address, ep_memread.bit_index_low
+        data = [None]*length
+        for i in range(length):  # for each byte we have three API calls
+            xem.UpdateWireOuts()
+            data[i] = (xem.GetWireOutValue(out_address) & mask) >> out_shift
+            xem.ActivateTriggerIn(memread_address, memread_bit)
+        return data
+
     # def i2c_write8(self, devAddr, regAddr, data_length, data):
 
     #     preamble = [devAddr & 0xfe, regAddr]
@@ -251,6 +258,4 @@ class I2CController:
     def reset_device(self):
         """Reset the I2C controller using an OK TriggerIn."""
 
-        return self.fpga.xem.ActivateTriggerIn(
-            self.endpoints['RESET'].address,
-            self.endpoints['RESET'].bit_index_low)
+        return self.fpga.send_trig(self.endpoints['RESET'])
@@ -1,5 +1,4 @@
 from ..core import Endpoint, Register
-import copy
 import numpy as np
 
 Endpoint.pit=Endpoint.get_chip_endpoints('PIT')
@@ -59,16 +58,13 @@ class PIT:
             # Use class default for master_config
             for i in range(number_of_chips):
                 chips.append(cls(fpga=fpga, endpoints=endpoints))
-                # Use deepcopy to keep the endpoints for different instances separate
-                endpoints = copy.deepcopy(chips[-1].endpoints)
-                Endpoint.advance_endpoints(endpoints)
+                # Endpoints are immutable, so advancing a shallow copy keeps the endpoints for different instances separate
+                endpoints = Endpoint.advance_endpoints(dict(chips[-1].endpoints))
         else:
             for i in range(number_of_chips):
-                chips.append(cls(fpga=fpga, endpoints=copy.deepcopy(
-                    endpoints), master_config=master_config))
-                # Use deepcopy to keep the endpoints for different instances separate
-                endpoints = copy.deepcopy(chips[-1].endpoints)
-                Endpoint.advance_endpoints(endpoints)
+                chips.append(cls(fpga=fpga, endpoints=endpoints, master_config=master_config))
+                # Endpoints are immutable, so advancing a shallow copy keeps the endpoints for different instances separate
+                endpoints = Endpoint.advance_endpoints(dict(chips[-1].endpoints))
 
         if endpoints is None:
             # Increment shared endpoints dictionary
@@ -1,5 +1,4 @@
 from ..core import Endpoint, Register
-import copy
 
 
 class SPIController:
@@ -59,16 +58,13 @@ class SPIController:
             # Use class default for master_config
             for i in range(number_of_chips):
                 chips.append(cls(fpga=fpga, endpoints=endpoints))
-                # Use deepcopy to keep the endpoints for different instances separate
-                endpoints = copy.deepcopy(chips[-1].endpoints)
-                Endpoint.advance_endpoints(endpoints)
+                # Endpoints are immutable, so advancing a shallow copy keeps the endpoints for different instances separate
+                endpoints = Endpoint.advance_endpoints(dict(chips[-1].endpoints))
         else:
             for i in range(number_of_chips):
-                chips.append(cls(fpga=fpga, endpoints=copy.deepcopy(
-                    endpoints), master_config=master_config))
-                # Use deepcopy to keep the endpoints for different instances separate
-                endpoints = copy.deepcopy(chips[-1].endpoints)
-                Endpoint.advance_endpoints(endpoints)
+                chips.append(cls(fpga=fpga, endpoints=endpoints, master_config=master_config))
+                # Endpoints are immutable, so advancing a shallow copy keeps the endpoints for different instances separate
+                endpoints = Endpoint.advance_endpoints(dict(chips[-1].endpoints))
 
         if endpoints is None:
             # Increment shared endpoints dictionary
@@ -301,9 +297,7 @@ class SPIController:
     def reset_master(self):
         """Reset the Wishbone Master and SPI Core."""
 
-        self.fpga.xem.ActivateTriggerIn(
-            self.endpoints['MASTER_RESET'].address,
-            self.endpoints['MASTER_RESET'].bit_index_low)
+        self.fpga.send_trig(self.endpoints['MASTER_RESET'])
 
     def set_host_mode(self):
         """ Configure SPI controller to be host driven."""
@@ -1,6 +1,5 @@
 from ..core import Endpoint
 from ..utils import gen_mask
-import copy
 
 
 class SPIFifoDriven():
@@ -65,16 +64,13 @@ class SPIFifoDriven():
             # Use class default for master_config
             for i in range(number_of_chips):
                 chips.append(cls(fpga=fpga, endpoints=endpoints))
-                # Use deepcopy to keep the endpoints for different instances separate
-                endpoints = copy.deepcopy(chips[-1].endpoints)
-                Endpoint.advance_endpoints(endpoints)
+                # Endpoints are immutable, so advancing a shallow copy keeps the endpoints for different instances separate
+                endpoints = Endpoint.advance_endpoints(dict(chips[-1].endpoints))
         else:
             for i in range(number_of_chips):
-                chips.append(cls(fpga=fpga, endpoints=copy.deepcopy(
-                    endpoints), master_config=master_config))
-                # Use deepcopy to keep the endpoints for different instances separate
-                endpoints = copy.deepcopy(chips[-1].endpoints)
-                Endpoint.advance_endpoints(endpoints)
+                chips.append(cls(fpga=fpga, endpoints=endpoints, master_config=master_config))
+                # Endpoints are immutable, so advancing a shallow copy keeps the endpoints for different instances separate
+                endpoints = Endpoint.advance_endpoints(dict(chips[-1].endpoints))
 
         if endpoints is None:
             # Increment shared endpoints dictionary
@@ -174,8 +170,7 @@ class SPIFifoDriven():
                            mask)
 
         # resets the SPI state machine
-        self.fpga.xem.ActivateTriggerIn(self.endpoints['REG_TRIG'].address,
-                                        self.endpoints['REG_TRIG'].bit_index_low)
+        self.fpga.send_trig(self.endpoints['REG_TRIG'])
 
     def set_ctrl_reg(self, reg_value):
         """Configures the SPI Wishbone control register over the registerBridge.
@@ -188,8 +183,7 @@ class SPIFifoDriven():
 
         # resets the SPI state machine -- needed since these registers are only
         #   programmed at startup of the state machine
-        self.fpga.xem.ActivateTriggerIn(self.endpoints['REG_TRIG'].address,
-                                        self.endpoints['REG_TRIG'].bit_index_low)
+        self.fpga.send_trig(self.endpoints['REG_TRIG'])
 
     def set_spi_sclk_divide(self, divide_value=0x01):
         """Configures the SPI Wishbone clock divider register over the registerBridge.
@@ -205,8 +199,7 @@ class SPIFifoDriven():
 
         # resets the SPI state machine -- needed since these WishBone
         #   registers are only programmed at startup of the state machine
-        self.fpga.xem.ActivateTriggerIn(self.endpoints['REG_TRIG'].address,
-                                        self.endpoints['REG_TRIG'].bit_index_low)
+        self.fpga.send_trig(self.endpoints['REG_TRIG'])
 
     def write(self, data):
         """Host write 24 bits of data to the chip over SPI."""
@@ -214,5 +207,4 @@ class SPIFifoDriven():
         if self.current_data_mux != 'host':
             self.set_data_mux('host')
         self.fpga.set_wire(self.endpoints['HOST_WIRE_IN'].address, data)
-        self.fpga.xem.ActivateTriggerIn(self.endpoints['HOST_TRIG'].address,
-                                        self.endpoints['HOST_TRIG'].bit_index_low)
+        self.fpga.send_trig(self.endpoints['HOST_TRIG'])
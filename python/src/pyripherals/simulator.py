@@ -0,0 +1,337 @@
+"""Module to simulate an Opal Kelly FrontPanel device without hardware.
+
+SimulatedBackend can be given to FPGA in place of the Opal Kelly ok module so
+that drivers run, and can be tested or benchmarked, with no XEM connected.
+
+Example usage:
+    backend = SimulatedBackend(latency=100e-6)
+    f = FPGA(bitfile=None, endpoints={}, backend=backend)
+    f.init_device()
+    f.set_wire(0x00, 0x1234)
+    backend.frontpanel.get_wire_in(0x00)  # 0x1234
+
+The simulated device keeps the FrontPanel split between host and device.
+SetWireInValue only changes a host buffer that UpdateWireIns sends, and
+GetWireOutValue and IsTriggered return the values from the last
+UpdateWireOuts and UpdateTriggerOuts. Calls that need a USB transaction can
+be given a latency. To model HDL, subclass SimulatedFrontPanel and override
+wire_ins_updated and trigger_in_activated, or use set_wire_out,
+activate_trigger_out, and the pipe helpers from a test.
+"""
+
+import time
+from collections import Counter
+
+
+class okTDeviceInfo:
+    """Simulated device information, filled in by SimulatedFrontPanel.GetDeviceInfo."""
+
+    def __init__(self):
+        self.productName = ''
+        self.deviceMajorVersion = 0
+        self.deviceMinorVersion = 0
+        self.serialNumber = ''
+        self.deviceID = ''
+        self.usbSpeed = 0
+
+
+class okTRegisterEntry:
+    """A single register address and data pair."""
+
+    def __init__(self, address=0, data=0):
+        self.address = address
+        self.data = data
+
+
+class okTRegisterEntries(list):
+    """List of register entries for WriteRegisters and ReadRegisters."""
+
+    def __init__(self, size=0):
+        super().__init__(okTRegisterEntry() for _ in range(size))
+
+
+class SimulatedFrontPanel:
+    """A simulated Opal Kelly device with the okCFrontPanel API used by pyripherals.
+
+    Attributes
+    ----------
+    latency : float or dict
+        Seconds each call that needs a USB transaction waits, either for all
+        of them or by method name. Host buffer calls such as SetWireInValue
+        and GetWireOutValue never wait.
+    calls : collections.Counter
+        Number of calls to each API method.
+    device_info : okTDeviceInfo
+        Information returned by GetDeviceInfo.
+    wire_ins : list
+        WireIn values on the device, indexed by address.
+    wire_outs : list
+        WireOut values on the device, indexed by address - 0x20.
+    trigger_ins : list
+        (address, bit) of each TriggerIn activated since the last reset.
+    pipe_ins : dict
+        PipeIn address to bytearray of all data written.
+    pipe_outs : dict
+        PipeOut address to bytearray of data waiting to be read.
+    registers : dict
+        Register address to value.
+    """
+
+    # Error codes, matching ok.okCFrontPanel
+    NoError = 0
+    Failed = -1
+    Timeout = -2
+    DeviceNotOpen = -8
+    InvalidEndpoint = -9
+    InvalidBlockSize = -10
+
+    # Opal Kelly endpoint address ranges
+    WIRE_IN_ADDRESSES = range(0x00, 0x20)
+    WIRE_OUT_ADDRESSES = range(0x20, 0x40)
+    TRIGGER_IN_ADDRESSES = range(0x40, 0x60)
+    TRIGGER_OUT_ADDRESSES = range(0x60, 0x80)
+    PIPE_IN_ADDRESSES = range(0x80, 0xA0)
+    PIPE_OUT_ADDRESSES = range(0xA0, 0xC0)
+
+    MAX_BLOCK_SIZE = 16384
+
+    def __init__(self, latency=0.0, serial_number='SIMULATED'):
+        self.latency = latency
+        self.calls = Counter()
+        self.device_info = okTDeviceInfo()
+        self.device_info.productName = 'Simulated XEM7310'
+        self.device_info.serialNumber = serial_number
+        self.device_info.deviceID = 'Simulated'
+        self.device_info.usbSpeed = 2
+        self.is_open = False
+        self.bitfile = None
+        self.reset()
+
+    def reset(self):
+        """Return the device to its power up state, as loading a bitfile does."""
+
+        self.wire_ins = [0] * 32
+        self.wire_outs = [0] * 32
+        self.trigger_ins = []
+        self.pipe_ins = dict()
+        self.pipe_outs = dict()
+        self.registers = dict()
+        self._host_wire_ins = [0] * 32
+        self._host_wire_outs = [0] * 32
+        self._trigger_outs = [0] * 32  # Activated on the device, not yet seen by the host
+        self._host_trigger_outs = [0] * 32
+
+    def _transaction(self, name):
+        """Count a call and wait for its latency."""
+
+        self.calls[name] += 1
+        latency = self.latency.get(name, 0.0) if type(self.latency) is dict else self.latency
+        if latency > 0:
+            time.sleep(latency)
+
+    # Model hooks and helpers for tests
+
+    def wire_ins_updated(self, changed):
+        """Called after UpdateWireIns with the addresses whose value changed.
+
+        Override to model the HDL. Does nothing by default.
+        """
+
+    def trigger_in_activated(self, address, bit):
+        """Called after ActivateTriggerIn. Override to model the HDL. Does nothing by default."""
+
+    def get_wire_in(self, address):
+        """Return the WireIn value on the device."""
+
+        return self.wire_ins[address]
+
+    def set_wire_out(self, address, value):
+        """Set a WireOut value on the device, seen by the host after UpdateWireOuts."""
+
+        self.wire_outs[address - 0x20] = value & 0xFFFFFFFF
+
+    def activate_trigger_out(self, address, bit):
+        """Activate a TriggerOut bit on the device, seen by the host after UpdateTriggerOuts."""
+
+        self._trigger_outs[address - 0x60] |= 1 << bit
+
+    def push_pipe_out(self, address, data):
+        """Queue data on the device to be read from a PipeOut."""
+
+        self.pipe_outs.setdefault(address, bytearray()).extend(data)
+
+    # Device
+
+    def OpenBySerial(self, serial=''):
+        self._transaction('OpenBySerial')
+        self.is_open = True
+        return self.NoError
+
+    def Close(self):
+        self.calls['Close'] += 1
+        self.is_open = False
+
+    def IsOpen(self):
+        return self.is_open
+
+    def GetDeviceInfo(self, device_info):
+        self._transaction('GetDeviceInfo')
+        device_info.__dict__.update(self.device_info.__dict__)
+        return self.NoError
+
+    def LoadDefaultPLLConfiguration(self):
+        self._transaction('LoadDefaultPLLConfiguration')
+        return self.NoError
+
+    def ConfigureFPGA(self, bitfile):
+        self._transaction('ConfigureFPGA')
+        self.bitfile = bitfile
+        self.reset()
+        return self.NoError
+
+    def IsFrontPanelEnabled(self):
+        self._transaction('IsFrontPanelEnabled')
+        return True
+
+    # Wires
+
+    def SetWireInValue(self, address, value, mask=0xFFFFFFFF):
+        self.calls['SetWireInValue'] += 1
+        if address not in self.WIRE_IN_ADDRESSES:
+            return self.InvalidEndpoint
+        old = self._host_wire_ins[address]
+        self._host_wire_ins[address] = ((old & ~mask) | (value & mask)) & 0xFFFFFFFF
+        return self.NoError
+
+    def GetWireInValue(self, address):
+        self.calls['GetWireInValue'] += 1
+        return self._host_wire_ins[address]
+
+    def UpdateWireIns(self):
+        self._transaction('UpdateWireIns')
+        changed = [address for address, value in enumerate(self._host_wire_ins)
+                   if self.wire_ins[address] != value]
+        self.wire_ins = list(self._host_wire_ins)
+        if changed:
+            self.wire_ins_updated(changed)
+        return self.NoError
+
+    def UpdateWireOuts(self):
+        self._transaction('UpdateWireOuts')
+        self._host_wire_outs = list(self.wire_outs)
+        return self.NoError
+
+    def GetWireOutValue(self, address):
+        self.calls['GetWireOutValue'] += 1
+        if address not in self.WIRE_OUT_ADDRESSES:
+            return self.InvalidEndpoint
+        return self._host_wire_outs[address - 0x20]
+
+    # Triggers
+
+    def ActivateTriggerIn(self, address, bit):
+        self._transaction('ActivateTriggerIn')
+        if address not in self.TRIGGER_IN_ADDRESSES or not 0 <= bit < 32:
+            return self.InvalidEndpoint
+        self.trigger_ins.append((address, bit))
+        self.trigger_in_activated(address, bit)
+        return self.NoError
+
+    def UpdateTriggerOuts(self):
+        self._transaction('UpdateTriggerOuts')
+        self._host_trigger_outs = self._trigger_outs
+        self._trigger_outs = [0] * 32
+        return self.NoError
+
+    def IsTriggered(self, address, mask):
+        self.calls['IsTriggered'] += 1
+        if address not in self.TRIGGER_OUT_ADDRESSES:
+            return False
+        return (self._host_trigger_outs[address - 0x60] & mask) != 0
+
+    # Pipes
+
+    def _write_pipe(self, name, address, data, block_size=None):
+        self._transaction(name)
+        if address not in self.PIPE_IN_ADDRESSES:
+            return self.InvalidEndpoint
+        if block_size is not None and not self._valid_block(block_size, len(data)):
+            return self.InvalidBlockSize
+        self.pipe_ins.setdefault(address, bytearray()).extend(data)
+        return len(data)
+
+    def _read_pipe(self, name, address, data, block_size=None):
+        self._transaction(name)
+        if address not in self.PIPE_OUT_ADDRESSES:
+            return self.InvalidEndpoint
+        if block_size is not None and not self._valid_block(block_size, len(data)):
+            return self.InvalidBlockSize
+        # Data not queued with push_pipe_out reads as zeros
+        view = memoryview(data).cast('B')
+        length = len(view)
+        queued = self.pipe_outs.get(address, bytearray())
+        count = min(length, len(queued))
+        view[:count] = queued[:count]
+        view[count:] = bytes(length - count)
+        del queued[:count]
+        return length
+
+    def _valid_block(self, block_size, length):
+        return (0 < block_size <= self.MAX_BLOCK_SIZE) and block_size % 16 == 0 and length % block_size == 0
+
+    def WriteToPipeIn(self, epAddr, data):
+        return self._write_pipe('WriteToPipeIn', epAddr, data)
+
+    def ReadFromPipeOut(self, epAddr, data):
+        return self._read_pipe('ReadFromPipeOut', epAddr, data)
+
+    def WriteToBlockPipeIn(self, epAddr, blockSize, data):
+        return self._write_pipe('WriteToBlockPipeIn', epAddr, data, blockSize)
+
+    def ReadFromBlockPipeOut(self, epAddr, blockSize, data):
+        return self._read_pipe('ReadFromBlockPipeOut', epAddr, data, blockSize)
+
+    # Registers
+
+    def WriteRegister(self, address, data):
+        self._transaction('WriteRegister')
+        self.registers[address] = data & 0xFFFFFFFF
+        return self.NoError
+
+    def ReadRegister(self, address):
+        self._transaction('ReadRegister')
+        return self.registers.get(address, 0)
+
+    def WriteRegisters(self, regs):
+        self._transaction('WriteRegisters')
+        for reg in regs:
+            self.registers[reg.address] = reg.data & 0xFFFFFFFF
+        return self.NoError
+
+    def ReadRegisters(self, regs):
+        self._transaction('ReadRegisters')
+        for reg in regs:
+            reg.data = self.registers.get(reg.address, 0)
+        return self.NoError
+
+
+class SimulatedBackend:
+    """Stand-in for the Opal Kelly ok module, connected to one SimulatedFrontPanel.
+
+    Attributes
+    ----------
+    frontpanel : SimulatedFrontPanel
+        The simulated device returned by okCFrontPanel.
+    """
+
+    okTDeviceInfo = okTDeviceInfo
+    okTRegisterEntry = okTRegisterEntry
+    okTRegisterEntries = okTRegisterEntries
+
+    def __init__(self, frontpanel=None, latency=0.0):
+        if frontpanel is None:
+            frontpanel = SimulatedFrontPanel(latency=latency)
+        self.frontpanel = frontpanel
+
+    def okCFrontPanel(self):
+        return self.frontpanel
@@ -0,0 +1,233 @@
+"""Module to record FrontPanel API traffic to a file and replay it without hardware.
+
+A TraceRecorder is given to FPGA.enable_instrumentation, or FPGA.record_trace,
+and writes every call made through fpga.xem with its arguments, return value,
+duration, and calling peripheral method. Data read from PipeOuts and registers
+is recorded after the call, so replay returns what the device returned.
+
+Example usage:
+    f = FPGA()
+    f.record_trace('session.trace')
+    f.init_device()
+    ddr.save_data(...)
+    f.disable_instrumentation().close()
+
+    # Later, without the bench
+    f = FPGA(backend=TraceReplayBackend('session.trace'))
+    f.init_device()
+    ddr.save_data(...)
+
+Replay does not wait for the recorded durations, so it runs as fast as the
+host allows and measures only host side time.
+
+The file starts with TRACE_MAGIC followed by records, each a 4 byte little
+endian length and a marshal encoded tuple of (api, args, kwargs, result,
+seconds, caller), encoded by pyripherals.instrumentation.encode_value.
+"""
+
+import marshal
+import struct
+
+from .instrumentation import Instrumentation, CallRecord, encode_value
+from .simulator import SimulatedFrontPanel, okTDeviceInfo, okTRegisterEntry, okTRegisterEntries
+
+TRACE_MAGIC = b'PYRTRACE\x01'
+LENGTH = struct.Struct('<I')
+
+# Calls that fill their data argument with data read from the device
+READ_APIS = ('ReadFromPipeOut', 'ReadFromBlockPipeOut')
+# Calls init_device makes that replay answers even if they were not recorded
+SETUP_APIS = {
+    'OpenBySerial': SimulatedFrontPanel.NoError,
+    'GetDeviceInfo': SimulatedFrontPanel.NoError,
+    'LoadDefaultPLLConfiguration': SimulatedFrontPanel.NoError,
+    'ConfigureFPGA': SimulatedFrontPanel.NoError,
+    'IsFrontPanelEnabled': True,
+}
+
+TraceRecord = CallRecord  # The records in a trace are those kept by Instrumentation
+
+
+class TraceMismatchError(Exception):
+    """Raised when replay is asked for a call that differs from the next recorded call."""
+
+
+def read_trace(path):
+    """Yield each TraceRecord in a trace file.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a trace.
+    """
+
+    with open(path, 'rb') as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError('{} is not a pyripherals trace'.format(path))
+        while True:
+            header = f.read(LENGTH.size)
+            if len(header) < LENGTH.size:
+                return
+            yield TraceRecord(*marshal.loads(f.read(LENGTH.unpack(header)[0])))
+
+
+class TraceRecorder:
+    """Writes each FrontPanel call to a trace file.
+
+    Use with FPGA.enable_instrumentation or FPGA.record_trace, and close
+    when done. Can also be used as a context manager.
+
+    Attributes
+    ----------
+    path : str
+        Path to the trace file.
+    payloads : bool
+        Whether to store the data of pipe and block pipe calls. Without
+        payloads the trace is much smaller, but replay reads zeros.
+    attribute_callers : bool
+        Whether to record the peripheral method making each call.
+    count : int
+        Number of calls recorded.
+    """
+
+    def __init__(self, path, payloads=True, attribute_callers=True):
+        self.path = path
+        self.payloads = payloads
+        self.attribute_callers = attribute_callers
+        self.count = 0
+        self._file = open(path, 'wb')
+        self._file.write(TRACE_MAGIC)
+
+    def record(self, api, args, kwargs, result, seconds):
+        """Write one call. Called by InstrumentedFrontPanel after each call returns."""
+
+        payloads = self.payloads
+        caller = Instrumentation.find_caller(depth=3) if self.attribute_callers else None
+        data = marshal.dumps((api,
+                              tuple(encode_value(arg, payloads) for arg in args),
+                              {key: encode_value(arg, payloads) for key, arg in kwargs.items()},
+                              encode_value(result, payloads),
+                              seconds,
+                              caller))
+        self._file.write(LENGTH.pack(len(data)))
+        self._file.write(data)
+        self.count += 1
+
+    def close(self):
+        """Finish writing the trace file."""
+
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ReplayFrontPanel:
+    """Answers FrontPanel calls with the results from a trace.
+
+    Attributes
+    ----------
+    records : list
+        The TraceRecords from the trace.
+    position : int
+        Index of the next record to replay.
+    strict : bool
+        Whether to also check that the arguments, other than buffers, match
+        the recording. The API name is always checked.
+    """
+
+    NoError = SimulatedFrontPanel.NoError
+    Failed = SimulatedFrontPanel.Failed
+    Timeout = SimulatedFrontPanel.Timeout
+    DeviceNotOpen = SimulatedFrontPanel.DeviceNotOpen
+    InvalidEndpoint = SimulatedFrontPanel.InvalidEndpoint
+    InvalidBlockSize = SimulatedFrontPanel.InvalidBlockSize
+
+    def __init__(self, records, strict=False):
+        self.records = list(records)
+        self.position = 0
+        self.strict = strict
+
+    @property
+    def remaining(self):
+        """Number of recorded calls not yet replayed."""
+
+        return len(self.records) - self.position
+
+    def _next(self, api, args, kwargs):
+        """Return the next record, checking that it is for this call."""
+
+        if self.position < len(self.records):
+            record = self.records[self.position]
+            if record.api == api:
+                if self.strict:
+                    pairs = list(zip(args, record.args))
+                    pairs += [(value, record.kwargs.get(key)) for key, value in kwargs.items()]
+                    if any(isinstance(given, (int, str)) and given != recorded for given, recorded in pairs):
+                        raise TraceMismatchError('Call {} {} has arguments {} {} but was recorded with {} {}'.format(
+                            self.position, api, args, kwargs, record.args, record.kwargs))
+                self.position += 1
+                return record
+        if api in SETUP_APIS:
+            return None
+        found = self.records[self.position].api if self.position < len(self.records) else 'end of trace'
+        raise TraceMismatchError('Call {} is {} but the trace has {}'.format(self.position, api, found))
+
+    def __getattr__(self, api):
+        if api.startswith('_'):
+            raise AttributeError(api)
+
+        def call(*args, **kwargs):
+            record = self._next(api, args, kwargs)
+            if record is None:
+                return SETUP_APIS[api]
+            if api in READ_APIS:
+                self._fill(kwargs['data'] if 'data' in kwargs else args[-1], record.args, record.kwargs)
+            elif api == 'ReadRegisters':
+                regs = kwargs['regs'] if 'regs' in kwargs else args[0]
+                recorded = record.kwargs['regs'] if 'regs' in record.kwargs else record.args[0]
+                for reg, (_, data) in zip(regs, recorded):
+                    reg.data = data
+            elif api == 'GetDeviceInfo':
+                device_info = args[0] if args else kwargs['device_info']
+                for field, value in (record.args[0] if record.args else {}).items():
+                    setattr(device_info, field, value)
+            return record.result
+
+        call.__name__ = api
+        return call
+
+    @staticmethod
+    def _fill(data, recorded_args, recorded_kwargs):
+        """Copy the recorded data read from a PipeOut into data."""
+
+        view = memoryview(data).cast('B')
+        payload = recorded_kwargs['data'] if 'data' in recorded_kwargs else recorded_args[-1]
+        if isinstance(payload, int):
+            payload = b''  # Recorded without payloads
+        count = min(len(view), len(payload))
+        view[:count] = payload[:count]
+        view[count:] = bytes(len(view) - count)
+
+
+class TraceReplayBackend:
+    """Stand-in for the Opal Kelly ok module that replays a trace file.
+
+    Attributes
+    ----------
+    frontpanel : ReplayFrontPanel
+        Returned by okCFrontPanel.
+    """
+
+    okTDeviceInfo = okTDeviceInfo
+    okTRegisterEntry = okTRegisterEntry
+    okTRegisterEntries = okTRegisterEntries
+
+    def __init__(self, path, strict=False):
+        self.frontpanel = ReplayFrontPanel(read_trace(path), strict=strict)
+
+    def okCFrontPanel(self):
+        return self.frontpanel
@@ -5,17 +5,16 @@ Abe Stroschein, ajstroschein@stthomas.edu
 Lucas Koerner, koer2434@stthomas.edu
 """
 
+# matplotlib, scipy, h5py and yaml are imported inside the functions that use
+# them so that importing pyripherals stays fast for scripts that do not need them.
 from typing import Type
-import matplotlib.pyplot as plt
 import time
 import numpy as np
-from scipy.fft import rfft
-from scipy.signal.windows import hann
 import datetime
 import sys
-import yaml
 import os
-import h5py
+import pickle
+import hashlib
 
 home_dir = os.path.join(os.path.expanduser('~'), '.pyripherals')
 DEFAULT_CONFIGS = {
@@ -24,12 +23,16 @@ DEFAULT_CONFIGS = {
     'ep_defines_path': None,
     'registers_path': None,
     'frontpanel_path': 'C:/Program Files/Opal Kelly/FrontPanelUSB',
+    'cache_path': None,
 }
+CACHE_VERSION = 1
 
 
 def create_yaml(overwrite=False):
     """Create a default config.yaml file."""
 
+    import yaml
+
     if not os.path.exists(home_dir):
         os.mkdir(home_dir)
 
@@ -46,6 +49,79 @@ def create_yaml(overwrite=False):
     return DEFAULT_CONFIGS
 
 
+def get_cache_file(cache_dir, kind, source_path):
+    """Return the path of the cache file for a source file.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory holding the cache files.
+    kind : str
+        What is cached, e.g. 'registers' or 'endpoints'. Used as a file name prefix.
+    source_path : str
+        Path to the file the cache is built from.
+
+    Returns
+    -------
+    str : path to the cache file. The file may not exist yet.
+    """
+
+    source_path = os.path.abspath(source_path)
+    digest = hashlib.sha1(source_path.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f'{kind}_{digest}.pickle')
+
+
+def load_cache(cache_file, key):
+    """Return the data stored in a cache file, or None if it is missing or stale.
+
+    Parameters
+    ----------
+    cache_file : str
+        Path to the cache file, see get_cache_file.
+    key : tuple
+        Identifies the state of the source the cache was built from (e.g. its
+        modification time and size). The cache is stale if the keys differ.
+    """
+
+    try:
+        with open(cache_file, 'rb') as file:
+            cached = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError):
+        return None
+
+    if type(cached) is not dict or cached.get('version') != CACHE_VERSION or cached.get('key') != key:
+        return None
+    return cached.get('data')
+
+
+def save_cache(cache_file, key, data):
+    """Store data in a cache file with the key of its source.
+
+    The file is written to a temporary name first and then moved into place so
+    that processes reading the cache at the same time never see a partial
+    file. Failures are ignored because the cache only saves time.
+
+    Returns
+    -------
+    bool : True if the cache was written, False otherwise.
+    """
+
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_file, 'wb') as file:
+            pickle.dump({'version': CACHE_VERSION, 'key': key, 'data': data},
+                        file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+        return False
+    return True
+
+
 def rev_lookup(dd, val):
     key = next(key for key, value in dd.items() if value == val)
     return key
@@ -344,6 +420,9 @@ def calc_impedance(v_in, v_out, resistance):
     numpy.ndarray : the array of impedances calculated.
     """
 
+    from scipy.fft import rfft
+    from scipy.signal.windows import hann
+
     current = np.subtract(v_in, v_out) / resistance
 
     window = hann(len(v_out), sym=False)
@@ -445,6 +524,8 @@ def read_h5(data_dir, file_name, chan_list=[0]):
     (dicionary of numpy.ndarrays) adc data
     """
 
+    import h5py
+
     SAMPLE_PERIOD = 1 / 5e6
 
     data_name = os.path.join(data_dir, file_name)
@@ -470,6 +551,8 @@ def plt_uniques(data, ax=None, block=True):
         Whether to block when showing the plot. Used in plt.show(block=block).
     """
 
+    import matplotlib.pyplot as plt
+
     if type(data) is not np.ndarray:
         raise TypeError(f'plt_uniques expected data of type np.ndarray but got {type(data)}')
 
@@ -0,0 +1,24 @@
+"""Fixtures shared by the pyripherals tests."""
+
+import pytest
+
+from pyripherals import core
+
+
+@pytest.fixture(scope='session', autouse=True)
+def session_cache_dir(tmp_path_factory):
+    """Keep the register and Endpoint caches out of the home directory, including for module fixtures."""
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        path = str(tmp_path_factory.mktemp('cache'))
+        monkeypatch.setattr(core, 'cache_dir', path)
+        yield path
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Give each test its own empty cache directory."""
+
+    path = str(tmp_path / 'cache')
+    monkeypatch.setattr(core, 'cache_dir', path)
+    return path
@@ -0,0 +1,376 @@
+"""Unit test for the DDR3 class, using the simulated backend.
+
+Runs without an FPGA.
+"""
+
+import os
+import pytest
+import threading
+import time
+import numpy as np
+
+from pyripherals.core import FPGA, Endpoint
+from pyripherals.simulator import SimulatedBackend, SimulatedFrontPanel
+from pyripherals.utils import custom_signed_to_int
+from pyripherals.peripherals.DDR3 import DDR3, DDR3Validator, ChannelBuffer
+
+pytestmark = [pytest.mark.usable, pytest.mark.no_fpga]
+
+ep_defines_path = os.path.join(os.path.dirname(__file__), '../../../examples/ep_defines.v')
+
+
+# Fixtures
+@pytest.fixture(scope='module')
+def endpoints():
+    Endpoint.update_endpoints_from_defines(ep_defines_path)
+    return Endpoint.get_chip_endpoints('DDR3')
+
+
+@pytest.fixture()
+def backend() -> SimulatedBackend:
+    return SimulatedBackend()
+
+
+@pytest.fixture()
+def ddr(backend, endpoints) -> DDR3:
+    f = FPGA(bitfile=None, endpoints={}, backend=backend)
+    f.init_device()
+    return DDR3(f, endpoints=endpoints)
+
+
+# Tests
+@pytest.mark.parametrize('data_version', ['TIMESTAMPS', 'ADC_NO_TIMESTAMPS'])
+def test_deswizzle(ddr: DDR3, data_version):
+    ddr.data_version = data_version
+    rng = np.random.default_rng(0)
+    buf = bytearray(rng.integers(0, 256, size=DDR3.BLOCK_SIZE * 2, dtype=np.uint8).tobytes())
+    d = np.frombuffer(buf, dtype=np.uint8)
+
+    chan_data = ddr.deswizzle(d)
+    expected = ddr.deswizzle(d.astype(np.uint32))
+    assert sorted(chan_data) == sorted(expected)
+    for chan in expected:
+        assert np.shares_memory(chan_data[chan], d)  # A view, not a copy
+        assert np.array_equal(chan_data[chan], expected[chan])
+
+    if data_version == 'TIMESTAMPS':
+        assert chan_data[0].dtype == np.uint16
+        # Channel 0 is the 7th little-endian word of each 16 byte frame
+        assert chan_data[0][1] == buf[16 + 12] | (buf[16 + 13] << 8)
+    else:
+        assert chan_data[0].dtype == np.int16
+        raw = ddr.deswizzle(d, convert_twos=False)
+        assert np.array_equal(chan_data[0], custom_signed_to_int(raw[0], 16))
+
+
+def test_read_adc(ddr: DDR3, backend: SimulatedBackend):
+    backend.frontpanel.push_pipe_out(ddr.endpoints['BLOCK_PIPE_OUT'].address, bytes(range(32)))
+    d, read_cnt = ddr.read_adc(blk_multiples=1)
+    assert read_cnt == DDR3.BLOCK_SIZE
+    assert d.dtype == np.uint8 and len(d) == DDR3.BLOCK_SIZE
+    assert ddr.deswizzle(d)[6][:2].tolist() == [0x0100, 0x1110]
+
+
+def test_data_to_names(ddr: DDR3):
+    rng = np.random.default_rng(1)
+    frames = 10 * 64
+    buf = rng.integers(0, 256, size=frames * 16, dtype=np.uint8)
+    chan_data = ddr.deswizzle(buf)
+    chan_data[7][3::10] = 0xaa55  # Only one read check is wrong
+
+    for version in (1, 2):
+        adc_data, timestamp, dac_data, ads, ads_seq_cnt, error = ddr.data_to_names(chan_data, bitfile_version=version)
+        lsb = (chan_data[6][0::5] if version < 2 else chan_data[7][1::5]).astype(np.uint64)
+        expected = lsb + (chan_data[6][1::5].astype(np.uint64) << 16) + (chan_data[7][2::5].astype(np.uint64) << 32)
+        assert timestamp.dtype == np.uint64 and np.array_equal(timestamp, expected[:-1])
+        assert np.array_equal(ads['A'], custom_signed_to_int(chan_data[7][0::5], 16))
+        assert np.array_equal(ads_seq_cnt[1], chan_data[7][9::10] & 0x1f)
+        assert np.shares_memory(adc_data[0], buf) and np.shares_memory(dac_data[6], buf)
+        assert np.shares_memory(ads['A'], buf) and ads['A'].dtype == np.int16
+        assert error
+
+
+    # Legacy uint32 data from the shift-and-add deswizzle
+    legacy = ddr.deswizzle(buf.astype(np.uint32))
+    legacy[7][3::10] = 0xaa55
+    _, legacy_timestamp, _, legacy_ads, _, _ = ddr.data_to_names(legacy, bitfile_version=2)
+    assert np.array_equal(legacy_timestamp, timestamp)
+    assert np.array_equal(legacy_ads['B'], ads['B'])
+
+
+def test_signed16():
+    data = np.array([0, 1, 0x7fff, 0x8000, 0xffff], dtype=np.uint16)
+    expected = [0, 1, 0x7fff, -0x8000, -1]
+    signed = DDR3.signed16(data[::2])
+    assert signed.dtype == np.int16 and np.shares_memory(signed, data)
+    assert signed.tolist() == expected[::2]
+    out = np.zeros(5, dtype=np.int32)
+    assert DDR3.signed16(data, out=out) is out and out.tolist() == expected
+    assert DDR3.signed16(data.astype(np.uint32)).tolist() == expected  # Widened from wider data
+
+
+def make_frames(num_frames, step=40, skip_at=None):
+    """Return deswizzled TIMESTAMPS data with counting timestamps and valid read checks."""
+
+    chan_data = {chan: np.zeros(num_frames, dtype=np.uint16) for chan in range(8)}
+    timestamp = np.arange(num_frames // 5, dtype=np.uint64) * step + (1 << 40)
+    if skip_at is not None:
+        timestamp[skip_at:] += step
+    chan_data[7][1::5] = timestamp & 0xffff
+    chan_data[6][1::5] = (timestamp >> 16) & 0xffff
+    chan_data[7][2::5] = timestamp >> 32
+    for frame, mask, value in ((3, 0xffff, 0xaa55), (4, 0xffe0, 0x28b << 5),
+                               (8, 0xffff, 0x77bb), (9, 0xffe0, 0x28c << 5)):
+        chan_data[7][frame::10] = value | (~mask & 0x3)  # Bits outside the mask may hold anything
+    return chan_data
+
+
+@pytest.mark.parametrize('chunk', [1000, 128, 7])
+def test_validator(chunk):
+    data = make_frames(1000, skip_at=37)
+    data[7][513] = 0  # A read check at frame 10 * 51 + 3
+    validator = DDR3Validator()
+    problems = 0
+    for i in range(0, 1000, chunk):
+        problems += validator.check({chan: data[chan][i:i + chunk] for chan in data})
+    assert problems == 2
+    assert validator.timestamp_gaps == [(5 * 37, 80)]
+    assert validator.read_check_errors == [(513, 0)]
+    assert validator.statistics() == {'frames': 1000, 'timestamps': 200, 'timestamp_step': 40,
+                                      'timestamp_gaps': 1, 'read_check_errors': 1}
+
+
+def test_data_to_names_gap(ddr: DDR3):
+    *_, error = ddr.data_to_names(make_frames(1000), bitfile_version=2)
+    assert not error
+    *_, error = ddr.data_to_names(make_frames(1000, skip_at=100), bitfile_version=2)
+    assert error
+
+
+def test_channel_buffer(ddr: DDR3, backend: SimulatedBackend):
+    assert not ddr.data_arrays.allocated  # Nothing allocated for ADC readback
+    small = ChannelBuffer(8, 128, DDR3.DAC_CHANNEL_WORDS)  # One BLOCK_SIZE
+    for chan in range(8):
+        small[chan] = np.arange(128) + 1000 * chan
+    # The order written to the DDR before channels were views into one buffer
+    expected = np.zeros(8 * 128, dtype=np.uint16)
+    for i in range(8):
+        if i % 2 == 0:
+            expected[(7 - i - 1)::8] = small[i]
+        else:
+            expected[(7 - i + 1)::8] = small[i]
+    assert np.array_equal(small.buffer, expected)
+    assert small[-1][1] == 7001 and len(small) == 8
+    with pytest.raises(ValueError):
+        small[0] = np.arange(5)
+
+    ddr.data_arrays = small
+    ddr.write_channels()
+    assert backend.frontpanel.pipe_ins[ddr.endpoints['BLOCK_PIPE_IN'].address] == expected.tobytes()
+
+
+def test_stripe_channels(ddr: DDR3):
+    small = ChannelBuffer(8, 128, DDR3.DAC_CHANNEL_WORDS)
+    for chan in range(8):
+        small[chan] = np.arange(128) * chan
+    ddr.data_arrays = small
+    buf = ddr.stripe_channels()
+    assert isinstance(buf, memoryview) and np.shares_memory(np.asarray(buf), small.buffer)
+
+    ddr.data_arrays = [np.array(chan) for chan in small]
+    striped = ddr.stripe_channels()
+    assert striped == buf
+    assert np.shares_memory(np.asarray(ddr.stripe_channels()), np.asarray(striped))  # Buffer is reused
+
+
+def reference_sine(amplitude, frequency, offset, length):
+    """The wave make_sine_wave computed over every sample before it was tiled."""
+
+    t = np.arange(0, DDR3.UPDATE_PERIOD*length, DDR3.UPDATE_PERIOD)[:length]
+    return ((amplitude)*np.sin(t*frequency*2*np.pi) + offset).astype(np.uint16)
+
+
+def test_make_sine_wave():
+    ddr_seq, frequency = DDR3.make_sine_wave(0x1000, 10e3)
+    assert ddr_seq.dtype == np.uint16 and len(ddr_seq) == DDR3.SAMPLE_SIZE
+    expected = reference_sine(0x1000, frequency, 0x2000, DDR3.SAMPLE_SIZE)
+    # Tiling rounds differently from computing every sample, by at most 1 code
+    assert np.max(np.abs(ddr_seq.astype(int) - expected)) <= 1
+
+    channels = ChannelBuffer(8, DDR3.SAMPLE_SIZE, DDR3.DAC_CHANNEL_WORDS)
+    out, _ = DDR3.make_sine_wave(0x1000, 10e3, out=channels[6])
+    assert np.shares_memory(out, channels.buffer) and np.array_equal(channels[6], ddr_seq)
+    assert DDR3.make_sine_wave(0x3000, 10e3, offset=0x2000) == -1
+
+
+def test_make_chirp():
+    ddr_seq, frequencies, indices = DDR3.make_chirp(0x1000, [100e3, 50e3, 20e3], 4)
+    assert ddr_seq.dtype == np.uint16
+    assert indices[-1][1] == DDR3.SAMPLE_SIZE
+    for frequency, (start, stop) in zip(frequencies, indices):
+        expected = reference_sine(0x1000, frequency, 0x2000, stop - start)
+        assert np.max(np.abs(ddr_seq[start:stop].astype(int) - expected)) <= 1
+
+
+def test_upload_cache(ddr: DDR3, backend: SimulatedBackend):
+    device = backend.frontpanel
+    ddr.data_arrays = ChannelBuffer(8, 128, DDR3.DAC_CHANNEL_WORDS)
+    ddr.data_arrays[0] = np.arange(128)
+
+    def writes():
+        return device.calls['WriteToBlockPipeIn']
+
+    ddr.write_channels()
+    assert writes() == 1
+    assert ddr.write_channels() == (DDR3.BLOCK_SIZE, None)
+    ddr.repeat_setup()  # Only resets the DDR address pointers
+    ddr.write_channels()
+    assert writes() == 1
+
+    ddr.data_arrays[1] = 7
+    ddr.write_channels()
+    assert writes() == 2
+    ddr.write_channels(force=True)
+    assert writes() == 3
+
+    ddr.fpga.bitfile = 'top_level_module.bit'
+    ddr.fpga.init_device()  # Loading a bitfile loses the DDR data
+    ddr.write_channels()
+    assert writes() == 4
+    ddr.invalidate_upload()
+    ddr.write_channels()
+    assert writes() == 5
+
+
+def test_upload_cache_dry_run(ddr: DDR3, backend: SimulatedBackend, monkeypatch):
+    device = backend.frontpanel
+    ddr.data_arrays = ChannelBuffer(8, 128, DDR3.DAC_CHANNEL_WORDS)
+    ddr.data_arrays[0] = np.arange(128)
+    with ddr.fpga.dry_run():
+        ddr.write_channels()
+    # The data only reached the simulated device, the real one still needs it
+    ddr.write_channels()
+    assert device.calls['WriteToBlockPipeIn'] == 1
+
+    # A forced write is never compared, so the data is not hashed
+    def fail_hash(buf):
+        raise AssertionError('hashed a forced write')
+    monkeypatch.setattr(DDR3, 'upload_hash', staticmethod(fail_hash))
+    ddr.write_channels(force=True)
+    assert device.calls['WriteToBlockPipeIn'] == 2
+
+
+def test_read_adc_pipelined(ddr: DDR3, backend: SimulatedBackend):
+    address = ddr.endpoints['BLOCK_PIPE_OUT'].address
+    data = np.random.default_rng(2).integers(0, 256, size=DDR3.BLOCK_SIZE * 6, dtype=np.uint8)
+    backend.frontpanel.push_pipe_out(address, data.tobytes())
+    reads = [bytes(d) for d, _ in ddr.read_adc_pipelined(blk_multiples=2, num_reads=3, num_buffers=2)]
+    assert b''.join(reads) == data.tobytes()
+
+    # Closing early stops the reading thread
+    reads = ddr.read_adc_pipelined(blk_multiples=1)
+    next(reads)
+    reads.close()
+    count = backend.frontpanel.calls['ReadFromBlockPipeOut']
+    time.sleep(0.05)
+    assert backend.frontpanel.calls['ReadFromBlockPipeOut'] == count
+
+
+def test_save_data_pipelined(ddr: DDR3, backend: SimulatedBackend, tmp_path):
+    pytest.importorskip('h5py')
+    address = ddr.endpoints['BLOCK_PIPE_OUT'].address
+    data = np.random.default_rng(3).integers(0, 256, size=DDR3.BLOCK_SIZE * 8, dtype=np.uint8).tobytes()
+    saved = []
+    for pipelined in (False, True):
+        backend.frontpanel.push_pipe_out(address, data)
+        saved.append(ddr.save_data(str(tmp_path), 'data_{}.h5'.format(pipelined), num_repeats=4,
+                                   blk_multiples=2, pipelined=pipelined))
+    assert saved[0].shape == (8, 4 * 2 * DDR3.BLOCK_SIZE // 16)
+    assert np.array_equal(saved[0], saved[1])
+    assert np.array_equal(saved[0][0], ddr.deswizzle(np.frombuffer(data, dtype=np.uint8))[0])
+
+
+def frames_to_bytes(chan_data, data_version='TIMESTAMPS'):
+    """Return the bytes read from the DDR that deswizzle to chan_data."""
+
+    words = DDR3.CHANNEL_WORDS[data_version]
+    frames = np.zeros((len(chan_data[0]), len(words)), dtype='<u2')
+    for chan, word in enumerate(words):
+        frames[:, word] = chan_data[chan]
+    return frames.tobytes()
+
+
+def test_stream(ddr: DDR3, backend: SimulatedBackend):
+    ddr.fpga.bitfile_version = 2
+    count = ddr.endpoints['ADC_DATA_COUNT']
+    backend.frontpanel.set_wire_out(count.address, 300 << count.bit_index_low)
+    data = make_frames(1280, skip_at=37)  # 10 reads of one block
+    backend.frontpanel.push_pipe_out(ddr.endpoints['BLOCK_PIPE_OUT'].address, frames_to_bytes(data))
+
+    chunks = []
+    for chan_data, status in ddr.stream(blk_multiples=1, num_reads=10):
+        chunks.append(np.array(chan_data[7]))
+    assert np.array_equal(np.concatenate(chunks), data[7])
+    assert status['reads'] == 10 and status['bytes'] == 10 * DDR3.BLOCK_SIZE
+    assert status['mb_per_s'] > 0
+    assert status['adc_data_count'] == status['max_adc_data_count'] == 300
+    assert status['timestamp_gaps'] == 1 and status['read_check_errors'] == 0
+    assert status['dropped_samples'] == 5  # One timestamp of 5 frames skipped
+
+    # Stops on an event set by the sink
+    stop = threading.Event()
+    statuses = []
+
+    def sink(chan_data, status):
+        statuses.append(status)
+        if status['reads'] == 3:
+            stop.set()
+
+    status = ddr.stream_to(sink, blk_multiples=1, stop=stop)
+    assert len(statuses) == 3 and status['reads'] == 3
+
+
+def test_validator_needs_timestamps(ddr: DDR3, backend: SimulatedBackend, tmp_path):
+    ddr.data_version = 'ADC_NO_TIMESTAMPS'
+    with pytest.raises(ValueError):
+        ddr.save_data(str(tmp_path), 'data.h5', validator=DDR3Validator())
+    assert not os.path.exists(tmp_path / 'data.h5')
+    with pytest.raises(ValueError):
+        next(ddr.stream(blk_multiples=1, validator=DDR3Validator()))
+    assert backend.frontpanel.calls['ReadFromBlockPipeOut'] == 0
+
+
+class SingleThreadModel(SimulatedFrontPanel):
+    """Records the thread of each transaction and whether two ever overlapped."""
+
+    def __init__(self):
+        super().__init__(latency=0.002)
+        self.active = 0
+        self.overlapped = False
+        self.transactions = []
+
+    def _transaction(self, name):
+        self.active += 1
+        self.overlapped |= self.active > 1
+        self.transactions.append((name, threading.get_ident()))
+        super()._transaction(name)
+        self.active -= 1
+
+
+def test_stream_single_thread(endpoints):
+    device = SingleThreadModel()
+    f = FPGA(bitfile=None, endpoints={}, backend=SimulatedBackend(frontpanel=device))
+    f.init_device()
+    f.bitfile_version = 2
+    ddr = DDR3(f, endpoints=endpoints)
+    device.push_pipe_out(ddr.endpoints['BLOCK_PIPE_OUT'].address, frames_to_bytes(make_frames(1280)))
+    start = len(device.transactions)
+    for chan_data, status in ddr.stream(blk_multiples=1, num_reads=6, num_buffers=2):
+        time.sleep(0.005)  # Slower than the reads, so the thread waits for buffers
+
+    assert not device.overlapped
+    # set_adc_read, then each read followed by its FIFO level poll, all from the reading thread
+    streamed = device.transactions[start + 1:]
+    assert [name for name, _ in streamed] == ['ReadFromBlockPipeOut', 'UpdateWireOuts'] * 6
+    threads = {thread for _, thread in streamed}
+    assert len(threads) == 1 and threading.get_ident() not in threads
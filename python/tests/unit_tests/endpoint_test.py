@@ -8,6 +8,8 @@ January 2022
 
 import pytest
 import os
+import copy
+import pickle
 from random import randint
 
 from pyripherals.core import Endpoint
@@ -129,3 +131,164 @@ def test_update_endpoints_from_defines(test_params):
         for read_ep in read.values():
             assert read_ep == created[i]
             i += 1
+
+
+def test_update_endpoints_from_defines_cache(tmp_path, cache_dir, monkeypatch):
+    defines = tmp_path / 'cache_defines.v'
+    defines.write_text("`define CACHED_WIRE_IN 8'h01 // bit_width=32\n"
+                       "`define CACHED_BIT 3 // address=CACHED_WIRE_IN bit_width=2\n")
+    Endpoint.update_endpoints_from_defines(ep_defines_path=str(defines))
+    assert len(os.listdir(cache_dir)) == 1
+    expected = dict(Endpoint.endpoints_from_defines.pop('CACHED'))
+    assert expected['BIT'] == Endpoint(address=0x01, bit_index_low=3, bit_width=2, gen_bit=False, gen_address=False)
+
+    # An unchanged file must come from the cache without parsing
+    parse_defines = Endpoint.__dict__['_parse_defines']
+    def fail_parse(lines, ep_defines_path):
+        raise AssertionError('ep_defines parsed despite a valid cache')
+    monkeypatch.setattr(Endpoint, '_parse_defines', staticmethod(fail_parse))
+    Endpoint.update_endpoints_from_defines(ep_defines_path=str(defines))
+    assert Endpoint.endpoints_from_defines.pop('CACHED') == expected
+
+    # A changed file is parsed again
+    monkeypatch.setattr(Endpoint, '_parse_defines', parse_defines)
+    defines.write_text("`define CACHED_WIRE_IN 8'h01 // bit_width=32\n"
+                       "`define CACHED_BIT 5 // address=CACHED_WIRE_IN bit_width=2\n")
+    Endpoint.update_endpoints_from_defines(ep_defines_path=str(defines))
+    assert Endpoint.endpoints_from_defines.pop('CACHED')['BIT'].bit_index_low == 5
+
+
+def test_find_overlaps():
+    eps = {
+        'WIRE_IN': Endpoint(address=0x01, bit_index_low=None, bit_width=32, gen_bit=False, gen_address=False),
+        'GROUP': {
+            'LOW': Endpoint(address=0x01, bit_index_low=0, bit_width=4, gen_bit=False, gen_address=False),
+            'HIGH': Endpoint(address=0x01, bit_index_low=4, bit_width=4, gen_bit=False, gen_address=False),
+            'SPAN': Endpoint(address=0x01, bit_index_low=2, bit_width=4, gen_bit=False, gen_address=False),
+            'OTHER_ADDRESS': Endpoint(address=0x02, bit_index_low=2, bit_width=4, gen_bit=False, gen_address=False),
+            'SAME_WIRE_IN': Endpoint(address=0x01, bit_index_low=None, bit_width=32, gen_bit=False, gen_address=False),
+        },
+    }
+    overlaps = [(name, other_name) for name, other_name, ep in Endpoint.find_overlaps(eps)]
+    # Neighbouring bit ranges and whole-address Endpoints do not overlap bit Endpoints
+    assert overlaps == [('GROUP/SPAN', 'GROUP/LOW'), ('GROUP/SPAN', 'GROUP/HIGH'),
+                        ('GROUP/SAME_WIRE_IN', 'WIRE_IN')]
+
+    dup_eps = Endpoint.check_duplicates(eps, print_output=False)
+    assert dup_eps == {'0x1[0:4]': ['GROUP/LOW', 'GROUP/SPAN'],
+                       '0x1[4:8]': ['GROUP/HIGH', 'GROUP/SPAN'],
+                       '0x1[None:None]': ['WIRE_IN', 'GROUP/SAME_WIRE_IN']}
+
+
+def test_update_endpoints_from_defines_collision(tmp_path):
+    defines = tmp_path / 'collision_defines.v'
+    defines.write_text("`define COLLIDE_WIRE_IN 8'h01 // bit_width=32\n"
+                       "`define COLLIDE_A 0 // address=COLLIDE_WIRE_IN bit_width=4\n"
+                       "`define COLLIDE_B 3 // address=COLLIDE_WIRE_IN bit_width=2\n")
+    try:
+        assert Endpoint.update_endpoints_from_defines(ep_defines_path=str(defines), use_cache=False) == -1
+    finally:
+        Endpoint.endpoints_from_defines.pop('COLLIDE')
+
+
+def test_update_endpoints_from_defines_shared(tmp_path, capsys):
+    # Length constants and addresses shared by different groups are not collisions
+    defines = tmp_path / 'shared_defines.v'
+    defines.write_text("`define SHAREA_WIRE_IN 8'h01 // bit_width=32\n"
+                       "`define SHAREA_PERIOD 0 // address=SHAREA_WIRE_IN bit_width=4\n"
+                       "`define SHAREA_PERIOD_LEN 4 // address=SHAREA_WIRE_IN bit_width=4\n"
+                       "`define SHAREB_SEL 2 // address=SHAREA_WIRE_IN bit_width=4\n")
+    try:
+        eps = Endpoint.update_endpoints_from_defines(ep_defines_path=str(defines), use_cache=False)
+        assert eps['SHAREA']['PERIOD'].address == 0x01
+        assert 'Collision' not in capsys.readouterr().out
+    finally:
+        for group in ('SHAREA', 'SHAREB'):
+            Endpoint.endpoints_from_defines.pop(group)
+
+
+def test_update_endpoints_from_defines_len_endpoint(tmp_path):
+    # An Endpoint named _LEN that is not the length of another Endpoint is still checked
+    defines = tmp_path / 'len_defines.v'
+    defines.write_text("`define LENGRP_WIRE_IN 8'h01 // bit_width=32\n"
+                       "`define LENGRP_FIFO_LEN 0 // address=LENGRP_WIRE_IN bit_width=8\n"
+                       "`define LENGRP_MODE 4 // address=LENGRP_WIRE_IN bit_width=2\n")
+    try:
+        assert Endpoint.update_endpoints_from_defines(ep_defines_path=str(defines), use_cache=False) == -1
+    finally:
+        Endpoint.endpoints_from_defines.pop('LENGRP')
+    eps = {'FIFO_LEN': Endpoint(address=0x01, bit_index_low=0, bit_width=8, gen_bit=False, gen_address=False),
+           'MODE': Endpoint(address=0x01, bit_index_low=4, bit_width=2, gen_bit=False, gen_address=False)}
+    assert [(name, other) for name, other, ep in Endpoint.find_overlaps(eps)] == [('MODE', 'FIFO_LEN')]
+
+
+def test_example_defines_no_collisions(capsys):
+    ep_defines_path = os.path.join(os.path.dirname(__file__), '../../../examples/ep_defines.v')
+    eps = Endpoint.update_endpoints_from_defines(ep_defines_path=ep_defines_path, use_cache=False)
+    assert isinstance(eps, dict) and 'DDR3' in eps
+    assert 'Collision' not in capsys.readouterr().out
+
+
+def test_immutable_shared():
+    ep = Endpoint(address=0x01, bit_index_low=2, bit_width=3, gen_bit=True, gen_address=False)
+    assert Endpoint(address=0x01, bit_index_low=2, bit_width=3, gen_bit=True, gen_address=False) is ep
+    assert copy.deepcopy(ep) is ep
+    assert pickle.loads(pickle.dumps(ep)) is ep
+    with pytest.raises(AttributeError):
+        ep.address = 0x02
+
+    moved = ep.replace(bit_index_low=7)
+    assert (moved.bit_index_low, moved.bit_index_high) == (7, 10)
+    assert (ep.bit_index_low, ep.bit_index_high) == (2, 5)
+    with pytest.raises(TypeError):
+        ep.replace(bit_index_high=7)
+
+
+def test_advance_endpoints_leaves_copies(monkeypatch):
+    eps = {'BIT': Endpoint(address=0x01, bit_index_low=0, bit_width=4, gen_bit=True, gen_address=False),
+           'WIRE_IN': Endpoint(address=0x01, bit_index_low=None, bit_width=32, gen_bit=False, gen_address=True)}
+    monkeypatch.setitem(Endpoint.endpoints_from_defines, 'SHARED', eps)
+
+    first = Endpoint.get_chip_endpoints('SHARED')
+    assert first == eps and first is not eps
+    Endpoint.advance_endpoints(eps)
+    assert first['BIT'].bit_index_low == 0 and first['WIRE_IN'].address == 0x01
+    assert eps['BIT'].bit_index_low == 4 and eps['WIRE_IN'].address == 0x02
+
+
+def advance_one(ep):
+    """Advance an Endpoint by one instance with the incremental rule."""
+
+    address, bit_index_low = ep.address, ep.bit_index_low
+    if ep.gen_bit:
+        bit_index_low += ep.bit_width
+        if bit_index_low > Endpoint.MAX_WIDTH:
+            address += ep.addr_step
+            bit_index_low %= Endpoint.MAX_WIDTH
+        if bit_index_low + ep.bit_width > Endpoint.MAX_WIDTH:
+            address += ep.addr_step
+            bit_index_low = 0
+    if ep.gen_address:
+        address += ep.addr_step
+    return ep.replace(address=address, bit_index_low=bit_index_low)
+
+
+@pytest.mark.parametrize('address, bit_index_low, bit_width, gen_bit, gen_address', test_params[:50] + [
+    (0x10, 30, 4, True, False), (0x10, 5, 0, True, True), (0x10, 0, 40, True, False), (0x10, 33, 0, True, False)])
+def test_for_instance(address, bit_index_low, bit_width, gen_bit, gen_address):
+    group = {'EP': Endpoint(address=address, bit_index_low=bit_index_low, bit_width=bit_width,
+                            gen_bit=gen_bit, gen_address=gen_address, addr_step=2)}
+    expected = [group]
+    for _ in range(99):
+        expected.append({'EP': advance_one(expected[-1]['EP'])})
+
+    assert [Endpoint.for_instance(group, k) for k in range(100)] == expected
+    assert Endpoint.for_instances(group, 100) == expected
+    assert Endpoint.advance_endpoints(dict(group), 99) == expected[-1]
+
+
+def test_mask_shift():
+    ep = Endpoint(address=0x01, bit_index_low=4, bit_width=3, gen_bit=False, gen_address=False)
+    assert (ep.mask, ep.shift) == (0b111_0000, 4)
+    wire = Endpoint(address=0x01, bit_index_low=None, bit_width=32, gen_bit=False, gen_address=False)
+    assert (wire.mask, wire.shift) == ((1 << Endpoint.MAX_WIDTH) - 1, 0)
@@ -65,6 +65,62 @@ def test_read_trig(configured_fpga: FPGA, test_endpoints: dict[str, Endpoint]):
     for i in range(3):
         assert configured_fpga.read_trig(test_endpoints['TO'])
 
+def test_handle(configured_fpga: FPGA, test_endpoints: dict[str, Endpoint]):
+    looped_wi = test_endpoints['LOOPED_WI']
+    handle = configured_fpga.handle(Endpoint(address=looped_wi.address, bit_index_low=8, bit_width=8,
+                                             gen_bit=False, gen_address=False))
+    configured_fpga.set_wire(looped_wi.address, 0x0000_0000)
+    handle.set(0xA5)
+    assert configured_fpga.read_wire(test_endpoints['LOOPED_WO'].address) == 0x0000_A500
+    handle.clear()
+    assert configured_fpga.read_wire(test_endpoints['LOOPED_WO'].address) == 0x0000_0000
+    handle.set()
+    assert configured_fpga.read_wire(test_endpoints['LOOPED_WO'].address) == 0x0000_FF00
+
+    configured_fpga.handle(test_endpoints['TI']).pulse()
+    assert configured_fpga.read_wire(test_endpoints['TI_CONFIRM'].address) == 1
+    assert configured_fpga.handle(test_endpoints['TO']).read()
+
+def test_batch(configured_fpga: FPGA, test_endpoints: dict[str, Endpoint]):
+    address = test_endpoints['LOOPED_WI'].address
+    configured_fpga.set_wire(address, 0x0000_0000)
+    with configured_fpga.batch():
+        configured_fpga.set_wire_bit(address, 0)
+        configured_fpga.set_wire(address, 0xAB00, 0xFF00)
+        # Reads inside the block see the writes made before them
+        assert configured_fpga.read_wire(test_endpoints['LOOPED_WO'].address) == 0xAB01
+        configured_fpga.clear_wire_bit(address, 0)
+        configured_fpga.set_wire_bit(address, 31)
+    assert configured_fpga.read_wire(test_endpoints['LOOPED_WO'].address) == 0x8000_AB00
+
+def test_snapshot(configured_fpga: FPGA, test_endpoints: dict[str, Endpoint]):
+    configured_fpga.set_wire(test_endpoints['LOOPED_WI'].address, 0x1234)
+    with configured_fpga.snapshot():
+        assert configured_fpga.read_wire(test_endpoints['LOOPED_WO'].address) == 0x1234
+        assert configured_fpga.read_wire(test_endpoints['STATIC_READ_WO'].address) == 123456789
+        # The snapshot keeps the values from the first read
+        configured_fpga.set_wire(test_endpoints['LOOPED_WI'].address, 0x5678)
+        assert configured_fpga.read_wire(test_endpoints['LOOPED_WO'].address) == 0x1234
+        assert configured_fpga.read_trig(test_endpoints['TO'])
+    assert configured_fpga.read_wire(test_endpoints['LOOPED_WO'].address) == 0x5678
+
+def test_shadow_wire_ins(configured_fpga: FPGA, test_endpoints: dict[str, Endpoint]):
+    address = test_endpoints['LOOPED_WI'].address
+    configured_fpga.set_wire(address, 0x00FF)
+    # Change the WireIn behind the FPGA object's back, a repeated write is skipped until resync
+    configured_fpga.xem.SetWireInValue(address, 0xFF00)
+    configured_fpga.xem.UpdateWireIns()
+    configured_fpga.set_wire(address, 0x00FF)
+    assert configured_fpga.read_wire(test_endpoints['LOOPED_WO'].address) == 0xFF00
+    configured_fpga.set_wire(address, 0x00FF, force=True)
+    assert configured_fpga.read_wire(test_endpoints['LOOPED_WO'].address) == 0x00FF
+
+    configured_fpga.xem.SetWireInValue(address, 0xFF00)
+    configured_fpga.xem.UpdateWireIns()
+    configured_fpga.resync()
+    configured_fpga.set_wire(address, 0x00FF)
+    assert configured_fpga.read_wire(test_endpoints['LOOPED_WO'].address) == 0x00FF
+
 # Skipping some below
 
 
@@ -0,0 +1,177 @@
+"""Unit test for the FrontPanel call instrumentation, using the simulated backend.
+
+Runs without an FPGA.
+"""
+
+import json
+import os
+import pytest
+
+from pyripherals.core import FPGA, Endpoint
+from pyripherals.simulator import SimulatedBackend, SimulatedFrontPanel
+from pyripherals.instrumentation import Instrumentation, InstrumentedFrontPanel, CostModel, histogram_bucket, bucket_label
+from pyripherals.peripherals.AD7961 import AD7961
+from pyripherals.peripherals.I2CController import I2CController
+from pyripherals.peripherals.AD5453 import AD5453
+
+pytestmark = [pytest.mark.usable, pytest.mark.no_fpga]
+
+
+# Fixtures
+@pytest.fixture()
+def backend() -> SimulatedBackend:
+    return SimulatedBackend()
+
+
+@pytest.fixture()
+def fpga(backend) -> FPGA:
+    f = FPGA(bitfile=None, endpoints={}, backend=backend)
+    assert f.init_device()
+    return f
+
+
+# Tests
+def test_histogram_bucket():
+    assert histogram_bucket(0.0) == 0
+    assert histogram_bucket(1.5e-6) == 0
+    assert histogram_bucket(5e-6) == 2
+    assert bucket_label(2) == '4-8us'
+
+
+def test_enable_disable(fpga: FPGA, backend: SimulatedBackend):
+    stats = fpga.enable_instrumentation()
+    assert isinstance(fpga.xem, InstrumentedFrontPanel)
+    assert fpga.xem.NoError == 0
+    fpga.set_wire(0x01, 0x12)
+    assert fpga.disable_instrumentation() is stats
+    assert fpga.xem is backend.frontpanel  # No wrapper left when disabled
+    fpga.set_wire(0x02, 0x34)
+
+    report = stats.report()
+    assert report['apis']['UpdateWireIns']['count'] == 1
+    assert sum(report['apis']['UpdateWireIns']['histogram'].values()) == 1
+    assert report['callers'][__name__ + '.test_enable_disable']['SetWireInValue']['count'] == 1
+
+
+def test_enable_before_init(backend: SimulatedBackend):
+    f = FPGA(bitfile=None, endpoints={}, backend=backend)
+    stats = f.enable_instrumentation(attribute_callers=False)
+    f.init_device()
+    report = stats.report()
+    assert report['apis']['OpenBySerial']['count'] == 1
+    assert report['callers'] == {}
+
+
+def test_bytes(fpga: FPGA, backend: SimulatedBackend):
+    stats = fpga.enable_instrumentation()
+    fpga.read_pipe_out(0xA0, 64)
+    fpga.xem.WriteToBlockPipeIn(epAddr=0x80, blockSize=16, data=bytearray(32))
+    regs = backend.okTRegisterEntries(3)
+    fpga.xem.WriteRegisters(regs)
+    apis = json.loads(stats.to_json())['apis']
+    assert apis['ReadFromPipeOut']['bytes'] == 64
+    assert apis['WriteToBlockPipeIn']['bytes'] == 32
+    assert apis['WriteRegisters']['bytes'] == 12
+
+
+def test_peripheral_caller(fpga: FPGA):
+    endpoints = {
+        'FIFO_FULL': Endpoint(address=0x60, bit_index_low=0, bit_width=1, gen_bit=True, gen_address=False),
+        'FIFO_HALFFULL': Endpoint(address=0x60, bit_index_low=1, bit_width=1, gen_bit=True, gen_address=False),
+        'FIFO_EMPTY': Endpoint(address=0x60, bit_index_low=2, bit_width=1, gen_bit=True, gen_address=False),
+        'PLL_LOCKED': Endpoint(address=0x22, bit_index_low=0, bit_width=1, gen_bit=True, gen_address=False),
+    }
+    chip = AD7961.create_chips(fpga, 1, endpoints)[0]
+    stats = fpga.enable_instrumentation()
+    chip.get_status()
+    callers = stats.report()['callers']
+    # Calls are attributed to the innermost peripheral method
+    assert sorted(callers) == ['AD7961.get_fifo_status', 'AD7961.get_pll_status']
+    assert callers['AD7961.get_pll_status']['UpdateWireOuts']['count'] == 1
+    assert callers['AD7961.get_fifo_status']['UpdateTriggerOuts']['count'] == 1
+
+
+class BatchDriver:
+    """Stands in for a peripheral that sends its WireIn writes with FPGA.batch."""
+
+    def __init__(self, fpga):
+        self.fpga = fpga
+
+    def configure(self):
+        with self.fpga.batch():
+            self.fpga.set_wire_bit(0x01, 0)
+            self.fpga.set_wire_bit(0x02, 1)
+
+
+def test_batch_caller(fpga: FPGA):
+    stats = fpga.enable_instrumentation()
+    BatchDriver(fpga).configure()
+    callers = stats.report()['callers']
+    # The UpdateWireIns sent when the block exits belongs to the method, not contextlib
+    assert list(callers) == ['BatchDriver.configure']
+    assert callers['BatchDriver.configure']['UpdateWireIns']['count'] == 1
+
+
+class I2CModel(SimulatedFrontPanel):
+    """Finishes each I2C transaction as soon as it starts."""
+
+    def trigger_in_activated(self, address, bit):
+        if (address, bit) == (0x41, 1):  # START
+            self.activate_trigger_out(0x61, 0)  # DONE
+
+
+def test_dry_run(fpga: FPGA, backend: SimulatedBackend):
+    endpoints = {
+        'IN': Endpoint(address=0x02, bit_index_low=0, bit_width=8, gen_bit=False, gen_address=False),
+        'OUT': Endpoint(address=0x22, bit_index_low=0, bit_width=8, gen_bit=False, gen_address=False),
+        'MEMSTART': Endpoint(address=0x41, bit_index_low=0, bit_width=1, gen_bit=False, gen_address=False),
+        'START': Endpoint(address=0x41, bit_index_low=1, bit_width=1, gen_bit=False, gen_address=False),
+        'MEMWRITE': Endpoint(address=0x41, bit_index_low=2, bit_width=1, gen_bit=False, gen_address=False),
+        'MEMREAD': Endpoint(address=0x41, bit_index_low=3, bit_width=1, gen_bit=False, gen_address=False),
+        'DONE': Endpoint(address=0x61, bit_index_low=0, bit_width=1, gen_bit=False, gen_address=False),
+    }
+    i2c = I2CController(fpga=fpga, addr_pins=0, endpoints=endpoints)
+    fpga.set_wire(0x02, 0x55)
+    calls = backend.frontpanel.calls.copy()
+    model = CostModel(latency=1e-3, bandwidth=1e6)
+    with fpga.dry_run(cost_model=model, frontpanel=I2CModel()) as estimate:
+        assert i2c.i2c_read_long(0xA0, [0x00], 2) == [0, 0]
+    assert backend.frontpanel.calls == calls  # Nothing sent to the device
+    assert fpga.xem is backend.frontpanel and fpga.instrumentation is None
+
+    report = estimate.report()
+    # Preamble of 4 + 3 bytes, each with UpdateWireIns and ActivateTriggerIn, then 2 bytes read
+    # with UpdateWireOuts and ActivateTriggerIn, 3 other triggers and 1 UpdateTriggerOuts
+    assert report['apis']['UpdateWireIns']['count'] == 7
+    assert report['callers']['I2CController._read_buffer']['UpdateWireOuts']['count'] == 2
+    assert report['total']['transactions'] == 7 * 2 + 2 * 2 + 3 + 1
+    assert report['total']['seconds'] == pytest.approx(report['total']['transactions'] * 1e-3)
+
+    # Never initialized
+    f = FPGA(bitfile=None, endpoints={})
+    with f.dry_run() as estimate:
+        f.set_wire(0x00, 1)
+    assert estimate.report()['total']['transactions'] == 1
+    assert not hasattr(f, 'xem')
+
+
+def test_dry_run_peripherals():
+    ep_defines_path = os.path.join(os.path.dirname(__file__), '../../../examples/ep_defines.v')
+    Endpoint.update_endpoints_from_defines(ep_defines_path)
+    endpoints = Endpoint.get_chip_endpoints('AD5453')
+
+    def real_write_calls(dry_run):
+        f = FPGA(bitfile=None, endpoints={}, backend=SimulatedBackend())
+        f.init_device()
+        dac = AD5453(f, endpoints=endpoints)
+        dac.set_data_mux('DDR')
+        if dry_run:
+            with f.dry_run(peripherals=[dac]):
+                dac.write(0x1000)
+            assert not f.dry_running
+        stats = f.enable_instrumentation(Instrumentation(keep_calls=True))
+        dac.write(0x1000)
+        return [(call.api, call.args) for call in stats.calls]
+
+    # The mux selection made in the dry run is still sent to the device
+    assert real_write_calls(dry_run=True) == real_write_calls(dry_run=False)
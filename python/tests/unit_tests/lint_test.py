@@ -0,0 +1,96 @@
+"""Unit test for the FrontPanel call linter.
+
+Runs without an FPGA.
+"""
+
+import pytest
+
+from pyripherals.core import FPGA
+from pyripherals.simulator import SimulatedBackend
+from pyripherals.instrumentation import Instrumentation, CallRecord
+from pyripherals.lint import lint, rank_call_sites
+
+pytestmark = [pytest.mark.usable, pytest.mark.no_fpga]
+
+
+def call(api, *args, result=0, caller='Chip.method'):
+    return CallRecord(api, args, {}, result, 0.0, caller)
+
+
+def rules(calls):
+    return [(finding.index, finding.rule) for finding in lint(calls)]
+
+
+# Tests
+def test_wire_ins():
+    calls = [
+        call('SetWireInValue', 0x01, 0x0F, 0xFF),
+        call('UpdateWireIns'),
+        call('SetWireInValue', 0x01, 0x0F, 0x0F),  # Already set
+        call('UpdateWireIns'),                     # Nothing changed
+        call('SetWireInValue', 0x02, 0x01, 0x01),
+        call('UpdateWireIns'),                     # Could go with the first one
+        call('SetWireInValue', 0x03, 0x01, 0x01),
+        call('UpdateWireIns'),                     # And so could this
+        call('SetWireInValue', 0x03, 0x00, 0x01),
+        call('UpdateWireIns'),                     # A pulse, so not mergeable
+        call('ActivateTriggerIn', 0x40, 0),
+        call('SetWireInValue', 0x04, 0x01, 0x01),
+        call('UpdateWireIns'),
+    ]
+    assert rules(calls) == [(2, 'redundant-set-wire-in'), (3, 'redundant-update-wire-ins'),
+                            (5, 'mergeable-update-wire-ins'), (7, 'mergeable-update-wire-ins')]
+
+
+def test_wire_outs():
+    calls = [
+        call('UpdateWireOuts'),
+        call('GetWireOutValue', 0x20, result=1),
+        call('UpdateWireOuts'),                    # No trigger since the last update
+        call('GetWireOutValue', 0x20, result=1),
+        call('UpdateWireOuts'),                    # Polling, the value changed
+        call('GetWireOutValue', 0x20, result=2),
+        call('ActivateTriggerIn', 0x40, 0),
+        call('UpdateWireOuts'),
+    ]
+    assert rules(calls) == [(2, 'repeated-wire-outs')]
+
+
+def test_wb_address_and_registers():
+    calls = [
+        call('SetWireInValue', 0x05, 0x80000011, 0xFFFFFFFF, caller='ADS8686.wb_send_cmd'),
+        call('UpdateWireIns', caller='ADS8686.wb_send_cmd'),
+        call('ActivateTriggerIn', 0x42, 0, caller='ADS8686.wb_send_cmd'),
+        call('SetWireInValue', 0x05, 0x40000003, 0xFFFFFFFF, caller='ADS8686.wb_send_cmd'),
+        call('UpdateWireIns', caller='ADS8686.wb_send_cmd'),
+        call('ActivateTriggerIn', 0x42, 0, caller='ADS8686.wb_send_cmd'),
+        call('SetWireInValue', 0x05, 0x80000011, 0xFFFFFFFF, caller='ADS8686.wb_send_cmd'),
+        call('UpdateWireIns', caller='ADS8686.wb_send_cmd'),
+        call('ActivateTriggerIn', 0x42, 0, caller='ADS8686.wb_send_cmd'),  # Same address again
+        call('WriteRegister', 0x10, 5, caller='AD5453.write'),
+        call('ReadRegister', 0x10, result=5, caller='AD5453.modify'),  # Value is known
+        call('WriteRegister', 0x10, 7, caller='AD5453.modify'),
+        call('ReadRegister', 0x10, result=7, caller='AD5453.check'),   # Not followed by a write
+    ]
+    findings = lint(calls)
+    assert [(f.index, f.rule, f.wasted) for f in findings] == [(8, 'repeated-wb-address', 2),
+                                                               (10, 'known-register-read', 1)]
+    assert [(site['caller'], site['wasted']) for site in rank_call_sites(findings)] == [
+        ('ADS8686.wb_send_cmd', 2), ('AD5453.modify', 1)]
+
+
+def test_instrumentation_calls():
+    f = FPGA(bitfile=None, endpoints={}, backend=SimulatedBackend())
+    f.init_device()
+    stats = f.enable_instrumentation(Instrumentation(keep_calls=True))
+    f.set_wire(0x01, 0x01)
+    f.xem.SetWireInValue(0x02, 0x01)
+    f.xem.UpdateWireIns()
+    f.read_wire(0x20)
+    f.read_wire(0x20)
+    assert [call.api for call in stats.calls][:2] == ['SetWireInValue', 'UpdateWireIns']
+    findings = lint(stats.calls)
+    assert [f.rule for f in findings] == ['mergeable-update-wire-ins', 'repeated-wire-outs']
+    assert rank_call_sites(findings)[0] == {'caller': __name__ + '.test_instrumentation_calls', 'wasted': 2,
+                                            'findings': 2, 'rules': {'mergeable-update-wire-ins': 1,
+                                                                     'repeated-wire-outs': 1}}
@@ -83,3 +83,43 @@ def test_str(address, default, bit_index_high, bit_index_low, bit_width):
 def test_get_chip_registers(gotten_regs, test_regs):
     for expected in test_regs:
         assert expected in gotten_regs
+
+def test_register_cache(test_file, cache_dir, monkeypatch):
+    Register._compiled_workbooks.clear()
+    expected = Register.get_chip_registers(sheet='CHIP0', workbook_path=test_file, use_cache=False)
+    assert Register.get_chip_registers(sheet='CHIP0', workbook_path=test_file) == expected
+    assert len(os.listdir(cache_dir)) == 1
+
+    # A fresh process only has the on-disk cache, the workbook must not be parsed again
+    Register._compiled_workbooks.clear()
+    def fail_read(workbook_path):
+        raise AssertionError('workbook parsed despite a valid cache')
+    monkeypatch.setattr(Register, '_read_workbook', staticmethod(fail_read))
+    assert Register.get_chip_registers(sheet='CHIP0', workbook_path=test_file) == expected
+    assert Register.get_chip_registers(sheet=1, workbook_path=test_file) == Register.get_chip_registers(sheet='CHIP1', workbook_path=test_file)
+
+def test_register_cache_rebuild(tmp_path):
+    workbook = str(tmp_path / 'regs.xlsx')
+    columns = ['Name', 'Hex Address', 'Default Value', 'Bit Index (High)', 'Bit Index (Low)', 'Bit Width']
+    for value in ['0x1', '0x2']:
+        df = pd.DataFrame(data=[('REG', '0x10', value, 'None', 'None', 8)], columns=columns)
+        df.to_excel(workbook, sheet_name='CHIP', index=False)
+        # Make sure the second write never shares the first write's modification time
+        os.utime(workbook, ns=(0, int(value, 16) * 10**9))
+        assert Register.get_chip_registers(sheet='CHIP', workbook_path=workbook)['REG'].default == int(value, 16)
+
+
+def test_sheet_index_counts_all_sheets(tmp_path):
+    workbook = str(tmp_path / 'regs.xlsx')
+    columns = ['Name', 'Hex Address', 'Default Value', 'Bit Index (High)', 'Bit Index (Low)', 'Bit Width']
+    with pd.ExcelWriter(workbook) as writer:
+        pd.DataFrame(data=[('Notes on the chips',)], columns=['Notes']).to_excel(writer, sheet_name='README', index=False)
+        pd.DataFrame(data=[('REG', '0x10', '0x1', 'None', 'None', 8)], columns=columns).to_excel(
+            writer, sheet_name='CHIP', index=False)
+    with pytest.warns(UserWarning):
+        assert Register.get_chip_registers(sheet=1, workbook_path=workbook)['REG'].default == 1
+    # The leading sheet keeps its index but is not a register sheet
+    with pytest.raises(ValueError):
+        Register.get_chip_registers(sheet=0, workbook_path=workbook)
+    with pytest.raises(ValueError):
+        Register.get_chip_registers(sheet=2, workbook_path=workbook)
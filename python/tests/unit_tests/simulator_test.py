@@ -0,0 +1,141 @@
+"""Unit test for the simulated FrontPanel backend and the FPGA class running on it.
+
+Runs without an FPGA.
+"""
+
+import pytest
+import time
+
+from pyripherals.core import FPGA, Endpoint
+from pyripherals.simulator import SimulatedBackend, SimulatedFrontPanel
+from pyripherals.peripherals.AD7961 import AD7961
+
+pytestmark = [pytest.mark.usable, pytest.mark.no_fpga]
+
+
+# Fixtures
+@pytest.fixture()
+def backend() -> SimulatedBackend:
+    return SimulatedBackend()
+
+
+@pytest.fixture()
+def fpga(backend) -> FPGA:
+    f = FPGA(bitfile=None, endpoints={}, backend=backend)
+    assert f.init_device()
+    backend.frontpanel.calls.clear()
+    return f
+
+
+# Tests
+def test_wires(fpga: FPGA, backend: SimulatedBackend):
+    device = backend.frontpanel
+    fpga.xem.SetWireInValue(0x01, 0xAB)
+    assert device.get_wire_in(0x01) == 0   # Not sent until UpdateWireIns
+    fpga.set_wire(0x01, 0x1200, 0xFF00)
+    assert device.get_wire_in(0x01) == 0x12AB
+
+    device.set_wire_out(0x21, 0x5678)
+    assert fpga.xem.GetWireOutValue(0x21) == 0  # Not seen until UpdateWireOuts
+    assert fpga.read_wire(0x21) == 0x5678
+    assert fpga.xem.SetWireInValue(0x20, 0) == SimulatedFrontPanel.InvalidEndpoint
+
+
+def test_triggers(fpga: FPGA, backend: SimulatedBackend):
+    device = backend.frontpanel
+    fpga.send_trig(Endpoint(address=0x40, bit_index_low=3, bit_width=1, gen_bit=False, gen_address=False))
+    assert device.trigger_ins == [(0x40, 3)]
+
+    trigger_out = Endpoint(address=0x60, bit_index_low=2, bit_width=1, gen_bit=False, gen_address=False)
+    assert not fpga.read_trig(trigger_out)
+    device.activate_trigger_out(0x60, 2)
+    assert fpga.read_trig(trigger_out)
+    assert not fpga.read_trig(trigger_out)  # TriggerOuts clear once seen
+
+
+def test_pipes_and_registers(fpga: FPGA, backend: SimulatedBackend):
+    device = backend.frontpanel
+    device.push_pipe_out(0xA0, b'\x01\x02\x03')
+    buf, e = fpga.read_pipe_out(0xA0, 16)
+    assert e == 16 and buf == bytearray(b'\x01\x02\x03' + bytes(13))
+
+    assert fpga.xem.WriteToBlockPipeIn(epAddr=0x80, blockSize=16, data=bytearray(range(32))) == 32
+    assert device.pipe_ins[0x80] == bytearray(range(32))
+    assert fpga.xem.WriteToBlockPipeIn(epAddr=0x80, blockSize=24, data=bytearray(48)) == SimulatedFrontPanel.InvalidBlockSize
+
+    regs = backend.okTRegisterEntries(2)
+    regs[0].address, regs[0].data = 0x10, 7
+    regs[1].address, regs[1].data = 0x11, 8
+    fpga.xem.WriteRegisters(regs)
+    fpga.xem.WriteRegister(0x12, 9)
+    assert device.registers == {0x10: 7, 0x11: 8, 0x12: 9}
+
+
+def test_latency():
+    backend = SimulatedBackend(latency={'UpdateWireIns': 0.05})
+    f = FPGA(bitfile=None, endpoints={}, backend=backend)
+    f.init_device()
+    start = time.perf_counter()
+    f.set_wire(0x00, 1)
+    assert time.perf_counter() - start >= 0.05
+
+
+def test_batch(fpga: FPGA, backend: SimulatedBackend):
+    device = backend.frontpanel
+    with fpga.batch():
+        fpga.set_wire_bit(0x01, 0)
+        fpga.set_wire_bit(0x02, 1)
+        fpga.set_wire(0x03, 0xFF)
+        assert device.calls['UpdateWireIns'] == 0
+        # A trigger sends the writes before it
+        fpga.send_trig(Endpoint(address=0x40, bit_index_low=0, bit_width=1, gen_bit=False, gen_address=False))
+        assert device.calls['UpdateWireIns'] == 1
+        # Setting then clearing a bit is still a pulse
+        fpga.set_wire_bit(0x01, 4)
+        fpga.clear_wire_bit(0x01, 4)
+    assert device.calls['UpdateWireIns'] == 3
+    assert device.wire_ins[1:4] == [0x01, 0x02, 0xFF]
+
+
+def test_snapshot(fpga: FPGA, backend: SimulatedBackend):
+    device = backend.frontpanel
+    device.set_wire_out(0x20, 1)
+    device.set_wire_out(0x21, 2)
+    with fpga.snapshot():
+        assert fpga.read_wire(0x20) == 1
+        device.set_wire_out(0x20, 3)
+        assert (fpga.read_wire(0x20), fpga.read_wire(0x21)) == (1, 2)
+    assert device.calls['UpdateWireOuts'] == 1
+    assert fpga.read_wire(0x20) == 3
+
+
+def test_shadow(fpga: FPGA, backend: SimulatedBackend):
+    device = backend.frontpanel
+    fpga.set_wire(0x01, 0x0F, 0xFF)
+    fpga.set_wire(0x01, 0x0F, 0xFF)
+    fpga.set_wire_bit(0x01, 0)
+    assert device.calls['UpdateWireIns'] == 1
+    fpga.set_wire_bit(0x01, 0, force=True)
+    assert device.calls['UpdateWireIns'] == 2
+
+    # Loading a bitfile resets the device, so the shadow is forgotten
+    fpga.bitfile = 'top_level_module.bit'
+    fpga.init_device()
+    fpga.set_wire(0x01, 0x0F, 0xFF)
+    assert device.get_wire_in(0x01) == 0x0F
+
+
+def test_ad7961_get_status(fpga: FPGA, backend: SimulatedBackend):
+    device = backend.frontpanel
+    endpoints = {
+        'FIFO_FULL': Endpoint(address=0x60, bit_index_low=0, bit_width=1, gen_bit=True, gen_address=False),
+        'FIFO_HALFFULL': Endpoint(address=0x60, bit_index_low=1, bit_width=1, gen_bit=True, gen_address=False),
+        'FIFO_EMPTY': Endpoint(address=0x60, bit_index_low=2, bit_width=1, gen_bit=True, gen_address=False),
+        'PLL_LOCKED': Endpoint(address=0x22, bit_index_low=0, bit_width=1, gen_bit=True, gen_address=False),
+    }
+    chips = AD7961.create_chips(fpga, 4, endpoints)
+    device.set_wire_out(0x22, 0b0100)
+    with fpga.snapshot():
+        statuses = [chip.get_status() for chip in chips]
+    assert [status['pll_lock'] for status in statuses] == [0, 0, 1, 0]
+    assert device.calls['UpdateWireOuts'] == 1 and device.calls['UpdateTriggerOuts'] == 1
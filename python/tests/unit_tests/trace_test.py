@@ -0,0 +1,86 @@
+"""Unit test for recording and replaying FrontPanel traces, using the simulated backend.
+
+Runs without an FPGA.
+"""
+
+import pytest
+
+from pyripherals.core import FPGA
+from pyripherals.simulator import SimulatedBackend
+from pyripherals.trace import TraceReplayBackend, TraceMismatchError, read_trace
+
+pytestmark = [pytest.mark.usable, pytest.mark.no_fpga]
+
+
+def session(fpga):
+    """Driver code run first on the simulator, then on the replay."""
+
+    fpga.set_wire(0x01, 0x12)
+    wire_out = fpga.read_wire(0x21)
+    buf, _ = fpga.read_pipe_out(0xA0, 16)
+    regs = fpga.backend.okTRegisterEntries(2)
+    regs[0].address, regs[1].address = 0x10, 0x11
+    fpga.xem.ReadRegisters(regs)
+    return wire_out, bytes(buf), [reg.data for reg in regs]
+
+
+@pytest.fixture()
+def recorded(tmp_path):
+    """Record a session and return the path to the trace and the session results."""
+
+    backend = SimulatedBackend()
+    device = backend.frontpanel
+    path = str(tmp_path / 'session.trace')
+    f = FPGA(bitfile=None, endpoints={}, backend=backend)
+    f.record_trace(path)
+    f.init_device()
+    device.set_wire_out(0x21, 0xBEEF)
+    device.push_pipe_out(0xA0, bytes(range(16)))
+    device.registers.update({0x10: 5, 0x11: 6})
+    results = session(f)
+    f.disable_instrumentation().close()
+    return path, results
+
+
+# Tests
+def test_replay(recorded):
+    path, results = recorded
+    assert results == (0xBEEF, bytes(range(16)), [5, 6])
+    records = list(read_trace(path))
+    assert records[0].api == 'OpenBySerial'
+    assert records[-1].caller == __name__ + '.session'
+
+    backend = TraceReplayBackend(path, strict=True)
+    f = FPGA(bitfile=None, endpoints={}, backend=backend)
+    assert f.init_device()
+    assert f.device_info.productName == 'Simulated XEM7310'
+    assert session(f) == results
+    assert backend.frontpanel.remaining == 0
+
+
+def test_mismatch(recorded):
+    path, _ = recorded
+    f = FPGA(bitfile=None, endpoints={}, backend=TraceReplayBackend(path, strict=True))
+    f.init_device()
+    with pytest.raises(TraceMismatchError):
+        f.set_wire(0x02, 0x12)  # Recorded at address 0x01
+    with pytest.raises(TraceMismatchError):
+        f.xem.ActivateTriggerIn(0x40, 0)
+
+
+def test_no_payloads(tmp_path):
+    backend = SimulatedBackend()
+    path = str(tmp_path / 'small.trace')
+    f = FPGA(bitfile=None, endpoints={}, backend=backend)
+    f.init_device()
+    # Record part of a session, without the pipe data
+    f.record_trace(path, payloads=False)
+    backend.frontpanel.push_pipe_out(0xA0, b'\xff' * 1024)
+    f.read_pipe_out(0xA0, 1024)
+    f.disable_instrumentation().close()
+    assert [r.args for r in read_trace(path)] == [(0xA0, 1024)]
+
+    f = FPGA(bitfile=None, endpoints={}, backend=TraceReplayBackend(path))
+    f.init_device()  # Not recorded, answered by the replay
+    buf, e = f.read_pipe_out(0xA0, 1024)
+    assert e == 1024 and buf == bytearray(1024)